@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+compare the size and the encode/decode time of the payloads with nameko-serializer (json) and maiev-msgpack.
+
+the payloads are read from json files: a catalog sample (a dict with «catalog», like the samples of the
+upgrade_planer tests) is split in the payloads sent by the services, other files are used as is::
+
+    python benchmark_serializers.py ../../overseer/upgrade_planer/app/service/upgrade_planer/tests/samples/sample1.json
+    python benchmark_serializers.py --number 1000 payload.json
+
+"""
+import argparse
+import datetime
+import json
+import os
+import sys
+import timeit
+from collections import OrderedDict
+
+from nameko_serializer.serializer import datecompatible_dumps, datecompatible_loads
+
+from common.serialization import dumps, loads
+
+SERIALIZERS = OrderedDict((
+    ('nameko-serializer', (datecompatible_dumps, datecompatible_loads)),
+    ('maiev-msgpack', (dumps, loads)),
+))
+
+
+def get_payloads(path):
+    """
+    return the payloads to benchmark from the file
+    :rtype: list[tuple[str, object]]
+    """
+    name = os.path.basename(path)
+    with open(path) as f:
+        content = json.load(f)
+    if not isinstance(content, dict) or 'catalog' not in content:
+        return [(name, content)]
+    catalog = content['catalog']
+    service = catalog[0]['service']
+    payloads = [
+        ('%s:service_updated' % name, {
+            'service': service,
+            'diff': {'mode': {'from': service['mode'], 'to': service['mode']}},
+            'trace': {'id': '4f5c', 'hops': [['overseer', 1525356559.596]]},
+        }),
+        ('%s:new_version' % name, {
+            'service': service,
+            'new': catalog[0]['versions_list'][-1],
+            'date': datetime.datetime.now(),
+        }),
+        ('%s:catalog' % name, catalog),
+    ]
+    if content.get('phases'):
+        payloads.append(('%s:phases' % name, content['phases']))
+    return payloads
+
+
+def benchmark(payload, number):
+    """
+    :return: the size (bytes), encode and decode time (ms) of the payload with each serializer
+    :rtype: dict[str, dict]
+    """
+    result = OrderedDict()
+    for name, (encode, decode) in SERIALIZERS.items():
+        encoded = encode(payload)
+        result[name] = {
+            'size': len(encoded if isinstance(encoded, bytes) else encoded.encode('utf-8')),
+            'encode': timeit.timeit(lambda: encode(payload), number=number) / number * 1000,
+            'decode': timeit.timeit(lambda: decode(encoded), number=number) / number * 1000,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('files', nargs='+', help="the json files with the payloads")
+    parser.add_argument('--number', type=int, default=100, help="the number of encode/decode by payload")
+    args = parser.parse_args()
+
+    print("%-40s %-18s %10s %8s %11s %11s" % ('payload', 'serializer', 'size', 'ratio', 'encode(ms)', 'decode(ms)'))
+    for path in args.files:
+        for name, payload in get_payloads(path):
+            result = benchmark(payload, args.number)
+            reference = result['nameko-serializer']['size']
+            for serializer, stats in result.items():
+                print("%-40s %-18s %10d %7.0f%% %11.3f %11.3f" % (
+                    name[:40], serializer, stats['size'], stats['size'] * 100. / reference,
+                    stats['encode'], stats['decode'],
+                ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,7 +6,11 @@ import traceback
 
 from nameko.dependency_providers import Config
 from nameko.rpc import rpc
+from nameko.web.handlers import http
+from werkzeug.wrappers import Response
 
+from common.db.mongo import pool_stats
+from common.stats import StatsProvider, format_prometheus
 from common.utils import log_all
 
 logger = logging.getLogger(__name__)
@@ -18,6 +22,22 @@ class BaseWorkerService(object):
     """
 
     config = Config()  # type: dict
+    stats = StatsProvider()
+    """
+    :type: common.stats.EntrypointStats
+    """
+
+    @rpc
+    @log_all
+    def get_stats(self):
+        """
+        return the count of calls, errors and the latency histogram of each entrypoint of this service
+        since it started, and the usage of the mongodb connection pools
+        :return: the stats, as given by :meth:`common.stats.EntrypointStats.snapshot`, with «mongo» as given by
+            :func:`common.db.mongo.pool_stats`
+        :rtype: dict
+        """
+        return dict(self.stats.snapshot(), mongo=pool_stats())
 
     @rpc
     @log_all
@@ -85,3 +105,17 @@ class BaseWorkerService(object):
         except Exception as e:
             logger.exception('this is a fake debug message: %s' % e)
         raise Exception("fake exception unhandled triggered by hand")
+
+
+class PrometheusMetrics(object):
+    """
+    mixin which serve the stats of :class:`BaseWorkerService` in the prometheus text format on «/metrics».
+    it start the web server of nameko (on WEB_SERVER_ADDRESS): only for the services which want to be scraped.
+    """
+
+    @http('GET', '/metrics')
+    def metrics(self, request):
+        return Response(
+            format_prometheus(self.name, self.stats.snapshot()),
+            content_type='text/plain; version=0.0.4',
+        )
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+compile and evaluate the requirements of the services (the «require» of the catalog) against the
+variables provided by other services (their «provide»).
+"""
+
+import logging
+from functools import partial
+
+from booleano.exc import ScopeError
+from booleano.operations.variables import BooleanVariable, variable_symbol_table_builder
+from booleano.parser import Bind, Grammar, SymbolTable
+from booleano.parser.core import EvaluableParseManager
+
+logger = logging.getLogger(__name__)
+
+grammar = Grammar(**{
+    "belongs_to": "in",
+    "and": 'and',
+    "or": 'or',
+    "not": "not",
+})
+
+
+def check_exists(context, service_name):
+    """
+    check if service_name is included in context
+    :param dict context: the context
+    :return:
+    """
+    return service_name in context
+
+
+def split_path(path):
+    """
+    take a path (service:rpc:method) and return the path (service:rpc) and the method name)
+    :param str path:
+    :return: the tiple with path[str] and method[str]
+    """
+    splited = path.split(":")
+    return ":".join(splited[:-1]), splited[-1]
+
+
+def build_subtable(path, root_table):
+    """
+    build a chained subtable for the given path
+    :param path: the path to build
+    :param SymbolTable root_table: the root table in which we will add our table
+    :return:
+    """
+
+    part = path[0]
+    for st in root_table.subtables:
+        if st.global_name == part:
+            break
+    else:
+        st = SymbolTable(part, [])
+        root_table.add_subtable(st)
+
+    if path[1:]:
+        return build_subtable(path[1:], st)
+    else:
+        return st
+
+
+def complete_with_objects(root_table):
+    """
+    fill the given table and all subtalbse with objects checking if the context contains anything with this name.
+    :param SymbolTable root_table: the symboltable to update and add objects.
+    :return:
+    """
+    names = {o.global_name for o in root_table.objects}
+    for st in root_table.subtables:
+        if st.global_name not in names:
+            root_table.add_object(Bind(
+                st.global_name,
+                BooleanVariable(partial(check_exists, service_name=st.global_name))
+            ))
+            complete_with_objects(st)
+
+
+def build_symbol_table(catalog):
+    """
+    build the symbol table using all «provide» of all services/versions
+    :param list catalog: the catalog as given to the dependency_solver
+    :rtype: SymbolTable
+    """
+    res = SymbolTable("root", [])
+    for service in catalog:
+
+        for number, version in service['versions'].items():
+            for provide, value in version['provide'].items():  # type: (str, int)
+                path, object = split_path(provide)
+                subtable = build_subtable(path.split(':'), res)
+                variable_name = '%s:%s' % (path, object)
+                try:
+                    vartype = variable_symbol_table_builder.find_for_type(type(value))
+                    subtable.add_object(
+                        Bind(object, vartype(variable_name))
+                    )
+                except ScopeError:
+                    pass
+    complete_with_objects(res)
+    return res
+
+
+def build_provided(catalog, phase):
+    """
+    build the context of variables provided by the given phase
+    :param dict catalog: the services by name
+    :param dict phase: the version of each service
+    :return: the context to evaluate the requirements
+    """
+    res = {}
+    for name, number in phase.items():
+        res.update(catalog[name]['versions'][number]['provide'])
+        res.setdefault(name, number)
+    return res
+
+
+class PhaseChecker(object):
+    """
+    check if the phases of a catalog respect the requirements of all their services.
+    the catalog is compiled once, and the result for each phase is memoized.
+    """
+
+    def __init__(self, catalog, extra_constraints=tuple()):
+        """
+        :param list catalog: the catalog as given to the dependency_solver. only the versions
+            which will be checked are required.
+        :param list extra_constraints: constraints that must be respected by all phases
+        """
+        self.catalog = {service['name']: service for service in catalog}
+        self.anomalies = []
+        self.requirements = {}
+        self.checked = {}
+        parse_manager = EvaluableParseManager(build_symbol_table(catalog), grammar)
+        for service in catalog:
+            for number, version in service['versions'].items():
+                require = None
+                try:
+                    self.requirements[(service['name'], number)] = [
+                        parse_manager.parse(require) for require in version['require']
+                    ]
+                except ScopeError as e:
+                    self.anomalies.append({
+                        "expression": require,
+                        "service": service['name'],
+                        "version": number,
+                        "error": str(e)
+                    })
+        self.extra_constraints = [parse_manager.parse(constr) for constr in extra_constraints]
+
+    def failed(self, phase):
+        """
+        count the services of the phase which don't have their requirements met, like dependency_solver.explain.
+        the versions with an anomaly are ignored.
+
+        :param dict phase: the version of each service of the phase
+        :return: the number of failed checks. 0 for a valid phase
+        :rtype: int
+        """
+        key = frozenset(phase.items())
+        try:
+            return self.checked[key]
+        except KeyError:
+            pass
+        phase = {
+            name: number
+            for name, number in phase.items()
+            if (name, number) in self.requirements
+        }
+        provided = build_provided(self.catalog, phase)
+        failed = sum(
+            1
+            for name, number in phase.items()
+            if not self._respect(self.requirements[(name, number)], provided)
+        )
+        if not self._respect(self.extra_constraints, provided):
+            failed += 1
+        self.checked[key] = failed
+        return failed
+
+    def is_valid(self, phase):
+        """
+        :param dict phase: the version of each service of the phase
+        :return: True if all requirements of the phase are met
+        """
+        return self.failed(phase) == 0
+
+    def _respect(self, requirements, provided):
+        try:
+            return all(require(provided) for require in requirements)
+        except (KeyError, ScopeError):
+            # the required variable is not provided by this phase
+            return False
@@ -3,42 +3,223 @@
 import atexit
 import logging
 import os
+import re
 import shutil
 import subprocess
 import tempfile
+import threading
 import time
 
 import pymongo.errors
+import pymongo.monitoring
 from nameko.extensions import DependencyProvider
 from pymongo import MongoClient
 
 logger = logging.getLogger(__name__)
 
 MONGO_URIS_KEY = 'MONGO_URIS'
+MONGO_OPTIONS_KEY = 'MONGO_OPTIONS'
+"""
+the options given to the MongoClient (maxPoolSize, w, readPreference, serverSelectionTimeoutMS...).
+the options with a null value are ignored.
+"""
+
+
+class PoolStatsListener(pymongo.monitoring.ConnectionPoolListener):
+    """
+    count the connections of the pools of a client, to size the pool under load
+    """
+
+    def __init__(self):
+        self.stats = {
+            'connections': 0,  # currently opened
+            'checked_out': 0,  # currently in use
+            'max_checked_out': 0,
+            'checkouts': 0,
+            'checkout_failures': 0,
+            'pool_cleared': 0,
+        }
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        self.stats['pool_cleared'] += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        self.stats['connections'] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        self.stats['connections'] -= 1
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        self.stats['checkout_failures'] += 1
+
+    def connection_checked_out(self, event):
+        self.stats['checkouts'] += 1
+        self.stats['checked_out'] += 1
+        self.stats['max_checked_out'] = max(self.stats['max_checked_out'], self.stats['checked_out'])
+
+    def connection_checked_in(self, event):
+        self.stats['checked_out'] -= 1
+
+
+class SharedClients(object):
+    """
+    the MongoClient of the process, one by uri and options. each client is closed when the last
+    provider using it is stopped.
+    """
+
+    def __init__(self):
+        self.clients = {}  # (uri, options) => [client, listener, users]
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def get_key(uri, options):
+        return uri, tuple(sorted((k, v) for k, v in options.items() if v is not None))
+
+    def acquire(self, uri, options):
+        """
+        return the client for this uri and options, and create it if needed
+        :rtype: MongoClient
+        """
+        key = self.get_key(uri, options)
+        with self.lock:
+            shared = self.clients.get(key)
+            if shared is None:
+                listener = PoolStatsListener()
+                client = MongoClient(uri, event_listeners=[listener], **dict(key[1]))
+                shared = self.clients[key] = [client, listener, 0]
+            shared[2] += 1
+            return shared[0]
+
+    def release(self, uri, options):
+        """
+        release the client given by acquire. it is closed if it is not used anymore
+        """
+        key = self.get_key(uri, options)
+        with self.lock:
+            shared = self.clients.get(key)
+            if shared is None:
+                return
+            shared[2] -= 1
+            if shared[2] <= 0:
+                del self.clients[key]
+                shared[0].close()
+
+    def stats(self):
+        """
+        return the pool stats of each client::
+
+            - uri: maiev_mongodb
+              max_pool_size: 100
+              users: 2  # number of providers sharing the client
+              connections: 4
+              checked_out: 1
+              max_checked_out: 3
+              checkouts: 1542
+              checkout_failures: 0
+              pool_cleared: 0
+
+        :rtype: list[dict]
+        """
+        with self.lock:
+            return [
+                dict(
+                    listener.stats,
+                    uri=re.sub(r'://([^:@/]*):[^@/]*@', r'://\1:***@', uri),
+                    max_pool_size=client.options.pool_options.max_pool_size,
+                    users=users,
+                )
+                for (uri, _), (client, listener, users) in self.clients.items()
+            ]
+
+
+shared_clients = SharedClients()
+
+
+def pool_stats():
+    """
+    return the stats of the pools of all the mongodb clients of the process
+    :rtype: list[dict]
+    """
+    return shared_clients.stats()
+
+
+def ensure_ttl_index(collection, field, ttl, **kwargs):
+    """
+    create the ascending index on the field with the given expiration, or update the existing one.
+    the expiration of an existing index is changed with collMod, so a new ttl in the config is applied at the
+    next start instead of failing with IndexOptionsConflict.
+
+    :param pymongo.collection.Collection collection: the collection
+    :param str field: the date field of the index
+    :param int ttl: the expireAfterSeconds of the index. None to create an index without expiration (an existing
+        ttl index is then dropped and recreated)
+    :param kwargs: the other options of create_index
+    :return: the name of the index
+    """
+    for name, info in collection.index_information().items():
+        if dict(info['key']) != {field: 1}:
+            continue
+        current = info.get('expireAfterSeconds')
+        if current == ttl:
+            return name
+        if current is not None and ttl is not None:
+            logger.info("update the ttl of %s.%s from %s to %s", collection.name, name, current, ttl)
+            collection.database.command('collMod', collection.name, index={'name': name, 'expireAfterSeconds': ttl})
+            return name
+        logger.info("recreate the index %s.%s with the ttl %s", collection.name, name, ttl)
+        collection.drop_index(name)
+        break
+    if ttl is not None:
+        kwargs['expireAfterSeconds'] = ttl
+    return collection.create_index(field, **kwargs)
 
 
 class Mongo(DependencyProvider):
+    """
+    provide the database of the service. the MongoClient is shared with the other providers of the
+    process using the same uri and options.
+    """
+
     def __init__(self, db_name=None):
         self.db_name = db_name
         self.db = None
         self.mongo_uri = None
+        self.options = {}
 
     def setup(self):
         if self.db_name is None:
             self.db_name = self.container.service_cls.name
         self.mongo_uri = self.container.config.get(MONGO_URIS_KEY) or self.get_default_name()
+        self.options = self.container.config.get(MONGO_OPTIONS_KEY) or {}
 
     def get_default_name(self):
         return '%s_mongodb' % self.container.service_cls.name
 
     def start(self):
-        self.db = MongoClient(self.mongo_uri)[self.db_name]
+        self.db = shared_clients.acquire(self.mongo_uri, self.options)[self.db_name]
 
     def stop(self):
+        if self.db is not None:
+            shared_clients.release(self.mongo_uri, self.options)
         self.db = None
 
     def kill(self):
-        self.db = None
+        self.stop()
 
     def get_dependency(self, worker_ctx):
         return self.db
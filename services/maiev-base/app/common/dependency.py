@@ -1,6 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import logging
+import multiprocessing
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, TimeoutError, process
 
 import eventlet.greenpool
 from nameko.constants import MAX_WORKERS_CONFIG_KEY
@@ -8,6 +12,11 @@ from nameko.extensions import DependencyProvider
 
 logger = logging.getLogger(__name__)
 
+PROCESS_POOL_SIZE_CONFIG_KEY = 'process_pool_size'
+# the children of a forked process would inherit the eventlet hub (and the greenthreads/sockets) of the
+# monkey-patched service: they are started from a fresh interpreter instead
+PROCESS_POOL_START_METHOD = 'spawn'
+
 
 class PoolProvider(DependencyProvider):
 
@@ -29,3 +38,98 @@ class PoolProvider(DependencyProvider):
 
     def get_dependency(self, worker_ctx):
         return self.pool
+
+
+class ProcessPool(object):
+    """
+    run cpu bound functions in a pool of process. the caller wait for the result
+    without blocking the eventlet hub, so the service keep consuming events/heartbeat
+    while the computation run on another core.
+    """
+
+    def __init__(self, executor):
+        self.executor = executor
+
+    def run(self, func, *args, timeout=None, **kwargs):
+        """
+        execute func(*args, **kwargs) in a child process and return his result.
+
+        :param func: a picklable (module level) function
+        :param float timeout: max number of seconds to wait for the result. None wait forever
+        :raise concurrent.futures.TimeoutError: if the result is not available in time. the task is canceled
+            if it was not started yet. a running task can't be killed, it must respect his own deadline.
+        :return: the result of func
+        """
+        future = self.executor.submit(func, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+
+class SpawnProcessPoolExecutor(ProcessPoolExecutor):
+    """
+    a ProcessPoolExecutor which start his process with :data:`PROCESS_POOL_START_METHOD`.
+    python 3.6 has no ``mp_context`` argument, so the queues and the process are created here with the
+    right context. multiprocessing.Pool is not an option: his handler threads break once eventlet has
+    patched threading.
+    """
+
+    def __init__(self, max_workers=None):
+        super().__init__(max_workers)
+        self._context = multiprocessing.get_context(PROCESS_POOL_START_METHOD)
+        # the queues of the default (fork) context use semaphores which a spawned process can't open
+        self._call_queue = self._context.Queue(self._max_workers + process.EXTRA_QUEUED_CALLS)
+        self._call_queue._ignore_epipe = True
+        self._result_queue = self._context.SimpleQueue()
+
+    def _adjust_process_count(self):
+        for _ in range(len(self._processes), self._max_workers):
+            p = self._context.Process(
+                target=process._process_worker,
+                args=(self._call_queue, self._result_queue),
+            )
+            p.start()
+            self._processes[p.pid] = p
+
+
+def create_process_pool(size):
+    """
+    create an executor whose process are started with a fresh interpreter (see :data:`PROCESS_POOL_START_METHOD`)
+
+    :param int size: the number of process
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    if sys.version_info >= (3, 7):
+        return ProcessPoolExecutor(size, mp_context=multiprocessing.get_context(PROCESS_POOL_START_METHOD))
+    return SpawnProcessPoolExecutor(size)
+
+
+class ProcessPoolProvider(DependencyProvider):
+    """
+    provide a :class:`ProcessPool` shared by all workers of the container.
+    the number of process is taken from the config ``process_pool_size``, default to the number of cpu.
+    """
+
+    def __init__(self, size_config_key=PROCESS_POOL_SIZE_CONFIG_KEY):
+        self.size_config_key = size_config_key
+        self.executor = None
+        self.poolsize = None
+
+    def setup(self):
+        self.poolsize = self.container.config.get(self.size_config_key) or os.cpu_count()
+
+    def start(self):
+        self.executor = create_process_pool(self.poolsize)
+
+    def stop(self):
+        self.executor.shutdown(wait=True)
+
+    def kill(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def get_dependency(self, worker_ctx):
+        return ProcessPool(self.executor)
@@ -1,40 +1,174 @@
 # -*- coding: utf-8 -*-
+import copy
 import logging
+import threading
+import time
 
 from nameko.extensions import DependencyProvider
-from nameko.rpc import ReplyListener, ServiceProxy
+from nameko.rpc import MethodProxy, ReplyListener
+
+from common.utils import wait_replies
 
 logger = logging.getLogger(__name__)
 
 
+class ProxyCache(object):
+    """
+    the MethodProxy of the container, by service, method and options. they are built once (with their publisher)
+    and a shallow copy bound to the worker is given for each call.
+    """
+
+    def __init__(self, rpc_reply_listener):
+        self.rpc_reply_listener = rpc_reply_listener
+        self.proxies = {}
+        self.lock = threading.Lock()
+
+    def get_method(self, worker_ctx, service, method, options):
+        """
+        return the MethodProxy for the method of the service, bound to the worker
+        :param worker_ctx: the context of the worker making the call
+        :param str service: the name of the service
+        :param str method: the name of the method
+        :param dict options: the options of the proxy (serializer, publisher options...)
+        :rtype: nameko.rpc.MethodProxy
+        """
+        key = (service, method, tuple(sorted(options.items())))
+        proxy = self.proxies.get(key)
+        if proxy is None:
+            with self.lock:
+                proxy = self.proxies.get(key)
+                if proxy is None:
+                    proxy = self.proxies[key] = MethodProxy(
+                        worker_ctx, service, method, self.rpc_reply_listener, **dict(options)
+                    )
+        bound = copy.copy(proxy)
+        bound.worker_ctx = worker_ctx
+        return bound
+
+    def clear(self):
+        with self.lock:
+            self.proxies.clear()
+
+
+class GenericServiceProxy(object):
+    """
+    a ServiceProxy which take his MethodProxy from the cache of the container
+    """
+
+    def __init__(self, worker_ctx, service, cache, **options):
+        self.worker_ctx = worker_ctx
+        self.service_name = service
+        self.cache = cache
+        self.options = options
+
+    def __getattr__(self, name):
+        return self.cache.get_method(self.worker_ctx, self.service_name, name, self.options)
+
+
+class RpcBatch(object):
+    """
+    send many rpc at once: each call is sent with call_async without waiting for the previous ones.
+    the replies are waited at the end of the batch only if asked.
+
+        with self.monitorer_rpc.batch() as batch:
+            for resource in resources:
+                batch.get(resource['monitorer']).track(resource['identifier'])
+
+    """
+
+    def __init__(self, pool, wait=False):
+        """
+        :param GenericServiceProxyPool pool: the pool used to get the proxies
+        :param bool wait: wait for all the replies at the end of the batch and raise the first error.
+            if False, the calls are fire-and-forget
+        """
+        self.pool = pool
+        self.wait = wait
+        self.replies = []
+
+    def get(self, service, **options):
+        return _BatchServiceProxy(self, self.pool.get(service, **options))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None and self.wait:
+            self.results()
+
+    def results(self, timeout=None):
+        """
+        wait for all the replies
+        :param float timeout: the max number of seconds to wait for all the replies
+        :raise: the first error of the calls, once all the replies are received
+        :return: the results of the calls, in the order of the calls
+        """
+        results, errors = wait_replies(self.replies, None if timeout is None else time.time() + timeout)
+        for error in errors:
+            if error is not None:
+                raise error
+        return results
+
+
+class _BatchServiceProxy(object):
+
+    def __init__(self, batch, proxy):
+        self.batch = batch
+        self.proxy = proxy
+
+    def __getattr__(self, name):
+        method = getattr(self.proxy, name)
+
+        def call_async(*args, **kwargs):
+            reply = method.call_async(*args, **kwargs)
+            self.batch.replies.append(reply)
+            return reply
+        return call_async
+
+
 class GenericServiceProxyPool(object):
+    """
+    give the proxy of any service for a worker
+    """
 
-    def __init__(self, worker_ctx, rpc_reply_listener):
+    def __init__(self, worker_ctx, cache):
         self.worker_ctx = worker_ctx
-        self.proxy = {}
-        self.rpc_reply_listener = rpc_reply_listener
+        self.cache = cache
 
     def get(self, service, **options):
-        try:
-            res = self.proxy[service]
-        except KeyError:
+        """
+        :param str service: the name of the service
+        :param options: the options of the proxy
+        :rtype: GenericServiceProxy
+        """
+        return GenericServiceProxy(self.worker_ctx, service, self.cache, **options)
 
-            res = self.proxy[service] = ServiceProxy(
-                self.worker_ctx,
-                service,
-                self.rpc_reply_listener,
-                **options
-            )
-        return res
+    def batch(self, wait=False):
+        """
+        start a batch of call_async. see :class:`RpcBatch`
+        :rtype: RpcBatch
+        """
+        return RpcBatch(self, wait=wait)
 
 
 class GenericRpcProxy(DependencyProvider):
+    """
+    provide a proxy for any service, given by name at the call time. the MethodProxy are shared by all workers
+    of the container.
+    """
     rpc_reply_listener = ReplyListener()
 
     def __init__(self):
-        self.pool = None
+        self.cache = None
 
-    def get_dependency(self, worker_ctx):
+    def setup(self):
+        self.cache = ProxyCache(self.rpc_reply_listener)
+
+    def stop(self):
+        self.cache.clear()
 
-        self.pool = pool = GenericServiceProxyPool(worker_ctx, self.rpc_reply_listener)
-        return pool
+    def kill(self):
+        self.cache.clear()
+
+    def get_dependency(self, worker_ctx):
+        return GenericServiceProxyPool(worker_ctx, self.cache)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+a compact binary serializer for the rpc and events between the maiev services, based on msgpack.
+
+it support the same types as nameko-serializer (datetime and date, namedtuple are sent as list) and the
+:class:`common.utils.ImageVersion`. it is registered by the config of nameko::
+
+    SERIALIZERS:
+      maiev-msgpack:
+        encoder: common.serialization.dumps
+        decoder: common.serialization.loads
+        content_type: application/x-maiev-msgpack
+        content_encoding: binary
+
+the naive datetimes are considered in the local timezone, and all the datetimes are received in UTC, like
+with nameko-serializer.
+"""
+import datetime
+import logging
+
+import msgpack
+
+from common.utils import ImageVersion
+
+logger = logging.getLogger(__name__)
+
+SERIALIZER_NAME = 'maiev-msgpack'
+CONTENT_TYPE = 'application/x-maiev-msgpack'
+
+# the msgpack ext types. the datetimes use the timestamp type of msgpack (-1)
+EXT_IMAGE_VERSION = 1
+EXT_DATE = 2
+
+
+def _default(obj):
+    if isinstance(obj, datetime.datetime):
+        if obj.tzinfo is None:
+            obj = obj.astimezone()  # in the local timezone
+        return msgpack.Timestamp.from_datetime(obj)
+    elif isinstance(obj, datetime.date):
+        return msgpack.ExtType(EXT_DATE, obj.isoformat().encode('ascii'))
+    elif isinstance(obj, ImageVersion):
+        return msgpack.ExtType(EXT_IMAGE_VERSION, dumps(obj.serialize()))
+    raise TypeError("can't serialize %r" % (obj,))
+
+
+def _ext_hook(code, data):
+    if code == EXT_IMAGE_VERSION:
+        return ImageVersion.deserialize(loads(data))
+    elif code == EXT_DATE:
+        return datetime.datetime.strptime(data.decode('ascii'), '%Y-%m-%d').date()
+    return msgpack.ExtType(code, data)
+
+
+def dumps(obj):
+    """
+    serialize the object in msgpack
+
+    >>> loads(dumps({'date': datetime.datetime(2018, 1, 1, tzinfo=datetime.timezone.utc), 'list': (1, 2)}))
+    {'date': datetime.datetime(2018, 1, 1, 0, 0, tzinfo=datetime.timezone.utc), 'list': [1, 2]}
+
+    :rtype: bytes
+    """
+    return msgpack.packb(obj, default=_default, use_bin_type=True)
+
+
+def loads(data):
+    """
+    unserialize the data given by :func:`dumps`
+    """
+    return msgpack.unpackb(data, ext_hook=_ext_hook, timestamp=3, raw=False, strict_map_key=False)
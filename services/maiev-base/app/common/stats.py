@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+in memory statistics of the entrypoints of a service: count of calls, errors and an histogram of the latencies.
+
+the stats are collected by :class:`StatsProvider` for each worker (rpc, events, timers, once, http) and
+given by the rpc «get_stats» of :class:`common.base.BaseWorkerService`. they can be exported in the prometheus
+text format with :func:`format_prometheus`.
+"""
+import bisect
+import logging
+import time
+
+from nameko.extensions import DependencyProvider
+
+logger = logging.getLogger(__name__)
+
+# the upper bounds (seconds) of the latency buckets. the last bucket take all the slower calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+ENTRYPOINT_TYPES = {
+    'Rpc': 'rpc',
+    'EventHandler': 'event',
+    'Timer': 'timer',
+    'Once': 'once',
+    'HttpRequestHandler': 'http',
+}
+
+
+class EntrypointStats(object):
+    """
+    the stats of all the entrypoints of a service
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.entrypoints = {}
+        self.started = time.time()
+
+    def record(self, name, type_, duration, error=False):
+        """
+        record a call of an entrypoint
+        :param str name: the name of the entrypoint (the method)
+        :param str type_: the type of entrypoint (rpc, event, timer...)
+        :param float duration: the duration of the call in seconds
+        :param bool error: True if the call raised an exception
+        """
+        stats = self.entrypoints.get(name)
+        if stats is None:
+            stats = self.entrypoints[name] = {
+                'type': type_,
+                'calls': 0,
+                'errors': 0,
+                'time': 0.,
+                'max': 0.,
+                'buckets': [0] * (len(self.buckets) + 1),
+            }
+        stats['calls'] += 1
+        stats['errors'] += bool(error)
+        stats['time'] += duration
+        stats['max'] = max(stats['max'], duration)
+        stats['buckets'][bisect.bisect_left(self.buckets, duration)] += 1
+
+    def snapshot(self):
+        """
+        return a copy of the current stats::
+
+            uptime: 3600.1
+            buckets: [0.005, 0.01, ...]  # the upper bounds of the buckets
+            entrypoints:
+                $name:
+                    type: rpc
+                    calls: 12
+                    errors: 1
+                    time: 0.51  # total time of the calls
+                    max: 0.2
+                    buckets: [3, 6, ...]  # number of calls in each bucket, plus the calls slower than the last
+
+        :rtype: dict
+        """
+        return {
+            'uptime': time.time() - self.started,
+            'buckets': list(self.buckets),
+            'entrypoints': {
+                name: dict(stats, buckets=list(stats['buckets']))
+                for name, stats in self.entrypoints.items()
+            },
+        }
+
+
+def format_prometheus(service_name, snapshot):
+    """
+    format the snapshot of the stats in the prometheus text format
+
+    :param str service_name: the name of the service, added as label
+    :param dict snapshot: the snapshot of :class:`EntrypointStats`
+    :rtype: str
+    """
+    calls = [
+        '# HELP maiev_entrypoint_calls_total number of calls of the entrypoint',
+        '# TYPE maiev_entrypoint_calls_total counter',
+    ]
+    errors = [
+        '# HELP maiev_entrypoint_errors_total number of calls of the entrypoint which raised an exception',
+        '# TYPE maiev_entrypoint_errors_total counter',
+    ]
+    durations = [
+        '# HELP maiev_entrypoint_duration_seconds duration of the calls of the entrypoint',
+        '# TYPE maiev_entrypoint_duration_seconds histogram',
+    ]
+    bounds = ['%g' % b for b in snapshot['buckets']] + ['+Inf']
+    for name, stats in sorted(snapshot['entrypoints'].items()):
+        labels = 'service="%s",entrypoint="%s",type="%s"' % (service_name, name, stats['type'])
+        calls.append('maiev_entrypoint_calls_total{%s} %d' % (labels, stats['calls']))
+        errors.append('maiev_entrypoint_errors_total{%s} %d' % (labels, stats['errors']))
+        cumulated = 0
+        for bound, count in zip(bounds, stats['buckets']):
+            cumulated += count
+            durations.append('maiev_entrypoint_duration_seconds_bucket{%s,le="%s"} %d' % (labels, bound, cumulated))
+        durations.append('maiev_entrypoint_duration_seconds_sum{%s} %f' % (labels, stats['time']))
+        durations.append('maiev_entrypoint_duration_seconds_count{%s} %d' % (labels, stats['calls']))
+    return '\n'.join(calls + errors + durations) + '\n'
+
+
+class StatsProvider(DependencyProvider):
+    """
+    record the stats of each worker of the container. the dependency is the :class:`EntrypointStats`
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.stats = EntrypointStats(buckets)
+        self.worker_starts = {}
+
+    def get_dependency(self, worker_ctx):
+        return self.stats
+
+    def worker_setup(self, worker_ctx):
+        self.worker_starts[worker_ctx] = time.time()
+
+    def worker_result(self, worker_ctx, result=None, exc_info=None):
+        start = self.worker_starts.pop(worker_ctx, None)
+        if start is None:
+            return
+        entrypoint = worker_ctx.entrypoint
+        type_ = entrypoint.__class__.__name__
+        self.stats.record(
+            entrypoint.method_name,
+            ENTRYPOINT_TYPES.get(type_, type_.lower()),
+            time.time() - start,
+            error=exc_info is not None,
+        )
+
+    def worker_teardown(self, worker_ctx):
+        self.worker_starts.pop(worker_ctx, None)
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import logging
+from unittest.case import TestCase
+
+from common.constraints import PhaseChecker
+
+logger = logging.getLogger(__name__)
+
+
+class TestPhaseChecker(TestCase):
+    CATALOG = [
+        {
+            "name": "producer",
+            "versions": {
+                "1": {"provide": {"producer:rpc:echo": 1}, "require": []},
+                "2": {"provide": {"producer:rpc:echo": 2, "producer:rpc:echo:args": ["msg"]}, "require": []},
+            }
+        },
+        {
+            "name": "consumer",
+            "versions": {
+                "1": {"provide": {}, "require": ["producer:rpc:echo"]},
+                "2": {"provide": {}, "require": ["producer:rpc:echo == 2", '"msg" in producer:rpc:echo:args']},
+            }
+        },
+    ]
+
+    def test_valid_phases(self):
+        checker = PhaseChecker(self.CATALOG)
+        self.assertTrue(checker.is_valid({"producer": "1", "consumer": "1"}))
+        self.assertTrue(checker.is_valid({"producer": "2", "consumer": "1"}))
+        self.assertTrue(checker.is_valid({"producer": "2", "consumer": "2"}))
+        self.assertEqual(checker.anomalies, [])
+
+    def test_invalid_phases(self):
+        checker = PhaseChecker(self.CATALOG)
+        self.assertEqual(checker.failed({"producer": "1", "consumer": "2"}), 1)
+        # missing variable
+        self.assertEqual(checker.failed({"consumer": "1"}), 1)
+
+    def test_extra_constraints(self):
+        checker = PhaseChecker(self.CATALOG, ["producer:rpc:echo == 2"])
+        self.assertFalse(checker.is_valid({"producer": "1", "consumer": "1"}))
+        self.assertTrue(checker.is_valid({"producer": "2", "consumer": "1"}))
+
+    def test_memoized(self):
+        checker = PhaseChecker(self.CATALOG)
+        checker.is_valid({"producer": "1", "consumer": "2"})
+        checker.requirements = {}
+        self.assertFalse(checker.is_valid({"consumer": "2", "producer": "1"}))
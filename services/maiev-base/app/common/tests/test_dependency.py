@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+from concurrent.futures import TimeoutError
+from unittest.case import TestCase
+
+from common.dependency import ProcessPool, create_process_pool
+
+# set in the parent process only: a child started by fork would inherit it
+PARENT_STATE = {'parent': False}
+
+
+def child_state():
+    return os.getpid(), PARENT_STATE['parent']
+
+
+def slow(delay):
+    time.sleep(delay)
+    return delay
+
+
+class TestProcessPool(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pool = create_process_pool(1)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.pool.shutdown()
+
+    def test_run_in_fresh_process(self):
+        PARENT_STATE['parent'] = True
+        try:
+            pid, inherited = ProcessPool(self.pool).run(child_state)
+        finally:
+            PARENT_STATE['parent'] = False
+        self.assertNotEqual(pid, os.getpid())
+        self.assertFalse(inherited)
+
+    def test_timeout(self):
+        with self.assertRaises(TimeoutError):
+            ProcessPool(self.pool).run(slow, 1, timeout=0.1)
+        self.assertEqual(ProcessPool(self.pool).run(slow, 0), 0)
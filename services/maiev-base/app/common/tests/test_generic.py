@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+from unittest.case import TestCase
+
+from common.dp.generic import GenericServiceProxyPool, ProxyCache, RpcBatch
+
+
+def worker_ctx():
+    return mock.Mock(container=mock.Mock(config={'AMQP_URI': 'memory://'}))
+
+
+class TestProxyCache(TestCase):
+
+    def setUp(self):
+        self.cache = ProxyCache(mock.Mock())
+
+    def test_proxy_shared_by_workers(self):
+        w1, w2 = worker_ctx(), worker_ctx()
+        p1 = GenericServiceProxyPool(w1, self.cache).get('producer').get
+        p2 = GenericServiceProxyPool(w2, self.cache).get('producer').get
+        self.assertEqual(len(self.cache.proxies), 1)
+        self.assertIs(p1.worker_ctx, w1)
+        self.assertIs(p2.worker_ctx, w2)
+        self.assertIs(p1.publisher, p2.publisher)
+        self.assertEqual(p1.service_name, 'producer')
+        self.assertEqual(p1.method_name, 'get')
+
+    def test_key_by_options(self):
+        pool = GenericServiceProxyPool(worker_ctx(), self.cache)
+        pool.get('producer').get
+        pool.get('producer', serializer='pickle').get
+        pool.get('producer', serializer='pickle').get
+        pool.get('producer').other
+        pool.get('consumer').get
+        self.assertEqual(len(self.cache.proxies), 4)
+
+    def test_clear(self):
+        GenericServiceProxyPool(worker_ctx(), self.cache).get('producer').get
+        self.cache.clear()
+        self.assertEqual(self.cache.proxies, {})
+
+
+class TestRpcBatch(TestCase):
+
+    def setUp(self):
+        self.pool = mock.Mock()
+        self.replies = []
+
+        def call_async(*args, **kwargs):
+            reply = mock.Mock()
+            reply.result.return_value = args
+            self.replies.append(reply)
+            return reply
+        self.pool.get.return_value.track.call_async.side_effect = call_async
+
+    def test_fire_and_forget(self):
+        with RpcBatch(self.pool) as batch:
+            batch.get('monitorer_rabbitmq').track('a')
+            batch.get('monitorer_rabbitmq').track('b')
+            # all calls sent before any reply is waited
+            self.assertEqual(len(self.replies), 2)
+        self.pool.get.assert_called_with('monitorer_rabbitmq')
+        for reply in self.replies:
+            self.assertFalse(reply.result.called)
+
+    def test_wait(self):
+        with RpcBatch(self.pool, wait=True) as batch:
+            batch.get('monitorer_rabbitmq').track('a')
+            batch.get('monitorer_rabbitmq').track('b')
+        for reply in self.replies:
+            self.assertTrue(reply.result.called)
+        self.assertEqual(batch.results(), [('a',), ('b',)])
+
+    def test_wait_error(self):
+        with self.assertRaises(KeyError):
+            with RpcBatch(self.pool, wait=True) as batch:
+                batch.get('monitorer_rabbitmq').track('a')
+                self.replies[0].result.side_effect = KeyError('a')
+                batch.get('monitorer_rabbitmq').track('b')
+        # the error is raised once all replies are received
+        self.assertTrue(self.replies[1].result.called)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+from collections import namedtuple
+from unittest.case import TestCase
+
+import pytz
+
+from common.serialization import dumps, loads
+from common.utils import ImageVersion
+
+
+class TestMsgpackSerializer(TestCase):
+
+    service = {
+        'name': 'producer',
+        'image': {
+            'type': 'docker',
+            'image_info': {
+                'repository': 'localhost:5000',
+                'image': 'maiev',
+                'tag': 'producer-1.0.16',
+                'species': 'producer',
+                'version': '1.0.16',
+                'digest': None,
+            },
+            'full_image_id': 'localhost:5000/maiev:producer',
+        },
+        'scale_config': {'min': 0, 'max': 9, 'dependencies': {'require': ['a:rpc > 1'], 'provide': {'b:rpc': 2}}},
+        'mode': {'name': 'replicated', 'replicas': 2},
+        'ratio': 0.5,
+        'binary': b'\x00\x01',
+    }
+
+    def test_roundtrip(self):
+        self.assertEqual(loads(dumps(self.service)), self.service)
+
+    def test_tuples_as_list(self):
+        Pin = namedtuple('Pin', 'service,version')
+        self.assertEqual(loads(dumps({'phase': (Pin('a', '1.0'), ('b', '2.0'))})),
+                         {'phase': [['a', '1.0'], ['b', '2.0']]})
+
+    def test_aware_datetime(self):
+        date = pytz.timezone('Europe/Paris').localize(datetime.datetime(2018, 5, 3, 14, 2, 1, 123456))
+        result = loads(dumps({'date': date}))['date']
+        self.assertEqual(result, date)
+        self.assertEqual(result.utcoffset(), datetime.timedelta(0))
+        self.assertEqual(result.microsecond, 123456)
+
+    def test_naive_datetime(self):
+        date = datetime.datetime(2018, 5, 3, 14, 2, 1)
+        self.assertEqual(loads(dumps(date)), date.astimezone())
+
+    def test_date(self):
+        self.assertEqual(loads(dumps([datetime.date(2018, 5, 3)])), [datetime.date(2018, 5, 3)])
+
+    def test_image_version(self):
+        iv = ImageVersion.from_scaler({
+            'repository': 'localhost:5000', 'image': 'maiev', 'tag': 'producer-1.0.16', 'digest': None,
+        })
+        result = loads(dumps({'new': iv}))['new']
+        self.assertIsInstance(result, ImageVersion)
+        self.assertEqual(result.data, iv.data)
+
+    def test_smaller_than_json(self):
+        self.assertLess(len(dumps(self.service)), len(json.dumps(dict(self.service, binary=None))))
+
+    def test_unsupported(self):
+        with self.assertRaises(TypeError):
+            dumps(object())
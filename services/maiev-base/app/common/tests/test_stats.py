@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+from unittest import mock
+from unittest.case import TestCase
+
+from nameko.rpc import Rpc
+from nameko.timer import Timer
+
+from common.entrypoint import Once
+from common.stats import EntrypointStats, StatsProvider, format_prometheus
+
+
+def worker_ctx(entrypoint_cls, method_name):
+    entrypoint = mock.Mock(spec=entrypoint_cls)
+    entrypoint.__class__ = entrypoint_cls
+    entrypoint.method_name = method_name
+    return mock.Mock(entrypoint=entrypoint)
+
+
+class TestEntrypointStats(TestCase):
+
+    def test_record(self):
+        stats = EntrypointStats(buckets=(0.1, 1))
+        stats.record('get', 'rpc', 0.05)
+        stats.record('get', 'rpc', 0.1)
+        stats.record('get', 'rpc', 0.5, error=True)
+        stats.record('get', 'rpc', 3)
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['buckets'], [0.1, 1])
+        get = snapshot['entrypoints']['get']
+        self.assertEqual(get['type'], 'rpc')
+        self.assertEqual(get['calls'], 4)
+        self.assertEqual(get['errors'], 1)
+        self.assertEqual(get['buckets'], [2, 1, 1])
+        self.assertEqual(get['max'], 3)
+        self.assertAlmostEqual(get['time'], 3.65)
+
+    def test_snapshot_is_a_copy(self):
+        stats = EntrypointStats()
+        stats.record('get', 'rpc', 0.05)
+        snapshot = stats.snapshot()
+        stats.record('get', 'rpc', 0.05)
+        self.assertEqual(snapshot['entrypoints']['get']['calls'], 1)
+        self.assertEqual(sum(snapshot['entrypoints']['get']['buckets']), 1)
+
+    def test_format_prometheus(self):
+        stats = EntrypointStats(buckets=(0.1, 1))
+        stats.record('get', 'rpc', 0.05)
+        stats.record('get', 'rpc', 3, error=True)
+        text = format_prometheus('overseer', stats.snapshot())
+        labels = 'service="overseer",entrypoint="get",type="rpc"'
+        self.assertIn('maiev_entrypoint_calls_total{%s} 2\n' % labels, text)
+        self.assertIn('maiev_entrypoint_errors_total{%s} 1\n' % labels, text)
+        self.assertIn('maiev_entrypoint_duration_seconds_bucket{%s,le="0.1"} 1\n' % labels, text)
+        self.assertIn('maiev_entrypoint_duration_seconds_bucket{%s,le="1"} 1\n' % labels, text)
+        self.assertIn('maiev_entrypoint_duration_seconds_bucket{%s,le="+Inf"} 2\n' % labels, text)
+        self.assertIn('maiev_entrypoint_duration_seconds_count{%s} 2\n' % labels, text)
+        self.assertIn('# TYPE maiev_entrypoint_duration_seconds histogram\n', text)
+
+
+class TestStatsProvider(TestCase):
+
+    def test_worker_lifecycle(self):
+        provider = StatsProvider()
+        for cls, name, exc_info in ((Rpc, 'get', None), (Timer, 'check', ('exc',)), (Once, 'create_index', None)):
+            ctx = worker_ctx(cls, name)
+            provider.worker_setup(ctx)
+            provider.worker_result(ctx, None, exc_info)
+            provider.worker_teardown(ctx)
+
+        entrypoints = provider.get_dependency(None).snapshot()['entrypoints']
+        self.assertEqual({n: s['type'] for n, s in entrypoints.items()},
+                         {'get': 'rpc', 'check': 'timer', 'create_index': 'once'})
+        self.assertEqual(entrypoints['check']['errors'], 1)
+        self.assertEqual(entrypoints['get']['errors'], 0)
+        self.assertEqual(provider.worker_starts, {})
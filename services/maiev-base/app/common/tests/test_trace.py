@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import mock
+
+from common.trace import add_hop, hop_latencies, new_trace
+
+logger = logging.getLogger(__name__)
+
+
+class TestTrace(object):
+
+    def test_new_trace(self):
+        with mock.patch('common.trace.time.time', return_value=10.0):
+            trace = new_trace('monitorer')
+        assert trace['hops'] == [['monitorer', 10.0]]
+        assert trace['id'] != new_trace('monitorer')['id']
+
+    def test_add_hop_copy(self):
+        trace = {'id': 'a', 'hops': [['monitorer', 1.0]]}
+        with mock.patch('common.trace.time.time', return_value=2.0):
+            added = add_hop(trace, 'trigger')
+        assert added == {'id': 'a', 'hops': [['monitorer', 1.0], ['trigger', 2.0]]}
+        assert trace == {'id': 'a', 'hops': [['monitorer', 1.0]]}
+
+    def test_add_hop_untraced(self):
+        trace = add_hop(None, 'trigger')
+        assert [h for h, _ in trace['hops']] == ['trigger']
+
+    def test_latencies(self):
+        assert hop_latencies({'id': 'a', 'hops': [['monitorer', 1.0]]}) == {'latencies': [], 'total': 0}
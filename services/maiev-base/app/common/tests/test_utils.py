@@ -1,8 +1,12 @@
 # -*- coding: utf-8 -*-
 import logging
+import time
+from unittest import mock
 from unittest.case import TestCase
 
-from common.utils import ImageVersion
+import eventlet
+
+from common.utils import ExceptionSampler, GatherTimeout, ImageVersion, gather, log_all, wait_replies
 
 logger = logging.getLogger(__name__)
 
@@ -262,3 +266,211 @@ class TestImageVersion(TestCase):
         self.assertFalse(
             self.create_iv('overseer', 'maiev', 'localhost') < self.create_iv('overseer', 'maiev', 'hub.docker.com')
         )
+
+    def test_cached_version(self):
+        iv = self.create_iv('overseer-1.2.78')
+        self.assertIs(iv.version, iv.version)
+        self.assertIs(iv.version, self.create_iv('overseer-1.2.78', 'ganymede').version)
+        with self.assertRaises(AttributeError):
+            iv.other = 1
+
+    def test_cached_tag_parse(self):
+        self.create_iv('overseer-1.2.79')
+        hits = ImageVersion._parse_tag.cache_info().hits
+        parsed = self.create_iv('overseer-1.2.79', 'ganymede')
+        self.assertEqual(ImageVersion._parse_tag.cache_info().hits, hits + 1)
+        self.assertEqual(parsed.data['image'], 'ganymede')
+        self.assertEqual(parsed.data['species'], 'overseer')
+
+    def test_hash(self):
+        iv_12 = self.create_iv('overseer-1.2')
+        iv_120 = self.create_iv('overseer-1.2.0', 'maiev', 'hub.docker.com', 'sha256:other')
+        self.assertEqual(iv_12, iv_120)
+        self.assertEqual(hash(iv_12), hash(iv_120))
+        self.assertEqual(len({iv_12, iv_120, self.create_iv('overseer-1.3')}), 2)
+        self.assertEqual({iv_12: 1}[iv_120], 1)
+        self.assertNotIn(self.create_iv('overseer-1.2', 'ganymede'), {iv_12})
+
+    def test_hash_latest(self):
+        # latest versions are the same only with the same digest
+        versions = {
+            self.create_iv('overseer-latest', 'maiev', 'hub.docker.com', 'sha256:a'),
+            self.create_iv('overseer-latest', 'maiev', 'hub.docker.com', 'sha256:a'),
+            self.create_iv('overseer-latest', 'maiev', 'hub.docker.com', 'sha256:b'),
+        }
+        self.assertEqual(len(versions), 2)
+
+    def test_eq_other_type(self):
+        self.assertNotEqual(self.create_iv('overseer-1.2'), '1.2')
+        self.assertNotEqual(self.create_iv('overseer-1.2'), None)
+
+
+class TestLogAll(TestCase):
+
+    def test_truncated_args(self):
+        @log_all
+        def fail(catalog):
+            raise ValueError("bad catalog")
+
+        with self.assertLogs(__name__, logging.ERROR) as logs:
+            with self.assertRaises(ValueError):
+                fail(list(range(100000)))
+        self.assertEqual(len(logs.records), 1)
+        self.assertLess(len(logs.records[0].getMessage()), 300)
+        self.assertIn('bad catalog', logs.records[0].getMessage())
+        self.assertIsInstance(logs.records[0].call['args'], str)
+
+    def test_ignored_exception(self):
+        @log_all(KeyError)
+        def fail():
+            raise KeyError("ignored")
+
+        with self.assertRaises(KeyError):
+            fail()
+
+    def test_sampling(self):
+        @log_all
+        def fail(i):
+            raise ValueError("always the same")
+
+        with self.assertLogs(__name__, logging.ERROR) as logs:
+            for i in range(5):
+                with self.assertRaises(ValueError):
+                    fail(i)
+            with self.assertRaises(ValueError):
+                fail.exception_sampler.interval = 0
+                fail(5)
+        self.assertEqual(len(logs.records), 2)
+        self.assertIn('4 identical errors not logged', logs.records[1].getMessage())
+
+    def test_no_sampling(self):
+        @log_all(sample=False)
+        def fail(i):
+            raise ValueError("always the same")
+
+        with self.assertLogs(__name__, logging.ERROR) as logs:
+            for i in range(3):
+                with self.assertRaises(ValueError):
+                    fail(i)
+        self.assertEqual(len(logs.records), 3)
+
+    def test_sampler(self):
+        sampler = ExceptionSampler(interval=10, size=2)
+        self.assertEqual(sampler.sample(ValueError('a'), now=0), 0)
+        self.assertIsNone(sampler.sample(ValueError('a'), now=5))
+        self.assertEqual(sampler.sample(ValueError('b'), now=5), 0)
+        self.assertEqual(sampler.sample(KeyError('a'), now=5), 0)
+        self.assertEqual(len(sampler.seen), 2)
+        self.assertEqual(sampler.sample(KeyError('a'), now=15), 0)
+        self.assertEqual(sampler.sample(ValueError('b'), now=16), 0)
+
+    def test_log_duration(self):
+        @log_all(log_duration=True)
+        def ok():
+            return 1
+
+        with self.assertLogs(__name__, logging.DEBUG) as logs:
+            self.assertEqual(ok(), 1)
+        self.assertEqual(logs.records[0].call['function'], 'ok')
+        self.assertGreaterEqual(logs.records[0].call['duration'], 0)
+
+
+class FakeReply(object):
+    def __init__(self, result=None, error=None, delay=0):
+        self.value = result
+        self.error = error
+        self.delay = delay
+
+    def result(self):
+        eventlet.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class FakeMethod(object):
+    """
+    a method proxy which reply with the given function of the args, and keep the number of calls waiting for
+    their reply
+    """
+
+    def __init__(self, func, delay=0):
+        self.func = func
+        self.delay = delay
+        self.pending = 0
+        self.max_pending = 0
+
+    def call_async(self, *args, **kwargs):
+        self.pending += 1
+        self.max_pending = max(self.max_pending, self.pending)
+        try:
+            result, error = self.func(*args, **kwargs), None
+        except Exception as e:
+            result, error = None, e
+        reply = FakeReply(result, error, self.delay)
+        original = reply.result
+
+        def result():
+            try:
+                return original()
+            finally:
+                self.pending -= 1
+        reply.result = result
+        return reply
+
+
+class TestGather(TestCase):
+
+    def test_results_in_order(self):
+        method = FakeMethod(lambda a, b=0: a + b)
+        results, errors = gather([(method, (1,)), (method, (2,), {'b': 3}), (method, (3,))])
+        self.assertEqual(results, [1, 5, 3])
+        self.assertEqual(errors, [None, None, None])
+
+    def test_errors(self):
+        def func(a):
+            if a == 2:
+                raise KeyError(a)
+            return a
+        results, errors = gather([(FakeMethod(func), (a,)) for a in range(4)])
+        self.assertEqual(results, [0, 1, None, 3])
+        self.assertEqual([type(e) for e in errors], [type(None), type(None), KeyError, type(None)])
+
+    def test_call_async_error(self):
+        method = mock.Mock()
+        method.call_async.side_effect = ValueError("unknown service")
+        results, errors = gather([(method, ())])
+        self.assertEqual(results, [None])
+        self.assertIsInstance(errors[0], ValueError)
+
+    def test_concurrency(self):
+        method = FakeMethod(lambda a: a)
+        results, errors = gather([(method, (a,)) for a in range(10)], concurrency=3)
+        self.assertEqual(results, list(range(10)))
+        self.assertEqual(method.max_pending, 3)
+
+        method = FakeMethod(lambda a: a)
+        gather([(method, (a,)) for a in range(10)])
+        self.assertEqual(method.max_pending, 10)
+
+    def test_shared_deadline(self):
+        method = FakeMethod(lambda a: a, delay=0.05)
+        start = time.time()
+        results, errors = gather([(method, (a,)) for a in range(5)], timeout=0.12, concurrency=1)
+        self.assertLess(time.time() - start, 0.2)
+        self.assertEqual(results[:2], [0, 1])
+        self.assertEqual(errors[:2], [None, None])
+        self.assertTrue(all(isinstance(e, GatherTimeout) for e in errors[3:]))
+
+    def test_wait_replies(self):
+        replies = [FakeReply(1), FakeReply(error=KeyError('a')), FakeReply(3, delay=1)]
+        results, errors = wait_replies(replies, deadline=time.time() + 0.05)
+        self.assertEqual(results, [1, None, None])
+        self.assertIsNone(errors[0])
+        self.assertIsInstance(errors[1], KeyError)
+        self.assertIsInstance(errors[2], GatherTimeout)
+
+    def test_outer_timeout(self):
+        with self.assertRaises(eventlet.Timeout):
+            with eventlet.Timeout(0.01):
+                wait_replies([FakeReply(1, delay=1)], deadline=time.time() + 5)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+correlation of the events and rpc calls which lead to a decision.
+
+a trace is a small dict given along with the payloads and the rpc calls. each service which handle it
+add its hop with the time it handled it, so the latency between each service can be computed at the end::
+
+    {
+        "id": "4f5c...",  # the correlation id, the same for all hops
+        "hops": [["monitorer_rabbitmq", 1525356559.596], ["trigger", 1525356559.712], ...]
+    }
+
+the hops are timestamped with the clock of each host: the latencies are only as good as their synchronisation.
+"""
+import logging
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+def new_trace(hop):
+    """
+    start a new trace
+    :param str hop: the name of the first hop (the service starting the trace)
+    :rtype: dict
+    """
+    return {'id': uuid.uuid4().hex, 'hops': [[hop, time.time()]]}
+
+
+def add_hop(trace, hop):
+    """
+    return a copy of the trace with the given hop added. start a new trace if none was given, to support
+    the events sent by services which don't trace.
+
+    >>> trace = add_hop({'id': 'a', 'hops': [['monitorer', 1.0]]}, 'trigger')
+    >>> trace['id'], [h for h, _ in trace['hops']]
+    ('a', ['monitorer', 'trigger'])
+
+    :param dict|None trace: the trace received
+    :param str hop: the name of this hop
+    :rtype: dict
+    """
+    if not trace:
+        return new_trace(hop)
+    return {'id': trace['id'], 'hops': list(trace['hops']) + [[hop, time.time()]]}
+
+
+def hop_latencies(trace):
+    """
+    compute the time spent between each hop of the trace
+
+    >>> hop_latencies({'id': 'a', 'hops': [['monitorer', 1.0], ['trigger', 1.5], ['load_manager', 3.0]]})
+    {'latencies': [['trigger', 0.5], ['load_manager', 1.5]], 'total': 2.0}
+
+    :param dict trace: the trace
+    :return: the latency of each hop since the previous one, and the total time since the first hop
+    :rtype: dict
+    """
+    hops = trace['hops']
+    return {
+        'latencies': [[hop, date - previous] for (_, previous), (hop, date) in zip(hops, hops[1:])],
+        'total': hops[-1][1] - hops[0][1] if hops else 0,
+    }
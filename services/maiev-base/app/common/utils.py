@@ -1,44 +1,138 @@
 # -*- coding: utf-8 -*-
 
 import datetime
+import json
 import logging
+import reprlib
+import time
 import types
 import regex
-from functools import partial, wraps
+from collections import OrderedDict, deque
+from functools import lru_cache, partial, wraps
 
 import eventlet
 from promise.promise import Promise
 from semantic_version import Version
 
 
-def log_all(meth_or_ignore_excpt=None, ignore_exceptions=(SystemExit,)):
+# the reprs of the args logged by log_all are truncated to these limits
+_call_repr = reprlib.Repr()
+_call_repr.maxstring = 200
+_call_repr.maxother = 200
+_call_repr.maxlist = _call_repr.maxtuple = _call_repr.maxdict = _call_repr.maxset = 10
+_call_repr.maxlevel = 3
+
+# seconds during which the same exception of a function is logged once
+LOG_ALL_SAMPLE_INTERVAL = 60
+# max number of exceptions kept by function for the sampling
+LOG_ALL_SAMPLE_SIZE = 100
+
+
+def call_repr(args, kwargs):
+    """
+    build a short repr of the args of a call: the big catalogs or payloads are truncated
+
+    >>> call_repr((1,), {'b': list(range(20))})
+    "args=(1,), kwargs={'b': [0, 1, 2, 3, 4, 5, 6, 7, 8, 9, ...]}"
+
+    :param tuple args: the args of the call
+    :param dict kwargs: the kwargs of the call
+    :rtype: str
+    """
+    try:
+        return 'args=%s, kwargs=%s' % (_call_repr.repr(args), _call_repr.repr(kwargs))
+    except Exception:
+        return 'args unavailable'
+
+
+class ExceptionSampler(object):
+    """
+    keep track of the exceptions raised by a function, to log only once the same exception
+    in a given interval. the count of the ones not logged is given with the next one logged.
+    """
+
+    def __init__(self, interval=LOG_ALL_SAMPLE_INTERVAL, size=LOG_ALL_SAMPLE_SIZE):
+        self.interval = interval
+        self.size = size
+        self.seen = OrderedDict()  # (exception class, message) => [last logged time, suppressed count]
+
+    def sample(self, exc, now=None):
+        """
+        check if the exception must be logged
+        :param Exception exc: the exception raised
+        :param float now: the current time
+        :return: None if the exception must not be logged, or the number of identical exceptions not logged
+        :rtype: int|None
+        """
+        now = time.time() if now is None else now
+        key = (exc.__class__, str(exc))
+        seen = self.seen.get(key)
+        if seen is not None and now - seen[0] < self.interval:
+            seen[1] += 1
+            return None
+        self.seen.pop(key, None)
+        self.seen[key] = [now, 0]
+        while len(self.seen) > self.size:
+            self.seen.popitem(last=False)
+        return seen[1] if seen is not None else 0
+
+
+def _log_call_exception(logger, meth, args, kwargs, exc, sampler):
+    suppressed = sampler.sample(exc) if sampler is not None else 0
+    if suppressed is None or not logger.isEnabledFor(logging.ERROR):
+        return
+    call = call_repr(args, kwargs)
+    msg = 'error with call %s(%s) : %s' % (meth.__name__, call, exc)
+    if suppressed:
+        msg += ' (%d identical errors not logged)' % suppressed
+    logger.exception(msg, extra={'call': {'function': meth.__name__, 'args': call, 'suppressed': suppressed}})
+
+
+def log_all(meth_or_ignore_excpt=None, ignore_exceptions=(SystemExit,), sample=True, log_duration=False):
+    """
+    log the exceptions raised by the decorated function, with a truncated repr of its args.
+
+    can be used as ``@log_all``, ``@log_all(IgnoredException)`` or ``@log_all(log_duration=True)``
+
+    :param meth_or_ignore_excpt: the function to decorate, or the exceptions to not log
+    :param ignore_exceptions: the exceptions to not log
+    :param bool sample: log only once by :data:`LOG_ALL_SAMPLE_INTERVAL` the same exception of the function
+    :param bool log_duration: log the duration of each call at debug level
+    """
     if isinstance(meth_or_ignore_excpt, types.FunctionType):
 
         meth = meth_or_ignore_excpt
         logger = logging.getLogger(meth.__module__ or __name__)
+        sampler = ExceptionSampler() if sample else None
 
         @wraps(meth)
         def wrapper(*args, **kwargs):
+            start = time.time() if log_duration else None
             try:
                 return meth(*args, **kwargs)
             except ignore_exceptions:
                 raise
             except Exception as e:
-                try:
-                    msg = 'error with call %s(args=%r, kwargs=%r) : %s' % (meth.__name__, args, kwargs, e)
-                except Exception:
-                    msg = 'error with call %s(args unavailable) : %s' % (meth.__name__, e,)
-
-                logger.exception(msg, extra={'call': {'args': args, 'kwargs': kwargs}})
+                _log_call_exception(logger, meth, args, kwargs, e, sampler)
                 raise
+            finally:
+                if start is not None:
+                    duration = time.time() - start
+                    logger.debug('call %s took %.3fs', meth.__name__, duration,
+                                 extra={'call': {'function': meth.__name__, 'duration': duration}})
+        wrapper.exception_sampler = sampler
     else:
         # gave exceptions
         ignore_exceptions = meth_or_ignore_excpt or ignore_exceptions
-        return partial(log_all, ignore_exceptions=ignore_exceptions)
+        return partial(log_all, ignore_exceptions=ignore_exceptions, sample=sample, log_duration=log_duration)
     return wrapper
 
 
 def make_promise(result_async):
+    """
+    make a Promise resolved by the result of a call_async. it spawn a greenthread for each call:
+    prefer :func:`gather` to wait for many calls.
+    """
     def promise_caller(resolve, reject):
         def promise_waiter():
             resolve(result_async.result())  # will wait for rpc reply
@@ -57,6 +151,84 @@ def then(result_async):
     return make_promise(result_async).then
 
 
+class GatherTimeout(Exception):
+    """
+    the reply of a call was not received before the deadline of :func:`gather`
+    """
+
+
+def wait_replies(replies, deadline=None):
+    """
+    wait for the replies of many call_async, up to a shared deadline.
+
+    :param list replies: the RpcReply given by call_async
+    :param float deadline: the time (as time.time()) at which the waiting stop, None to wait forever
+    :return: the results and the errors, in the order of the replies. for each reply, one of them is None
+    :rtype: tuple[list, list[Exception]]
+    """
+    results, errors = [], []
+    for reply in replies:
+        result, error = _wait_reply(reply, deadline)
+        results.append(result)
+        errors.append(error)
+    return results, errors
+
+
+def _wait_reply(reply, deadline):
+    remaining = None if deadline is None else deadline - time.time()
+    if remaining is not None and remaining <= 0:
+        return None, GatherTimeout("deadline reached before the reply")
+    timeout = eventlet.Timeout(remaining)
+    try:
+        return reply.result(), None
+    except eventlet.Timeout as e:
+        if e is not timeout:
+            raise
+        return None, GatherTimeout("no reply after the deadline")
+    except Exception as e:
+        return None, e
+    finally:
+        timeout.cancel()
+
+
+def gather(calls, timeout=None, concurrency=None):
+    """
+    send many rpc calls with call_async and wait for all their replies, without any greenthread.
+
+    >>> results, errors = gather([
+    ...     (self.overseer.get_service, ('producer',)),
+    ...     (self.scaler_docker.fetch_image_config, ('maiev:producer',), {}),
+    ... ], timeout=10)  # doctest: +SKIP
+
+    :param calls: the calls to do, as (method_proxy, args[, kwargs])
+    :param float timeout: the max number of seconds to wait for all the replies. the calls without reply
+        get a :class:`GatherTimeout` as error. None to wait forever
+    :param int concurrency: the max number of calls waiting for their reply at the same time. None for no limit
+    :return: the results and the errors, in the order of the calls. for each call, one of them is None
+    :rtype: tuple[list, list[Exception]]
+    """
+    calls = list(calls)
+    deadline = None if timeout is None else time.time() + timeout
+    window = len(calls) if not concurrency else concurrency
+    results, errors = [None] * len(calls), [None] * len(calls)
+    pending = deque()  # (index, reply) waiting for a reply
+    for index, call in enumerate(calls):
+        if len(pending) >= window:
+            done, reply = pending.popleft()
+            results[done], errors[done] = _wait_reply(reply, deadline)
+        if deadline is not None and time.time() >= deadline:
+            errors[index] = GatherTimeout("deadline reached before the call")
+            continue
+        method, args, kwargs = (tuple(call) + ({},))[:3]
+        try:
+            pending.append((index, method.call_async(*args, **kwargs)))
+        except Exception as e:
+            errors[index] = e
+    for index, reply in pending:
+        results[index], errors[index] = _wait_reply(reply, deadline)
+    return results, errors
+
+
 def filter_dict(d, startswith='_'):
     """
     helper that filter all key of a dict to remove each one that start with `startswith`
@@ -119,6 +291,40 @@ def merge_dict(into, *args):
     return updated
 
 
+def dependencies_signature(dependencies):
+    """
+    build a hashable signature of the provide/require of a version.
+    two versions with the same signature are interchangeable for the dependency solving.
+
+    >>> dependencies_signature({'provide': {'a:rpc': 1, 'a:event': 2}, 'require': ['b:rpc', 'c:rpc']}) == \\
+    ...     dependencies_signature({'require': ['c:rpc', 'b:rpc'], 'provide': {'a:event': 2, 'a:rpc': 1}})
+    True
+
+    :param dict dependencies: the dict with «provide» and «require»
+    :return: the canonical form of the dependencies
+    :rtype: tuple
+    """
+    return (
+        json.dumps(dependencies.get('provide') or {}, sort_keys=True),
+        tuple(sorted(set(dependencies.get('require') or ()))),
+    )
+
+
+@lru_cache(maxsize=4096)
+def coerce_version(version_string):
+    """
+    same as `Version.coerce`, but each version string is parsed once.
+    the returned Version is shared: it must not be updated.
+
+    >>> coerce_version('1.0') is coerce_version('1.0')
+    True
+
+    :param str version_string: the version to parse
+    :rtype: Version
+    """
+    return Version.coerce(version_string)
+
+
 class ImageVersion(object):
     """
     an object which represent an image version/tag/repository.
@@ -137,6 +343,7 @@ class ImageVersion(object):
     """
     the rexexp to parse the tage: see https://regex101.com/r/o2hr5V/3
     """
+    __slots__ = ('data', '_version')
 
     def __init__(self, data):
         """
@@ -150,8 +357,10 @@ class ImageVersion(object):
             - digest: the digest of the image
             - [facultative] metada: a set of metadata (including 'image' and 'version')
 
+        the data must not be updated after: the parsed version is cached.
         """
         self.data = data
+        self._version = None
 
     @classmethod
     def from_scaler(cls, hints):
@@ -183,14 +392,22 @@ class ImageVersion(object):
             'digest': hints.get('digest')
         }
         if tag is not None:
-            parsed_raw = cls.tag_regex.match(tag)
-            if parsed_raw:
-                result.update({
-                    k: '-'.join(v)
-                    for k, v in parsed_raw.capturesdict().items()}
-                )
+            result.update(cls._parse_tag(tag))
         return result
 
+    @classmethod
+    @lru_cache(maxsize=4096)
+    def _parse_tag(cls, tag):
+        """
+        parse the version and species from the tag. the same tags are parsed once.
+        :return: the parsed parts of the tag, as a tuple of (key, value)
+        :rtype: tuple[tuple[str, str]]
+        """
+        parsed_raw = cls.tag_regex.match(tag)
+        if not parsed_raw:
+            return ()
+        return tuple((k, '-'.join(v)) for k, v in parsed_raw.capturesdict().items())
+
     def is_same_image(self, other):
         """
         check if the two Version match the same image
@@ -205,6 +422,8 @@ class ImageVersion(object):
         )
 
     def __eq__(self, other):
+        if not isinstance(other, ImageVersion):
+            return NotImplemented
         if not self.is_same_image(other):
             return False
         if self.data['version'] == 'latest':
@@ -213,8 +432,14 @@ class ImageVersion(object):
             return self.version == other.version
 
     def __hash__(self):
+        """
+        hash the same values as __eq__: the image, and the digest for «latest» or the parsed version
+        (including the build metadata, which is used by Version equality)
+        """
         d = self.data
-        return hash((d[attr] for attr in ['repository', 'image', 'species', 'version']))
+        if d['version'] == 'latest':
+            return hash((d['repository'], d['image'], d['species'], 'latest', d['digest']))
+        return hash((d['repository'], d['image'], d['species'], self.version))
 
     def __lt__(self, other):
         sv = self.data['version']
@@ -247,8 +472,9 @@ class ImageVersion(object):
     def version(self):
         if self.data['version'] in (None, 'latest'):
             return self.data['version']
-        else:
-            return Version.coerce(self.data['version'])
+        if self._version is None:
+            self._version = coerce_version(self.data['version'])
+        return self._version
 
     @property
     def image_id(self):
@@ -9,6 +9,7 @@ from nameko.timer import timer
 from common.base import BaseWorkerService
 from common.db.mongo import Mongo
 from common.entrypoint import once
+from common.trace import new_trace
 from common.utils import log_all
 from service.dependency.rabbitmq import RabbitMq
 
@@ -113,7 +114,8 @@ class MonitorerRabbitmq(BaseWorkerService):
                 self.dispatch("metrics_updated", {
                     'monitorer': "monitorer_rabbitmq",
                     'identifier': queue_name,
-                    'metrics': metrics
+                    'metrics': metrics,
+                    'trace': new_trace(self.name),
                 })
 
     # ####################################################
@@ -194,11 +194,13 @@ class TestMonitorQueue(object):
             'monitorer': "monitorer_rabbitmq",
             'identifier': "launched_idle",
             'metrics': {'exists': True, 'waiting': 0, 'latency': None,
-                        'rate': None, 'call_rate': 0, 'exec_rate': 0, 'consumers': 1}
+                        'rate': None, 'call_rate': 0, 'exec_rate': 0, 'consumers': 1},
+            'trace': mock.ANY,
         })
         monitorer.dispatch.assert_any_call("metrics_updated", {
             'monitorer': "monitorer_rabbitmq",
             'identifier': "not_launched",
             'metrics': {'exists': False, 'waiting': 0, 'latency': None,
-                        'rate': None, 'call_rate': 0, 'exec_rate': 0, 'consumers': 0}
+                        'rate': None, 'call_rate': 0, 'exec_rate': 0, 'consumers': 0},
+            'trace': mock.ANY,
         })
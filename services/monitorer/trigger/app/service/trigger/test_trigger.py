@@ -490,6 +490,26 @@ class TestStorageMethods(WithDbTestTrigger):
         self.service.add(self.fixtures_rulesets[1])
         self.assertEqual(self.rulesets.count(), 2)
 
+    def test_add_track_resources(self):
+        ruleset = copy.deepcopy(self.fixtures_rulesets[0])
+        ruleset['resources'].append({
+            'name': 'http',
+            'monitorer': 'monitorer_http',
+            'identifier': 'http-producer',
+        })
+        batch = self.service.monitorer_rpc.batch.return_value.__enter__.return_value
+
+        self.service.add(ruleset)
+
+        self.assertEqual(self.rulesets.count(), 1)
+        # all the track are sent in one batch, which wait for their replies
+        self.service.monitorer_rpc.batch.assert_called_once_with(wait=True)
+        self.assertEqual(batch.get.call_args_list, [mock.call('monitorer_rabbitmq'), mock.call('monitorer_http')])
+        self.assertEqual(batch.get.return_value.track.call_args_list, [
+            mock.call('rpc-producer'), mock.call('http-producer'),
+        ])
+        self.assertTrue(self.service.monitorer_rpc.batch.return_value.__exit__.called)
+
     def test_add_replacement(self):
         self.assertEqual(self.rulesets.count(), 0)
 
@@ -600,6 +620,7 @@ class TestEventComputing(WithDbTestTrigger):
                                                 get_now=lambda: now
                                                 ),
                     'rules_stats': {'panic': True, 'latency_fail': True, 'stable_latency': False, 'latency_ok': False},
+                    'trace': mock.ANY,
                 })
                 compute_ruleset.assert_called_once()
 
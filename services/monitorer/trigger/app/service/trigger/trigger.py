@@ -17,6 +17,7 @@ from common.base import BaseWorkerService
 from common.db.mongo import Mongo
 from common.dp.generic import GenericRpcProxy
 from common.entrypoint import once
+from common.trace import add_hop
 from common.utils import filter_dict, log_all
 
 logger = logging.getLogger(__name__)
@@ -70,7 +71,8 @@ MetricsPayload = {
         "call_rate": float,  # the rate at which the resource is used
         "exec_rate": float,  # the rate at which the worker empty the queue
         "consumers": int,  # the number of consumer for this work
-    }
+    },
+    "trace": dict,  # optional, the trace started by the monitorer (see common.trace)
 }
 """
 grammar = Grammar(**{
@@ -202,7 +204,7 @@ class Trigger(BaseWorkerService):
         :param MetricsPayload payload: the payload of the event.
         :return:
         """
-        assert set(payload.keys()) <= {'monitorer', 'identifier', 'metrics'}, \
+        assert set(payload.keys()) <= {'monitorer', 'identifier', 'metrics', 'trace'}, \
             'the payload does not contains the required keys'
 
         q = {'resources.monitorer': payload['monitorer'], 'resources.identifier': payload['identifier']}
@@ -226,7 +228,8 @@ class Trigger(BaseWorkerService):
                     if updated:
                         event_payload = {
                             'ruleset': self._validate_ruleset(ruleset),
-                            'rules_stats': results
+                            'rules_stats': results,
+                            'trace': add_hop(payload.get('trace'), self.name),
                         }
                         logger.debug("triggering event 'ruleset_trigger' %s" % results)
                         self.dispatch('ruleset_triggered', event_payload)
@@ -307,9 +310,10 @@ class Trigger(BaseWorkerService):
             ruleset,
             upsert=True,
         )
-        # ask for monitorer to provide queue resources datas
-        for resource in ruleset['resources']:
-            self.monitorer_rpc.get(resource['monitorer']).track(resource['identifier'])
+        # ask for monitorer to provide queue resources datas. the calls are sent in parallel
+        with self.monitorer_rpc.batch(wait=True) as batch:
+            for resource in ruleset['resources']:
+                batch.get(resource['monitorer']).track(resource['identifier'])
 
     @rpc
     @log_all
@@ -1,38 +1,92 @@
 #!/bin/env python
 # -*- coding: utf-8 -*-
 
+import datetime
+import itertools
 import logging
+import re
 import time
+import uuid
+from concurrent.futures import TimeoutError
 from functools import partial
 
+import pymongo
 from booleano.exc import ScopeError
-from booleano.operations.variables import BooleanVariable, variable_symbol_table_builder
-from booleano.parser import Bind, Grammar, SymbolTable
 from booleano.parser.core import EvaluableParseManager
 from decorator import contextmanager
 from eventlet import greenthread
+from nameko.extensions import DependencyProvider
 from nameko.rpc import rpc
+from semantic_version import Version
 
 from common.base import BaseWorkerService
-from common.utils import log_all
+from common.constraints import build_symbol_table, grammar
+from common.db.mongo import Mongo, ensure_ttl_index
+from common.dependency import ProcessPoolProvider
+from common.entrypoint import once
+from common.utils import dependencies_signature, log_all
 
 logger = logging.getLogger(__name__)
 
-grammar = Grammar(**{
-    "belongs_to": "in",
-    "and": 'and',
-    "or": 'or',
-    "not": "not",
-})
+SOLVER_TIMEOUT_CONFIG_KEY = 'solver_timeout'
+DEFAULT_SOLVER_TIMEOUT = 60
+SOLVER_BACKEND_CONFIG_KEY = 'solver_backend'
+DEFAULT_SOLVER_BACKEND = 'backtrack'
+RESULTS_TTL_CONFIG_KEY = 'solver_results_ttl'
+DEFAULT_RESULTS_TTL = 3600
+# extra time given to the child process to notice his deadline and return before we stop waiting for it
+TIMEOUT_GRACE = 2
+
+QUOTED_REGEX = re.compile(r'"[^"]*"|\'[^\']*\'')
+NAME_REGEX = re.compile(r'[A-Za-z_][\w\-]*(?::[\w\-]+)*')
+
+
+def referenced_names(expression):
+    """
+    list the names (variables and services) used in a require expression.
+
+    >>> sorted(referenced_names('"world" in service1:rpc:hello:args and not service2'))
+    ['service1:rpc:hello:args', 'service2']
+
+    :param str expression: the expression as given in the require
+    :return: the set of names
+    """
+    return set(NAME_REGEX.findall(QUOTED_REGEX.sub('', expression))) - set(grammar.get_all_tokens().values())
+
+
+def context_key(namespace, name):
+    """
+    resolve a name of a require expression in the symbol table as the parser do, and return the key it read
+    in the provided context (see :meth:`Solver.build_provided`): the name itself for a provided variable, or the
+    last part of the path for the existence check of a service/path.
+
+    :param booleano.parser.scope.Namespace namespace: the namespace of the symbol table of the catalog
+    :param str name: the name as given by :func:`referenced_names`
+    :return: the key of the context, or None if the name is not in the symbol table
+    """
+    parts = name.split(':')
+    try:
+        operand = namespace.get_object(parts[-1], parts[:-1])
+    except ScopeError:
+        return None
+    if isinstance(operand.context_name, partial):  # check_exists
+        return operand.context_name.keywords['service_name']
+    return operand.context_name
 
 
 @contextmanager
-def debug_time(logger, desc):
+def debug_time(logger, desc, timings=None):
+    """
+    log the execution time of the block.
+    :param dict timings: if given, the elapsed time is stored in it with desc as key
+    """
     start = time.clock()
     try:
         yield
     finally:
         end = time.clock()
+        if timings is not None:
+            timings[desc] = end - start
         logger.debug("%s execution time: %ss", desc, end - start, exc_info={
             'type': 'debug_time',
             'desc': desc,
@@ -40,67 +94,85 @@ def debug_time(logger, desc):
         })
 
 
-def check_exists(context, service_name):
+def version_sort_key(number):
     """
-    check if service_name is included in context
-    :param dict context: the context
-    :return:
+    key to sort the version numbers from the oldest to the newest.
+    «latest» is always the newest, and the numbers that are not a valid version are older than the valid ones.
     """
-    return service_name in context
+    if number == 'latest':
+        return 2, None
+    try:
+        return 1, Version.coerce(str(number))
+    except ValueError:
+        return 0, str(number)
 
 
-def split_path(path):
-    """
-    take a path (service:rpc:method) and return the path (service:rpc) and the method name)
-    :param str path:
-    :return: the tiple with path[str] and method[str]
+def collapse_versions(catalog):
     """
-    splited = path.split(":")
-    return ":".join(splited[:-1]), splited[-1]
+    collapse all versions of a service having the same provide/require into one equivalence class.
+    each class is represented by his newest version, since all members of the class are interchangeable for
+    the solving, the newest is always the best choice.
 
-
-def build_subtable(path, root_table):
+    :param list catalog: the catalog to collapse. it is not updated
+    :return: the collapsed catalog and the classes as {service: {representative: [members]}}
+    :rtype: tuple[list, dict]
     """
-    build a chained subtable for the given path
-    :param path: the path to build
-    :param SymbolTable root_table: the root table in which we will add our table
-    :return:
+    res = []
+    classes = {}
+    for service in catalog:
+        by_signature = {}
+        for number, version in service['versions'].items():
+            by_signature.setdefault(dependencies_signature(version), []).append(number)
+        service_classes = classes[service['name']] = {}
+        for members in by_signature.values():
+            service_classes[max(members, key=version_sort_key)] = members
+        collapsed = dict(service)
+        collapsed['versions'] = {
+            number: service['versions'][number]
+            for number in service_classes
+        }
+        res.append(collapsed)
+    return res, classes
+
+
+def index_providers(variables):
     """
-
-    part = path[0]
-    for st in root_table.subtables:
-        if st.global_name == part:
-            break
-    else:
-        st = SymbolTable(part, [])
-        root_table.add_subtable(st)
-
-    if path[1:]:
-        return build_subtable(path[1:], st)
-    else:
-        return st
+    index the services by the names they provide (their own name and all their provided variables)
+    :param variables: the variables of a solver
+    :return: the index of the services for each name
+    :rtype: dict[str, set[int]]
+    """
+    providers = {}
+    for i, (service, versions) in enumerate(variables):
+        providers.setdefault(service['name'], set()).add(i)
+        for version in versions.values():
+            for name in version['provide']:
+                providers.setdefault(name, set()).add(i)
+    return providers
 
 
-def complete_with_objects(root_table):
+class BudgetExhausted(Exception):
     """
-    fill the given table and all subtalbse with objects checking if the context contains anything with this name.
-    :param SymbolTable root_table: the symboltable to update and add objects.
-    :return:
+    the solver reached his deadline or his max number of nodes before exploring all possibilities
     """
-    names = {o.global_name for o in root_table.objects}
-    for st in root_table.subtables:
-        if st.global_name not in names:
-            root_table.add_object(Bind(
-                st.global_name,
-                BooleanVariable(partial(check_exists, service_name=st.global_name))
-            ))
-            complete_with_objects(st)
 
 
 class Solver(object):
     MAX_BACKTRACK_SLEEP = 250
 
-    def __init__(self, catalog, extra_constraints, debug=False):
+    def __init__(self, catalog, extra_constraints, debug=False, deadline=None, max_nodes=None, collapse=True,
+                 cooperative=True):
+        """
+        :param bool collapse: if True, the versions with the same provide/require are collapsed before the solving,
+            and only the newest of them will be in the solutions. see :func:`collapse_versions`
+        :param float deadline: the timestamp (time.time()) after which the search is stopped. None for no limit
+        :param int max_nodes: the max number of nodes to visit before stopping the search. None for no limit
+        :param bool cooperative: if True, the search give back the control to the eventlet hub regularly. must be
+            False in a child process, which has no hub to switch to
+
+        if the search is stopped by the deadline or max_nodes, :meth:`solve` stop to yield and
+        :attr:`exhaustive` is set to False. all solutions yielded before stay valid.
+        """
         self.catalog = catalog
         self.extra_constraints = extra_constraints
         self.anomalies = []
@@ -108,6 +180,23 @@ class Solver(object):
         self.failed = []
         self.extra_constraints_compiled = []
         self.backtrack_count = 0
+        self.prune_count = 0
+        self.deadline = deadline
+        self.max_nodes = max_nodes
+        self.collapse = collapse
+        self.classes = {}
+        self.exhaustive = True
+        self.timings = {}
+        self.cooperative = cooperative
+
+    @property
+    def stats(self):
+        return {
+            "nodes": self.backtrack_count,
+            "prunings": self.prune_count,
+            "classes": sum(len(c) for c in self.classes.values()),
+            "elapsed": self.timings,
+        }
 
     def compile_resolution(self):
         pass
@@ -117,24 +206,7 @@ class Solver(object):
         build the symbol table using all «provide» of all services/versions
         :return:
         """
-
-        res = SymbolTable("root", [])
-        for service in self.catalog:
-
-            for number, version in service['versions'].items():
-                for provide, value in version['provide'].items():  # type: (str, int)
-                    path, object = split_path(provide)
-                    subtable = build_subtable(path.split(':'), res)
-                    variable_name = '%s:%s' % (path, object)
-                    try:
-                        vartype = variable_symbol_table_builder.find_for_type(type(value))
-                        subtable.add_object(
-                            Bind(object, vartype(variable_name))
-                        )
-                    except ScopeError:
-                        pass
-        complete_with_objects(res)
-        return res
+        return build_symbol_table(self.catalog)
 
     def compile_conditions(self, symbol_tables):
         """
@@ -176,19 +248,35 @@ class Solver(object):
         return res
 
     def solve(self):
+        """
+        yield all the phases which respect the requirements of the catalog and the extra constraints
+        :return: generator of {$service: $version}
+        """
+        variables = self.setup_variables()
+        try:
+            yield from self.search(variables)
+        except BudgetExhausted as e:
+            logger.warning("search stopped before the end: %s", e)
+            self.exhaustive = False
 
-        with debug_time(logger, 'compile_symbole_table'):
+    def setup_variables(self):
+        """
+        collapse and compile the catalog
+        :return: the list of (service, {number: {provide: dict, require: [ParseTree]}})
+        """
+        if self.collapse:
+            with debug_time(logger, 'collapse_versions', self.timings):
+                self.catalog, self.classes = collapse_versions(self.catalog)
+        with debug_time(logger, 'compile_symbole_table', self.timings):
             symbol_table = self.compile_symbole_table()
-        with debug_time(logger, 'compile_conditions'):
+        with debug_time(logger, 'compile_conditions', self.timings):
             conditions = self.compile_conditions(symbol_table)
         # condition service: version: [conditions]
         # first: we build the variables.
         variables = [
             # (servicename: str, versions: {provide: dict, require: condition})
         ]
-        encountered_solutions = [
-        ]
-        with debug_time(logger, 'setup_variables'):
+        with debug_time(logger, 'setup_variables', self.timings):
             for service in self.catalog:
                 variables.append(
                     (service, {
@@ -206,7 +294,17 @@ class Solver(object):
             nb_possibilities *= len(versions)
 
         logger.debug("solving %s possibilities using variables %r" % (nb_possibilities, variables))
-        with debug_time(logger, 'backtrack'):
+        return variables
+
+    def search(self, variables):
+        """
+        explore the variables to yield all valid phases
+        :param variables: the variables given by :meth:`setup_variables`
+        :return: generator of {$service: $version}
+        """
+        encountered_solutions = [
+        ]
+        with debug_time(logger, 'backtrack', self.timings):
             for solution in self.backtrack(variables, [self.check_requirements, self.check_extra_constraints], []):
                 pined = {
                     pin[0]['name']: pin[1]
@@ -218,6 +316,20 @@ class Solver(object):
                 yield pined
         logger.debug("%d solutions found in %d backtrack", len(encountered_solutions), self.backtrack_count)
 
+    def visit_node(self):
+        """
+        count a visited node and stop the search if the budget is exhausted
+        :raise BudgetExhausted: if the deadline or the max number of nodes is reached
+        """
+        self.backtrack_count += 1
+        if self.max_nodes is not None and self.backtrack_count > self.max_nodes:
+            raise BudgetExhausted("max nodes reached (%d)" % self.max_nodes)
+        if self.backtrack_count % self.MAX_BACKTRACK_SLEEP == 0:
+            if self.deadline is not None and time.time() > self.deadline:
+                raise BudgetExhausted("deadline reached after %d backtrack" % self.backtrack_count)
+            if self.cooperative:
+                greenthread.sleep(0)
+
     def explain(self):
         """
         just render one solution with all version at once
@@ -321,15 +433,14 @@ class Solver(object):
     def backtrack(self, remaining_services, constraints, tmp_solution):
         if len(remaining_services) == 0:
             yield tmp_solution
-        self.backtrack_count += 1
-        if self.backtrack_count % self.MAX_BACKTRACK_SLEEP == 0:
-            greenthread.sleep(0)
+        self.visit_node()
         for i, (remaining_service, versions) in enumerate(remaining_services):
 
             for version_num, version in sorted(versions.items(), reverse=True):
                 living_solution = tmp_solution + [(remaining_service, version_num)]
                 for c in constraints:
                     if not c(remaining_service, version, living_solution):
+                        self.prune_count += 1
                         break
                 else:
                     # all check passed
@@ -340,6 +451,220 @@ class Solver(object):
                     )
 
 
+class SatSolver(Solver):
+    """
+    solve the catalog by compiling it into clauses over the (service, version) variables.
+
+    each requirement is evaluated once for each combination of versions of the services it reference, and each
+    combination which violate it become a nogood: a clause forbidding this combination. the search then pick
+    the services one by one (the one with the fewest versions left first) and each pick remove the versions
+    forbidden by the nogoods from the domains of the other services, stored as bitsets.
+
+    unlike :class:`Solver` the requirements are checked against the whole phase (as for :meth:`Solver.explain`)
+    and not against the services picked before, so two services which require each other give a valid phase.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SatSolver, self).__init__(*args, **kwargs)
+        self.services = []
+        self.versions = []
+        self.namespace = None
+
+    def compile_symbole_table(self):
+        symbol_table = super(SatSolver, self).compile_symbole_table()
+        self.namespace = symbol_table.get_namespace()
+        return symbol_table
+
+    def search(self, variables):
+        with debug_time(logger, 'compile_clauses', self.timings):
+            domains, watches = self.compile_clauses(variables)
+        nb_solutions = 0
+        with debug_time(logger, 'propagate', self.timings):
+            if domains is not None:
+                for solution in self.assign({}, domains, watches):
+                    nb_solutions += 1
+                    yield solution
+        logger.debug("%d solutions found in %d nodes", nb_solutions, self.backtrack_count)
+
+    def compile_clauses(self, variables):
+        """
+        build the domain of each service and the nogoods from the requirements and the extra constraints.
+        the versions are numbered from the newest (0) to the oldest in each service.
+
+        :return: the domains (one bitset per service) and the nogoods indexed by each of their literals.
+            the domains is None if the extra constraints can't be satisfied by any phase
+        :rtype: tuple[list[int], dict[tuple[int, int], list[tuple]]]
+        """
+        self.services = [service for service, _ in variables]
+        self.versions = [sorted(versions, key=version_sort_key, reverse=True) for _, versions in variables]
+        providers = index_providers(variables)
+
+        nogoods = []
+        for i, (service, versions) in enumerate(variables):
+            for j, number in enumerate(self.versions[i]):
+                for require in versions[number]['require']:
+                    nogoods.extend(self.violations(require, providers, {i: j}))
+        for require in self.extra_constraints_compiled:
+            nogoods.extend(self.violations(require, providers, {}))
+
+        domains = [(1 << len(versions)) - 1 for versions in self.versions]
+        watches = {}
+        for nogood in nogoods:
+            if len(nogood) == 0:
+                return None, watches
+            elif len(nogood) == 1:
+                i, j = nogood[0]
+                domains[i] &= ~(1 << j)
+            else:
+                for literal in nogood:
+                    watches.setdefault(literal, []).append(nogood)
+        logger.debug("%d nogoods compiled", len(nogoods))
+        return domains, watches
+
+    def violations(self, require, providers, fixed):
+        """
+        evaluate the requirement for all the versions of the services it reference and yield
+        the combinations which don't respect it. each evaluation count as a visited node for the budget.
+
+        :param require: the compiled requirement
+        :param dict providers: the index of services providing each names
+        :param dict fixed: the service/version already fixed (the one which require this)
+        :raise BudgetExhausted: if the deadline or the max number of nodes is reached
+        :return: generator of nogoods (sorted tuples of (service, version))
+        """
+        referenced = set()
+        for name in referenced_names(require.original_string):
+            referenced |= providers.get(context_key(self.namespace, name), set())
+        free = sorted(referenced - set(fixed))
+        for combination in itertools.product(*(range(len(self.versions[k])) for k in free)):
+            self.visit_node()
+            literals = dict(fixed)
+            literals.update(zip(free, combination))
+            provided = self.build_provided([
+                (self.services[k], self.versions[k][v]) for k, v in sorted(literals.items())
+            ])
+            try:
+                valid = require(provided)
+            except KeyError:
+                valid = False
+            except ScopeError as e:
+                self.anomalies.append({
+                    "expression": require.original_string,
+                    "service": [self.services[k]['name'] for k in fixed],
+                    "error": repr(e)
+                })
+                valid = False
+            if not valid:
+                yield tuple(sorted(literals.items()))
+
+    def assign(self, assignment, domains, watches):
+        """
+        pick the next service and try all his remaining versions
+        :param dict assignment: the version picked for each services
+        :param list[int] domains: the remaining versions of each services
+        :param dict watches: the nogoods of each literal
+        """
+        self.visit_node()
+        if len(assignment) == len(domains):
+            yield {
+                self.services[i]['name']: self.versions[i][j]
+                for i, j in sorted(assignment.items())
+            }
+            return
+        i = min((k for k in range(len(domains)) if k not in assignment), key=lambda k: bin(domains[k]).count('1'))
+        for j in range(len(self.versions[i])):
+            if not domains[i] >> j & 1:
+                continue
+            living_domains = list(domains)
+            living_domains[i] = 1 << j
+            assignment[i] = j
+            if self.forward_check((i, j), assignment, living_domains, watches):
+                yield from self.assign(assignment, living_domains, watches)
+            del assignment[i]
+
+    def forward_check(self, literal, assignment, domains, watches):
+        """
+        remove from the domains the versions forbidden by the nogoods of the newly assigned literal
+        :return: False if the assignment violate a nogood or leave a service without version
+        """
+        for nogood in watches.get(literal, ()):
+            unassigned = None
+            for k, v in nogood:
+                if k not in assignment:
+                    if unassigned is not None:
+                        break  # 2 free literals: nothing to deduce yet
+                    unassigned = (k, v)
+                elif assignment[k] != v:
+                    break  # already satisfied
+            else:
+                if unassigned is None:
+                    self.prune_count += 1
+                    return False
+                k, v = unassigned
+                if domains[k] >> v & 1:
+                    domains[k] &= ~(1 << v)
+                    self.prune_count += 1
+                    if domains[k] == 0:
+                        return False
+        return True
+
+
+SOLVER_BACKENDS = {
+    'backtrack': Solver,
+    'sat': SatSolver,
+}
+
+
+def solve_catalog(catalog, extra_constraints=tuple(), debug=False, deadline=None, max_nodes=None,
+                  backend=DEFAULT_SOLVER_BACKEND):
+    """
+    solve the given catalog and build the payload of :meth:`DependencySolver.solve_dependencies`.
+    this is a module level function to be picklable and executed in the process pool, so the search is not
+    cooperative (see :class:`Solver`).
+    """
+    try:
+        s = SOLVER_BACKENDS[backend](catalog, extra_constraints, debug=debug, deadline=deadline, max_nodes=max_nodes,
+                                     cooperative=False)
+        return {
+            "results": list(s.solve()),
+            "errors": [],
+            "anomalies": s.anomalies,
+            "exhaustive": s.exhaustive,
+            "stats": s.stats,
+        }
+    except ScopeError as e:
+        logger.exception("scope error")
+        return {
+            "results": [],
+            "errors": [
+                {"type": "missing scope",
+                 "str": str(e)
+                 }
+            ]
+        }
+
+
+class SolverBackendProvider(DependencyProvider):
+    """
+    provide the name of the solving backend given by the config ``solver_backend``.
+    an unknown backend fail at the setup of the service instead of in the solver process.
+    """
+
+    def __init__(self):
+        self.backend = None
+
+    def setup(self):
+        backend = self.container.config.get(SOLVER_BACKEND_CONFIG_KEY, DEFAULT_SOLVER_BACKEND)
+        if backend not in SOLVER_BACKENDS:
+            raise ValueError("unknown %s %r: must be one of %s" % (
+                SOLVER_BACKEND_CONFIG_KEY, backend, ', '.join(sorted(SOLVER_BACKENDS))
+            ))
+        self.backend = backend
+
+    def get_dependency(self, worker_ctx):
+        return self.backend
+
+
 class DependencySolver(BaseWorkerService):
     """
     this service use CSP and backtracking alogrithme to solve the best dependency for
@@ -353,12 +678,61 @@ class DependencySolver(BaseWorkerService):
     """
     name = 'dependency_solver'
 
+    solver_pool = ProcessPoolProvider()
+    """
+    the solving is cpu bound and would block the eventlet hub (and so the heartbeat/other rpc)
+    for the whole computation. it is executed in a pool of process instead.
+    """
+
+    solver_backend = SolverBackendProvider()
+    """
+    the name of the backend in :data:`SOLVER_BACKENDS`
+    """
+
+    mongo = Mongo(name)
+    """
+    results:
+        handle: str
+        page: int
+        results: [{$service: $version}]
+        date: datetime
+    """
+
+    # ####################################################
+    #   ONCE
+    # ####################################################
+
+    @once
+    @log_all
+    def create_index(self):
+        self.mongo.results.create_index([
+            ('handle', pymongo.ASCENDING),
+            ('page', pymongo.ASCENDING),
+        ],
+            background=True
+        )
+        ensure_ttl_index(
+            self.mongo.results,
+            'date',
+            self.config.get(RESULTS_TTL_CONFIG_KEY, DEFAULT_RESULTS_TTL),
+            background=True
+        )
+
+    # ####################################################
+    #   RPC
+    # ####################################################
+
     @rpc
     @log_all
-    def solve_dependencies(self, catalog, extra_constraints=tuple(), debug=False):
+    def solve_dependencies(self, catalog, extra_constraints=tuple(), debug=False, timeout=None, max_nodes=None,
+                           page_size=None):
         """
         build all possibles phases for the given catalog respecting given constraints.
 
+        the backends don't give the same solutions: «backtrack» add the services one by one and each one must have
+        his requirements provided by the services added before him, so two services which require each other are
+        never solved. «sat» check all the requirements against the whole phase, and accept them.
+
         :param list catalog: the catalog of micro-service, including there version, and for each the requirements and
                 what they provides::
 
@@ -370,26 +744,83 @@ class DependencySolver(BaseWorkerService):
                                           "'name' in myservice:rpc:hello:args"]
 
         :param list extra_constraints: list of extra constraints if required (same form as service's require)
-        :return: all possibles versions folowing the given constraints.
-        :rtype:   list of tuple with [0]=service data , [1]=version
+        :param float timeout: the max number of seconds to search for solutions. default to the
+            config ``solver_timeout``
+        :param int max_nodes: the max number of nodes to explore. default to no limit
+        :param str backend: not an argument: the solving backend is given by the config ``solver_backend``,
+            «backtrack» (default) or «sat». see :class:`Solver` and :class:`SatSolver`
+        :param int page_size: if given, only the first page of results is returned and the others
+            are kept for ``solver_results_ttl`` seconds to be fetched by :meth:`fetch_results`. the anomalies are
+            truncated to the page size. must be at least 1
+        :return: all possibles versions folowing the given constraints. if the budget (timeout/max_nodes) is
+            reached, the solutions found so far are returned with ``exhaustive`` set to False::
+
+                results: [{$service: $version}]
+                errors: []
+                anomalies: []
+                exhaustive: bool
+                stats:
+                    nodes: int
+                    prunings: int
+                    elapsed: {$phase: float}
+                # if page_size is given
+                handle: str  # the id to give to fetch_results, None if there is only one page
+                total: int  # the number of results
+                pages: int  # the number of pages
+                anomalies_count: int
         """
+        if page_size is not None and page_size < 1:
+            raise ValueError("page_size must be at least 1, got %r" % page_size)
+        if timeout is None:
+            timeout = self.config.get(SOLVER_TIMEOUT_CONFIG_KEY, DEFAULT_SOLVER_TIMEOUT)
         try:
-            s = Solver(catalog, extra_constraints, debug=debug)
-            return {
-                "results": list(s.solve()),
-                "errors": [],
-                "anomalies": s.anomalies
-            }
-        except ScopeError as e:
-            logger.exception("scope error")
+            solved = self.solver_pool.run(
+                solve_catalog, catalog, extra_constraints, debug,
+                deadline=time.time() + timeout,
+                max_nodes=max_nodes,
+                backend=self.solver_backend,
+                timeout=timeout + TIMEOUT_GRACE
+            )
+        except TimeoutError:
+            logger.error("the solver process did not respond in %ss", timeout + TIMEOUT_GRACE)
             return {
                 "results": [],
                 "errors": [
-                    {"type": "missing scope",
-                     "str": str(e)
+                    {"type": "timeout",
+                     "str": "no response from the solver in %ss" % (timeout + TIMEOUT_GRACE)
                      }
-                ]
+                ],
+                "anomalies": [],
+                "exhaustive": False,
             }
+        if page_size is not None:
+            return self._store_results(solved, page_size)
+        return solved
+
+    @rpc
+    @log_all
+    def fetch_results(self, handle, page):
+        """
+        return one page of the results of a paged :meth:`solve_dependencies`
+        :param str handle: the handle returned by solve_dependencies
+        :param int page: the page number (the page 0 was returned by solve_dependencies)
+        :return: the phases of this page, an empty list if this page don't exists or is expired
+        :rtype: list[dict]
+        """
+        stored = self.mongo.results.find_one({'handle': handle, 'page': page})
+        if stored is None:
+            logger.warning("no page %s for results %s", page, handle)
+            return []
+        return stored['results']
+
+    @rpc
+    @log_all
+    def drop_results(self, handle):
+        """
+        remove all pages of the given results before their expiration
+        :param str handle: the handle returned by solve_dependencies
+        """
+        self.mongo.results.delete_many({'handle': handle})
 
     @rpc
     @log_all
@@ -420,3 +851,33 @@ class DependencySolver(BaseWorkerService):
                      }
                 ]
             }
+
+    # ################################################
+    # private methodes
+    # ################################################
+
+    def _store_results(self, solved, page_size):
+        """
+        store all pages but the first of the results, and return the solved payload with only the first page
+        """
+        results = solved['results']
+        pages = [results[i:i + page_size] for i in range(0, len(results), page_size)] or [[]]
+        handle = None
+        if len(pages) > 1:
+            handle = uuid.uuid4().hex
+            now = datetime.datetime.utcnow()
+            self.mongo.results.insert_many([
+                {'handle': handle, 'page': number, 'results': page, 'date': now}
+                for number, page in enumerate(pages)
+                if number > 0
+            ])
+        anomalies = solved.get('anomalies', [])
+        return dict(
+            solved,
+            results=pages[0],
+            handle=handle,
+            total=len(results),
+            pages=len(pages),
+            anomalies=anomalies[:page_size],
+            anomalies_count=len(anomalies),
+        )
@@ -4,17 +4,30 @@ import json
 import logging
 import os
 import time
+from unittest import mock
 
 import pytest
+from nameko.testing.services import worker_factory
 
-from service.dependency_solver.dependency_solver import DependencySolver, Solver
+from common.constraints import build_symbol_table
+from common.dependency import ProcessPool, create_process_pool
+from service.dependency_solver.dependency_solver import (DependencySolver, SatSolver, Solver, SolverBackendProvider,
+                                                         collapse_versions, context_key, referenced_names,
+                                                         version_sort_key)
 
 logger = logging.getLogger(__name__)
 
 
 @pytest.fixture
-def dependency_solver():
-    service = DependencySolver()
+def process_pool():
+    executor = create_process_pool(2)
+    yield ProcessPool(executor)
+    executor.shutdown()
+
+
+@pytest.fixture
+def dependency_solver(process_pool):
+    service = worker_factory(DependencySolver, config={}, solver_pool=process_pool, solver_backend='backtrack')
     return service
 
 
@@ -288,6 +301,257 @@ class TestSolver:
         assert 0 == result
 
 
+class TestCollapse(object):
+
+    def test_collapse_same_dependencies(self):
+        catalog = copy.deepcopy(TestSolver.CATALOG1)
+        catalog[0]['versions'][3] = copy.deepcopy(catalog[0]['versions'][2])
+        catalog[0]['versions'][0] = copy.deepcopy(catalog[0]['versions'][2])
+        collapsed, classes = collapse_versions(catalog)
+        assert set(collapsed[0]['versions']) == {1, 3}
+        assert sorted(classes['service1'][3]) == [0, 2, 3]
+        assert set(collapsed[1]['versions']) == {1, 2}
+        # the original catalog is untouched
+        assert set(catalog[0]['versions']) == {0, 1, 2, 3}
+
+    def test_solve_expand_to_newest(self):
+        catalog = copy.deepcopy(TestSolver.CATALOG1)
+        catalog[0]['versions'][3] = copy.deepcopy(catalog[0]['versions'][2])
+        s = Solver(catalog, ())
+        assert list(s.solve()) == [{'service1': 3, 'service2': 2}, {'service1': 1, 'service2': 1}]
+
+    def test_version_sort_key(self):
+        assert sorted(['latest', '1.10.0', 'dev', '1.9.2'], key=version_sort_key) == \
+            ['dev', '1.9.2', '1.10.0', 'latest']
+
+
+class TestSatSolver(object):
+
+    def load_sample(self, sample):
+        with open(os.path.join(os.path.dirname(__file__), 'samples', sample)) as f:
+            return json.load(f)
+
+    def test_referenced_names(self):
+        assert referenced_names('"world" in service1:rpc:hello:args and not service2') == {
+            'service1:rpc:hello:args', 'service2'}
+
+    def test_context_key(self):
+        namespace = build_symbol_table(TestSolver.CATALOG1).get_namespace()
+        assert context_key(namespace, 'service1:rpc:hello') == 'service1:rpc:hello'
+        assert context_key(namespace, 'service1:rpc:hello:args') == 'service1:rpc:hello:args'
+        # existence check of a service or a path
+        assert context_key(namespace, 'service1') == 'service1'
+        assert context_key(namespace, 'service2:rpc:print') == 'print'
+        assert context_key(namespace, 'service3:rpc') is None
+
+    def test_violations_reference_only_providers(self):
+        catalog = copy.deepcopy(TestSolver.CATALOG1) + [
+            # provide the last part of service1:rpc:hello but is never read by it
+            {"name": "hello", "versions": {1: {"provide": {}, "require": []}, 2: {"provide": {}, "require": []}}},
+        ]
+        s = SatSolver(catalog, (), collapse=False)
+        variables = s.setup_variables()
+        s.compile_clauses(variables)
+        require = variables[1][1][1]['require'][1]
+        assert require.original_string == "service1:rpc:hello == 1"
+        nogoods = list(s.violations(require, {'service1:rpc:hello': {0}, 'hello': {2}}, {1: 1}))
+        assert nogoods == [((0, 0), (1, 1))]
+
+    @pytest.mark.parametrize("catalog,extra_constraints", [
+        (TestSolver.CATALOG1, ()),
+        (TestSolver.CATALOG1, ("service1:version == 1",)),
+        (TestSolver.CATALOG1, ("not service1",)),
+        (TestSolver.CATALOG_INSOLVABLE, ()),
+    ])
+    def test_same_solutions_as_backtrack(self, catalog, extra_constraints):
+        expected = list(Solver(copy.deepcopy(catalog), extra_constraints).solve())
+        solved = list(SatSolver(copy.deepcopy(catalog), extra_constraints).solve())
+        assert len(expected) == len(solved)
+        assert all(solution in expected for solution in solved)
+
+    def test_newest_first(self):
+        s = SatSolver(TestSolver.CATALOG1, ())
+        assert list(s.solve()) == [{'service1': 2, 'service2': 2}, {'service1': 1, 'service2': 1}]
+        assert s.exhaustive
+
+    def test_mutual_dependencies(self):
+        catalog = [
+            {"name": "a", "versions": {1: {"provide": {"a:rpc:ping": 1}, "require": ["b:rpc:ping"]}}},
+            {"name": "b", "versions": {1: {"provide": {"b:rpc:ping": 1}, "require": ["a:rpc:ping"]}}},
+        ]
+        assert list(SatSolver(catalog, ()).solve()) == [{'a': 1, 'b': 1}]
+        # the backtrack need one of them to be added before the other
+        assert list(Solver(copy.deepcopy(catalog), ()).solve()) == []
+
+    def test_rpc_backends_differ_on_mutual_dependencies(self, dependency_solver: DependencySolver):
+        catalog = [
+            {"name": "a", "versions": {1: {"provide": {"a:rpc:ping": 1}, "require": ["b:rpc:ping"]}}},
+            {"name": "b", "versions": {1: {"provide": {"b:rpc:ping": 1}, "require": ["a:rpc:ping"]}}},
+        ]
+        assert dependency_solver.solve_dependencies(catalog)['results'] == []
+        dependency_solver.solver_backend = 'sat'
+        assert dependency_solver.solve_dependencies(catalog)['results'] == [{'a': 1, 'b': 1}]
+
+    def test_sample1(self):
+        catalog = self.load_sample('sample1.json')[0]
+        expected = list(Solver(copy.deepcopy(catalog), []).solve())
+        s = SatSolver(catalog, [])
+        solved = list(s.solve())
+        assert len(solved) == 7
+        assert all(solution in expected for solution in solved)
+        assert s.anomalies == []
+
+    def test_sample2(self):
+        catalog = self.load_sample('sample2.json')
+        s = SatSolver(catalog, [])
+        begin = time.time()
+        solved = list(s.solve())
+        assert time.time() - begin < 5
+        assert len(solved) == 1
+        assert s.exhaustive
+
+    def test_rpc_backend_from_config(self, dependency_solver: DependencySolver):
+        dependency_solver.solver_backend = 'sat'
+        result = dependency_solver.solve_dependencies(TestSolver.CATALOG1)
+        assert result['results'] == [{'service1': 2, 'service2': 2}, {'service1': 1, 'service2': 1}]
+        assert 'compile_clauses' in result['stats']['elapsed']
+
+
+class TestSolverBackendProvider(object):
+
+    def provider(self, config):
+        provider = SolverBackendProvider()
+        container = mock.Mock(config=config)
+        provider.container = container
+        return provider, container
+
+    def test_default(self):
+        provider, container = self.provider({})
+        provider.setup()
+        assert provider.get_dependency(mock.Mock()) == 'backtrack'
+
+    def test_from_config(self):
+        provider, container = self.provider({'solver_backend': 'sat'})
+        provider.setup()
+        assert provider.get_dependency(mock.Mock()) == 'sat'
+
+    def test_unknown(self):
+        provider, container = self.provider({'solver_backend': 'minisat'})
+        with pytest.raises(ValueError):
+            provider.setup()
+
+
+class TestBudget(object):
+
+    def load_sample(self, sample):
+        with open(os.path.join(os.path.dirname(__file__), 'samples', sample)) as f:
+            return json.load(f)
+
+    def test_exhaustive(self):
+        s = Solver(TestSolver.CATALOG1, ())
+        assert len(list(s.solve())) == 2
+        assert s.exhaustive
+        assert s.stats['nodes'] > 0
+        assert s.stats['prunings'] > 0
+        assert set(s.stats['elapsed']) == {'collapse_versions', 'compile_symbole_table', 'compile_conditions',
+                                           'setup_variables', 'backtrack'}
+
+    def test_deadline_reached(self):
+        s = Solver(TestSolver.CATALOG1, (), deadline=time.time() - 1)
+        s.MAX_BACKTRACK_SLEEP = 1
+        assert list(s.solve()) == []
+        assert not s.exhaustive
+
+    def test_not_cooperative(self):
+        s = Solver(TestSolver.CATALOG1, (), cooperative=False)
+        s.MAX_BACKTRACK_SLEEP = 1
+        with mock.patch('service.dependency_solver.dependency_solver.greenthread.sleep') as sleep:
+            assert len(list(s.solve())) == 2
+        sleep.assert_not_called()
+
+    def test_max_nodes_keep_best_so_far(self):
+        catalog = self.load_sample('sample1.json')[0]
+        s = Solver(catalog, [], max_nodes=100)
+        solved = list(s.solve())
+        assert not s.exhaustive
+        assert 0 < len(solved) < 7
+        assert solved[0] == {
+            'http_to_rpc': '0.1.19',
+            'joboffer_algolia_publisher': '0.1.24',
+            'joboffer_fetcher': '0.1.19',
+            'joboffer_xml_publisher': '0.1.24',
+            'maiev': '1.2.0',
+            'yupeeposting-backend': '0.2.62',
+            'yupeeposting-webui': '0.2.57'}
+
+    def test_sat_budget_checked_while_compiling(self):
+        catalog = self.load_sample('sample1.json')[0]
+        s = SatSolver(catalog, [], max_nodes=10)
+        assert list(s.solve()) == []
+        assert not s.exhaustive
+        # stopped before the search
+        assert 'propagate' not in s.stats['elapsed']
+
+    def test_sat_deadline_while_compiling(self):
+        s = SatSolver(TestSolver.CATALOG1, (), deadline=time.time() - 1)
+        s.MAX_BACKTRACK_SLEEP = 1
+        assert list(s.solve()) == []
+        assert not s.exhaustive
+
+    def test_rpc_timeout(self, dependency_solver: DependencySolver):
+        catalog = self.load_sample('sample1.json')[0]
+        begin = time.time()
+        result = dependency_solver.solve_dependencies(catalog, timeout=0.5)
+        assert time.time() - begin < 3
+        assert result['errors'] == []
+        assert result['exhaustive'] is False
+
+    def test_rpc_in_process_pool(self, dependency_solver: DependencySolver):
+        result = dependency_solver.solve_dependencies(TestSolver.CATALOG1)
+        assert result['results'][0] == {'service1': 2, 'service2': 2}
+        assert result['errors'] == []
+        assert result['exhaustive'] is True
+        assert result['stats']['nodes'] > 0
+
+
+class TestPagedResults(object):
+
+    def test_paged(self, dependency_solver: DependencySolver):
+        result = dependency_solver.solve_dependencies(TestSolver.CATALOG1, page_size=1)
+        assert result['results'] == [{'service1': 2, 'service2': 2}]
+        assert result['total'] == 2
+        assert result['pages'] == 2
+        assert result['handle'] is not None
+        stored = dependency_solver.mongo.results.insert_many.call_args[0][0]
+        assert len(stored) == 1
+        assert stored[0]['handle'] == result['handle']
+        assert stored[0]['page'] == 1
+        assert stored[0]['results'] == [{'service1': 1, 'service2': 1}]
+
+    def test_single_page(self, dependency_solver: DependencySolver):
+        result = dependency_solver.solve_dependencies(TestSolver.CATALOG1, page_size=10)
+        assert len(result['results']) == 2
+        assert result['handle'] is None
+        assert result['pages'] == 1
+        dependency_solver.mongo.results.insert_many.assert_not_called()
+
+    @pytest.mark.parametrize('page_size', [0, -1])
+    def test_bad_page_size(self, page_size, dependency_solver: DependencySolver):
+        with pytest.raises(ValueError):
+            dependency_solver.solve_dependencies(TestSolver.CATALOG1, page_size=page_size)
+        dependency_solver.mongo.results.insert_many.assert_not_called()
+
+    def test_fetch_results(self, dependency_solver: DependencySolver):
+        dependency_solver.mongo.results.find_one.return_value = {
+            'handle': 'abc', 'page': 1, 'results': [{'service1': 1, 'service2': 1}]}
+        assert dependency_solver.fetch_results('abc', 1) == [{'service1': 1, 'service2': 1}]
+        dependency_solver.mongo.results.find_one.assert_called_with({'handle': 'abc', 'page': 1})
+
+    def test_fetch_expired_results(self, dependency_solver: DependencySolver):
+        dependency_solver.mongo.results.find_one.return_value = None
+        assert dependency_solver.fetch_results('abc', 1) == []
+
+
 class TestExplain(object):
 
     def test_explain_1(self):
@@ -321,15 +585,15 @@ class TestPerfRealData(object):
     def test_solve_dependency_1(self, dependency_solver: DependencySolver):
         payload = self.load_sample('sample1.json')
         result = dependency_solver.solve_dependencies(*payload)
-        assert len(result['results']) == 96
+        assert len(result['results']) == 7
         assert result['results'][-1] == {
             'http_to_rpc': '0.1.19',
             'joboffer_algolia_publisher': '0.1.24',
-            'joboffer_fetcher': '0.1.22',
+            'joboffer_fetcher': '0.1.24',
             'joboffer_xml_publisher': '0.1.19',
             'maiev': '1.2.0',
-            'yupeeposting-backend': '0.2.55',
-            'yupeeposting-webui': '0.2.56'}
+            'yupeeposting-backend': '0.2.62',
+            'yupeeposting-webui': '0.2.57'}
         assert result['anomalies'] == []
         assert result['errors'] == []
 
@@ -356,7 +620,7 @@ class TestPerfRealData(object):
         solved = list(s.solve())
         end = time.time()
 
-        assert len(solved) == 96
+        assert len(solved) == 7
         assert solved[0] == {
             'http_to_rpc': '0.1.19',
             'joboffer_algolia_publisher': '0.1.24',
@@ -368,10 +632,17 @@ class TestPerfRealData(object):
         elapsed = end - begin
         assert elapsed < 25
 
+    def test_collapsed_solutions_are_newest_of_all_solutions(self):
+        catalog = self.load_sample('sample1.json')[0]
+        collapsed = list(Solver(catalog, []).solve())
+        full = list(Solver(catalog, [], collapse=False).solve())
+        assert len(full) == 96
+        assert all(solution in full for solution in collapsed)
+
     def test_solve_dep_memory_consumption(self):
         catalog = self.load_sample('sample1.json')[0]
         s = Solver(catalog, [], debug=True)
         solved = list(s.solve())
-        assert len(solved) == 96
+        assert len(solved) == 7
         encoded = json.dumps(solved).encode('utf8')
         assert len(encoded) < 1024 * 21  # 21k
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+
+logger = logging.getLogger(__name__)
+
+# default values, each one can be overriden by the same key in the scale_config of the service
+DEFAULT_SCALE_CONTROL = {
+    # seconds to wait after a scale before scaling up again
+    'cooldown_up': 30,
+    # seconds to wait after a scale before scaling down
+    'cooldown_down': 300,
+    # seconds during which the scale down must be requested before it is done
+    'scale_down_delay': 60,
+    # max number of scale in «scale_changes_window» seconds
+    'max_scale_changes': 6,
+    'scale_changes_window': 600,
+}
+
+# a scale not seen by the overseer after this delay (seconds) is considered lost
+PENDING_SCALE_TIMEOUT = 120
+
+
+class ScaleController(object):
+    """
+    decide if a new scale can be done for a service, to prevent it to oscillate.
+
+    - only one scale at a time: a scale is pending until the service_updated event show the service at the
+      asked replicas and not updating.
+    - cooldown after each scale, shorter for the scale up than for the scale down
+    - the scale down must be requested for a while before it is done (not the scale up)
+    - a max number of scales in a time window
+
+    the state is stored in the service as «scaling»::
+
+        pending:  # the scale in flight, or None
+            to: 3
+            date: $date
+            trace: $trace_id  # the id of the trace of the decision
+        last_change:
+            from: 2
+            to: 3
+            date: $date
+        changes: [$date]  # the date of the scales in the current window
+        down_since: $date  # the first date of the current scale down requests, or None
+
+    """
+
+    def __init__(self, state=None, scale_config=None):
+        """
+        :param dict state: the «scaling» of the service. it is updated in place
+        :param dict scale_config: the scale_config of the service
+        """
+        self.state = state if state is not None else {}
+        self.state.setdefault('pending', None)
+        self.state.setdefault('last_change', None)
+        self.state.setdefault('changes', [])
+        self.state.setdefault('down_since', None)
+        scale_config = scale_config or {}
+        self.config = {k: scale_config.get(k, default) for k, default in DEFAULT_SCALE_CONTROL.items()}
+
+    def observe_ruleset(self, scale_down, now):
+        """
+        keep the date since which the scale down is requested
+        :param bool scale_down: the current value of the scale down rule
+        :param datetime.datetime now: the current date
+        """
+        if not scale_down:
+            self.state['down_since'] = None
+        elif self.state['down_since'] is None:
+            self.state['down_since'] = now
+
+    def observe_service(self, mode, diff, now):
+        """
+        end the pending scale if the service reached the asked replicas
+        :param dict mode: the mode of the service, as given by the overseer
+        :param dict diff: the diff of the service_updated event
+        :param datetime.datetime now: the current date
+        :return: the pending scale which ended, or None
+        """
+        pending = self.state['pending']
+        if pending is None:
+            return None
+        updating = diff.get('state', {}).get('to') == 'updating'
+        if mode.get('replicas') == pending['to'] and not updating:
+            logger.debug("scale to %s done in %s", pending['to'], now - pending['date'])
+            self.state['pending'] = None
+            return pending
+        return None
+
+    def allow(self, current, best, now):
+        """
+        check if the service can be scaled from current to best now
+        :return: True if the scale can be done, and the reason if it can't
+        :rtype: tuple[bool, str]
+        """
+        pending = self.state['pending']
+        if pending is not None:
+            if (now - pending['date']).total_seconds() < PENDING_SCALE_TIMEOUT:
+                return False, "scale to %s still pending" % pending['to']
+            logger.warning("scale to %s was never seen, it is ignored", pending['to'])
+            self.state['pending'] = None
+
+        last_change = self.state['last_change']
+        cooldown = self.config['cooldown_up'] if best > current else self.config['cooldown_down']
+        if last_change is not None and (now - last_change['date']).total_seconds() < cooldown:
+            return False, "cooldown of %ss since last scale" % cooldown
+
+        if best < current:
+            down_since = self.state['down_since']
+            if down_since is None or (now - down_since).total_seconds() < self.config['scale_down_delay']:
+                return False, "scale down requested since less than %ss" % self.config['scale_down_delay']
+
+        window_start = now - datetime.timedelta(seconds=self.config['scale_changes_window'])
+        self.state['changes'] = [d for d in self.state['changes'] if d > window_start]
+        changes = len(self.state['changes'])
+        if changes >= self.config['max_scale_changes']:
+            return False, "%d scales in the last %ss" % (changes, self.config['scale_changes_window'])
+        return True, None
+
+    def record(self, current, best, now, trace_id=None):
+        """
+        record a scale sent to the overseer
+        """
+        self.state['pending'] = {'to': best, 'date': now, 'trace': trace_id}
+        self.state['last_change'] = {'from': current, 'to': best, 'date': now}
+        self.state['changes'].append(now)
+        if best < current:
+            self.state['down_since'] = None
@@ -1,18 +1,59 @@
 # -*- coding: utf-8 -*-
 import datetime
 import logging
+import math
+import time
 
 from nameko.events import SERVICE_POOL, event_handler
 from nameko.exceptions import UnknownService
 from nameko.rpc import RpcProxy, rpc
 from nameko.timer import timer
+from pymongo import ASCENDING, DESCENDING
 
 from common.base import BaseWorkerService
 from common.db.mongo import Mongo
+from common.entrypoint import once
+from common.trace import add_hop, hop_latencies, new_trace
 from common.utils import filter_dict, log_all
+from service.load_manager.controller import ScaleController
 
 logger = logging.getLogger(__name__)
 
+# a ruleset which ask for a scale is executed again after this delay (seconds) if it did not changed
+RECHECK_DELAY = 30
+
+# the decisions are kept this number of seconds
+DECISIONS_TTL = 7 * 24 * 3600
+
+# the number of seconds to drain the waiting messages if the scale_config don't give «target_latency»
+DEFAULT_TARGET_LATENCY = 10
+
+
+def predict_replicas(metrics, current, target_latency=DEFAULT_TARGET_LATENCY):
+    """
+    compute the number of replicas needed to handle the incoming calls and drain the waiting ones in
+    «target_latency» seconds, assuming each replica execute as many calls as the current ones.
+
+    >>> predict_replicas({'call_rate': 10, 'exec_rate': 10, 'waiting': 1000, 'consumers': 2}, 2)
+    22
+
+    :param dict metrics: the last metrics of the resource (call_rate, exec_rate, waiting, consumers)
+    :param int current: the current number of replicas
+    :param float target_latency: the max number of seconds to drain the waiting calls
+    :return: the number of replicas, or None if the metrics can't tell (no replicas or no calls executed)
+    :rtype: int|None
+    """
+    try:
+        call_rate, exec_rate = metrics['call_rate'], metrics['exec_rate']
+        waiting, consumers = metrics['waiting'], metrics['consumers']
+    except (KeyError, TypeError):
+        return None
+    if not current or not consumers or not exec_rate or exec_rate <= 0:
+        return None
+    replica_rate = exec_rate / current
+    needed_rate = call_rate + waiting / target_latency
+    return int(math.ceil(needed_rate / replica_rate))
+
 
 class LoadManager(BaseWorkerService):
     """
@@ -50,6 +91,22 @@ class LoadManager(BaseWorkerService):
     :type: service.overseer.overseer.Overseer
     """
 
+    @once
+    @log_all
+    def create_index(self):
+        self.mongo.services.create_index('name', background=True)
+        self.mongo.services.create_index([('next_recheck_at', ASCENDING)], sparse=True, background=True)
+        # services saved before next_recheck_at existed
+        self.mongo.services.update_many(
+            {
+                'next_recheck_at': {'$exists': False},
+                '$or': [{'latest_ruleset.rule.__scale_up__': True}, {'latest_ruleset.rule.__scale_down__': True}],
+            },
+            {'$set': {'next_recheck_at': datetime.datetime.now()}}
+        )
+        self.mongo.decisions.create_index('trace', background=True)
+        self.mongo.decisions.create_index('date', expireAfterSeconds=DECISIONS_TTL, background=True)
+
     @event_handler(
         'trigger', 'ruleset_triggered', handler_type=SERVICE_POOL
     )
@@ -62,18 +119,24 @@ class LoadManager(BaseWorkerService):
             {
                 'ruleset': {'owner': ..., 'name': ..., },
                 'rules_stats': {'rule1': True, 'rule2': False},
+                'trace': {'id': ..., 'hops': [...]},  # optional, see common.trace
             }
 
         """
-        assert set(payload.keys()) <= {'ruleset', 'rules_stats'}, \
+        assert set(payload.keys()) <= {'ruleset', 'rules_stats', 'trace'}, \
             'the payload does not contains the required keys'
         ruleset = payload['ruleset']
 
         if ruleset.get('owner') == self.name and ruleset.get('name'):
             service = self._get_service(ruleset['name'])
+            service['latest_metrics'] = {
+                resource['name']: resource['history']['last_metrics']
+                for resource in ruleset.get('resources', ())
+                if 'last_metrics' in resource.get('history', {})
+            }
             ruleset = payload['rules_stats']
             logger.debug("ruleset triggered by event for service %s: %s", service['name'], ruleset)
-            self._execute_ruleset(ruleset, service)
+            self._execute_ruleset(ruleset, service, trace=add_hop(payload.get('trace'), self.name))
 
     @event_handler(
         'overseer', 'service_updated', handler_type=SERVICE_POOL
@@ -87,35 +150,44 @@ class LoadManager(BaseWorkerService):
             logger.debug("detected unmonitored service update")
             return  # this service is not monitored by us
 
+        changes = {}
         if 'scale' in diff or 'mode' in diff:
-            my_service['mode'] = service['mode']
+            changes['mode'] = service['mode']
+        controller = ScaleController(my_service.get('scaling'), my_service.get('scale_config'))
+        done = controller.observe_service(service['mode'], diff, datetime.datetime.now())
+        changes['scaling'] = controller.state
+        if done is not None and done.get('trace'):
+            # the last hop of the decision: the scale is visible
+            self.mongo.decisions.update_one({'trace': done['trace']}, {'$push': {'hops': ['converged', time.time()]}})
         if 'scale_config' in diff and 'scale' in service['scale_config']:
             logger.debug("detected new scale config for service %s", service['name'])
-            my_service['scale_config'] = service['scale_config']
+            changes['scale_config'] = service['scale_config']
             self._set_trigger_rules(service['name'], service['scale_config']['scale'])
 
-        self.mongo.services.update(
-            {'name': service['name']},
-            my_service,
-            upsert=True,
-        )
+        # only our fields: next_recheck_at/latest_ruleset may be updated by a ruleset meanwhile
+        self.mongo.services.update_one({'name': service['name']}, {'$set': changes})
 
     @timer(interval=15)
     @log_all
     def recheck_rules(self):
         now = datetime.datetime.now()
-        for service in self._get_services():
-
-            try:
-                latest_ruleset = service['latest_ruleset']
-                rule, date = latest_ruleset['rule'], latest_ruleset['date']
-            except KeyError:
-                continue
-            seconds = (now - date).total_seconds()
-            if (rule['__scale_up__'] or rule['__scale_down__']) and seconds > 30:
-                logger.debug("reexecuting ruleset for service %s because fixed since %s sec: rulset=%s",
-                             service['name'], seconds, rule)
-                self._execute_ruleset(rule, service)
+        scales = {}
+        for service in self.mongo.services.find({'next_recheck_at': {'$lte': now}}):
+            latest_ruleset = service['latest_ruleset']
+            rule, date = latest_ruleset['rule'], latest_ruleset['date']
+            logger.debug("reexecuting ruleset for service %s because fixed since %s sec: rulset=%s",
+                         service['name'], (now - date).total_seconds(), rule)
+            self._execute_ruleset(rule, service, scales=scales)
+        if scales:
+            # all the scales of this check are sent at once
+            errors = self.overseer.scale_many(scales)
+            if errors:
+                logger.error("overseer failed to scale the services: %s", errors)
+                # those scales will never be seen: the services can be scaled again at the next check
+                self.mongo.services.update_many(
+                    {'name': {'$in': list(errors)}},
+                    {'$set': {'scaling.pending': None}},
+                )
 
     @rpc
     @log_all
@@ -152,6 +224,34 @@ class LoadManager(BaseWorkerService):
         """
         return [filter_dict(s) for s in self.mongo.services.find()]
 
+    @rpc
+    @log_all
+    def list_decisions(self, service_name=None, limit=50):
+        """
+        list the latest scales decided, with the time spent between each hop from the metrics to the
+        replicas changed.
+        :param service_name: the service's name, or None for all services
+        :param limit: the max number of decisions
+        :return: the decisions, newest first::
+
+            - trace: $id
+              service: $name
+              from: 2
+              to: 4
+              rules: {"__scale_up__": true, ...}
+              date: $date
+              hops: [[monitorer_rabbitmq, $timestamp], [trigger, $timestamp], ...]
+              latencies: [[trigger, 0.1], ...]  # seconds since the previous hop
+              total: 4.2  # seconds since the first hop
+        """
+        query = {'service': service_name} if service_name else {}
+        res = []
+        for decision in self.mongo.decisions.find(query).sort('date', DESCENDING).limit(limit):
+            decision = filter_dict(decision)
+            decision.update(hop_latencies(decision))
+            res.append(decision)
+        return res
+
     @rpc
     @log_all
     def get_service(self, service_name):
@@ -189,6 +289,10 @@ class LoadManager(BaseWorkerService):
                     }
                 },
                 "name": "producer",
+                "latest_metrics": {
+                    "rmq": {"waiting": 0, "latency": 0, "rate": 0, "call_rate": 2.4, "exec_rate": 2.4,
+                            "consumers": 2}
+                },
                 "latest_ruleset": {
                     "date": ISODate("2018-05-03T14:19:19.596Z"),
                     "rule": {
@@ -198,7 +302,8 @@ class LoadManager(BaseWorkerService):
                         "stable_latency": true, "__scale_up__": false,
                         "__scale_down__": true
                     }
-                }
+                },
+                "next_recheck_at": ISODate("2018-05-03T14:19:49.596Z")
             }
 
         :param service_name:
@@ -206,9 +311,6 @@ class LoadManager(BaseWorkerService):
         """
         return self.mongo.services.find_one({'name': service_name})
 
-    def _get_services(self):
-        return self.mongo.services.find()
-
     # #######################################
     # privates functions
     # #######################################
@@ -250,7 +352,7 @@ class LoadManager(BaseWorkerService):
         except UnknownService:
             logger.error("trigger service is not available. can't set the rules")
 
-    def _execute_ruleset(self, ruleset_status, service):
+    def _execute_ruleset(self, ruleset_status, service, scales=None, trace=None):
         """
         execute the ruleset status by scaling the service
         :param ruleset_status: the ruleset status given by the trigger ie::
@@ -263,12 +365,12 @@ class LoadManager(BaseWorkerService):
             }
 
         :param dict service: the service to change
+        :param dict scales: if given, the new scale is added to it (service name => replicas) instead of being
+            sent to the overseer.
+        :param dict trace: the trace of the event which triggered this ruleset. a new one is started if None
         """
-        service['latest_ruleset'] = {"date": datetime.datetime.now(), "rule": ruleset_status}
-        self.mongo.services.update(
-            {'name': service['name']},
-            service
-        )
+        now = datetime.datetime.now()
+        service['latest_ruleset'] = {"date": now, "rule": ruleset_status}
 
         if ruleset_status.get('__scale_up__'):
             delta = +1
@@ -277,14 +379,61 @@ class LoadManager(BaseWorkerService):
         else:
             delta = 0
 
+        controller = ScaleController(service.get('scaling'), service.get('scale_config'))
+        controller.observe_ruleset(delta < 0, now)
         current, best = self._get_best_scale(service, delta=delta)
+        scale = False
         if current != best:
+            scale, reason = controller.allow(current, best, now)
+            if scale:
+                trace = trace or new_trace(self.name)
+                controller.record(current, best, now, trace_id=trace['id'])
+            else:
+                logger.debug("rules triggered new scale for %s: %s => %s delayed: %s",
+                             service['name'], current, best, reason)
+        service['scaling'] = controller.state
+        update = {
+            '$set': {
+                'latest_ruleset': service['latest_ruleset'],
+                'latest_metrics': service.get('latest_metrics', {}),
+                'scaling': service['scaling'],
+            },
+        }
+        if delta:
+            # the ruleset will be executed again by recheck_rules if it don't change
+            update['$set']['next_recheck_at'] = now + datetime.timedelta(seconds=RECHECK_DELAY)
+        else:
+            update['$unset'] = {'next_recheck_at': ''}
+        self.mongo.services.update_one({'name': service['name']}, update)
+        if scale:
             logger.info("rules triggered new scale: %s => %s", current, best)
-            self.overseer.scale(service['name'], scale=best)
+            if scales is not None:
+                scales[service['name']] = best
+            else:
+                trace = self.overseer.scale(service['name'], scale=best, trace=trace) or trace
+            self._record_decision(service, ruleset_status, current, best, trace)
+
+    def _record_decision(self, service, ruleset_status, current, best, trace):
+        """
+        store the scale decided for the service, see :meth:`list_decisions`
+        """
+        self.mongo.decisions.insert_one({
+            'trace': trace['id'],
+            'service': service['name'],
+            'from': current,
+            'to': best,
+            'rules': ruleset_status,
+            'date': datetime.datetime.now(),
+            'hops': trace['hops'],
+        })
 
     def _get_best_scale(self, service, delta=0):
         """
         return the best scale value for a service.
+        the scale move at least by «delta», or directly to the number of replicas predicted from
+        the latest metrics of the service (see :func:`predict_replicas`) if it is farther.
+        the time to drain the waiting calls is given by the «target_latency» of the scale_config.
+
         :param service: the service to compute
         :param delta: the +1 or -1 if the service is in load or not
         :return: the current scale value and the best one
@@ -296,8 +445,16 @@ class LoadManager(BaseWorkerService):
         if mode['name'] == 'replicated':
             current = mode['replicas']
 
-            # TODO: compute for load here
             best = current + delta
+            predictions = [
+                predict_replicas(metrics, current, scale_config.get('target_latency') or DEFAULT_TARGET_LATENCY)
+                for metrics in (service.get('latest_metrics') or {}).values()
+            ]
+            predictions = [p for p in predictions if p is not None]
+            if predictions and delta > 0:
+                best = max(best, max(predictions))
+            elif predictions and delta < 0:
+                best = min(best, max(predictions))
             # respect max/min from scale_config
             best = max((best, scale_config.get('min', 0)))
             best = min((best, scale_config.get('max', 99)))
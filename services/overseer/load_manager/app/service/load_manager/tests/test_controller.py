@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import datetime
+import logging
+
+import pytest
+
+from service.load_manager.controller import ScaleController
+
+logger = logging.getLogger(__name__)
+
+
+def at(seconds):
+    return datetime.datetime(2018, 1, 1) + datetime.timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def controller():
+    return ScaleController(scale_config={
+        'cooldown_up': 30,
+        'cooldown_down': 300,
+        'scale_down_delay': 60,
+        'max_scale_changes': 3,
+        'scale_changes_window': 600,
+    })
+
+
+class TestScaleController(object):
+
+    def test_first_scale_up(self, controller):
+        assert controller.allow(2, 3, at(0)) == (True, None)
+
+    def test_pending(self, controller):
+        controller.record(2, 3, at(0))
+        assert not controller.allow(3, 4, at(40))[0]
+
+        controller.observe_service({'name': 'replicated', 'replicas': 3}, {'state': {'to': 'updating'}}, at(41))
+        assert not controller.allow(3, 4, at(42))[0]
+
+        controller.observe_service({'name': 'replicated', 'replicas': 3}, {'state': {'to': 'completed'}}, at(43))
+        assert controller.allow(3, 4, at(44))[0]
+
+    def test_pending_lost(self, controller):
+        controller.record(2, 3, at(0))
+        assert controller.allow(3, 4, at(200))[0]
+
+    def test_asymmetric_cooldown(self, controller):
+        controller.record(2, 3, at(0))
+        controller.observe_service({'replicas': 3}, {}, at(1))
+        controller.observe_ruleset(True, at(0))
+
+        assert not controller.allow(3, 4, at(20))[0]
+        assert controller.allow(3, 4, at(31))[0]
+        assert not controller.allow(3, 2, at(200))[0]
+        assert controller.allow(3, 2, at(301))[0]
+
+    def test_scale_down_delay(self, controller):
+        controller.observe_ruleset(True, at(0))
+        assert not controller.allow(3, 2, at(30))[0]
+        controller.observe_ruleset(False, at(40))
+        controller.observe_ruleset(True, at(50))
+        assert not controller.allow(3, 2, at(70))[0]
+        assert controller.allow(3, 2, at(111))[0]
+
+    def test_rate_limit(self, controller):
+        for i in range(3):
+            controller.record(i, i + 1, at(i * 100))
+            controller.observe_service({'replicas': i + 1}, {}, at(i * 100 + 1))
+        assert not controller.allow(3, 4, at(500))[0]
+        # the first scale leave the window
+        assert controller.allow(3, 4, at(601))[0]
+
+    def test_defaults(self):
+        controller = ScaleController({'pending': None, 'changes': []}, {'cooldown_up': 5})
+        assert controller.config['cooldown_up'] == 5
+        assert controller.config['cooldown_down'] == 300
+        assert controller.state['down_since'] is None
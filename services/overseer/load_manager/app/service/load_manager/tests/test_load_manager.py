@@ -1,13 +1,220 @@
 # -*- coding: utf-8 -*-
+import datetime
 import logging
 
 import mock
 # other MS
 import pytest
 
+from service.load_manager.load_manager import LoadManager, predict_replicas
+
 logger = logging.getLogger(__name__)
 
 
 def test_load_manager_method():
 
     assert 1 + 1 == 2
+
+
+@pytest.fixture
+def load_manager():
+    service = LoadManager()
+    service.config = {}
+    service.mongo = mock.Mock()
+    service.overseer = mock.Mock()
+    service.overseer.scale.return_value = None
+    service.trigger = mock.Mock()
+    return service
+
+
+def metrics(call_rate=10, exec_rate=10, waiting=0, consumers=2):
+    return {'call_rate': call_rate, 'exec_rate': exec_rate, 'waiting': waiting, 'consumers': consumers}
+
+
+def service(replicas=2, latest_metrics=None, **scale_config):
+    return {
+        'name': 'producer',
+        'mode': {'name': 'replicated', 'replicas': replicas},
+        'scale_config': dict({'min': 1, 'max': 20}, **scale_config),
+        'latest_metrics': latest_metrics or {},
+    }
+
+
+class TestPredictReplicas(object):
+
+    @pytest.mark.parametrize('m,current,expected', [
+        (metrics(), 2, 2),
+        (metrics(waiting=1000), 2, 22),
+        (metrics(call_rate=0, exec_rate=5), 2, 0),
+        (metrics(consumers=0), 2, None),
+        (metrics(exec_rate=0), 2, None),
+        (metrics(), 0, None),
+        ({}, 2, None),
+    ])
+    def test_predict(self, m, current, expected):
+        assert predict_replicas(m, current) == expected
+
+
+class TestBestScale(object):
+
+    def test_no_metrics(self, load_manager):
+        assert load_manager._get_best_scale(service(), delta=1) == (2, 3)
+        assert load_manager._get_best_scale(service(), delta=-1) == (2, 1)
+
+    def test_jump_on_burst(self, load_manager):
+        s = service(latest_metrics={'rmq': metrics(waiting=1000)})
+        assert load_manager._get_best_scale(s, delta=1) == (2, 20)
+
+    def test_target_latency(self, load_manager):
+        s = service(latest_metrics={'rmq': metrics(waiting=1000)}, target_latency=100)
+        assert load_manager._get_best_scale(s, delta=1) == (2, 4)
+
+    def test_scale_down(self, load_manager):
+        s = service(replicas=10, latest_metrics={'rmq': metrics(call_rate=5, exec_rate=50, consumers=10)})
+        assert load_manager._get_best_scale(s, delta=-1) == (10, 1)
+
+    def test_no_trigger(self, load_manager):
+        s = service(latest_metrics={'rmq': metrics(waiting=1000)})
+        assert load_manager._get_best_scale(s, delta=0) == (2, 2)
+
+    def test_ruleset_triggered_use_metrics(self, load_manager):
+        load_manager.mongo.services.find_one.return_value = service()
+        load_manager.on_ruleset_triggered({
+            'ruleset': {
+                'owner': 'overseer_load_manager',
+                'name': 'producer',
+                'resources': [{'name': 'rmq', 'history': {'last_metrics': metrics(waiting=100)}}],
+            },
+            'rules_stats': {'__scale_up__': True, '__scale_down__': False},
+        })
+        load_manager.overseer.scale.assert_called_once_with('producer', scale=4, trace=mock.ANY)
+
+    def test_scale_delayed_while_pending(self, load_manager):
+        s = service()
+        load_manager._execute_ruleset({'__scale_up__': True, '__scale_down__': False}, s)
+        load_manager._execute_ruleset({'__scale_up__': True, '__scale_down__': False}, s)
+
+        load_manager.overseer.scale.assert_called_once_with('producer', scale=3, trace=mock.ANY)
+        assert s['scaling']['pending']['to'] == 3
+
+    def test_service_updated_end_pending(self, load_manager):
+        s = service()
+        s['scaling'] = {'pending': {'to': 3, 'date': datetime.datetime.now()}}
+        load_manager.mongo.services.find_one.return_value = s
+
+        load_manager.on_service_updated({
+            'service': {'name': 'producer', 'mode': {'name': 'replicated', 'replicas': 3}},
+            'diff': {'scale': {'from': 2, 'to': 3}},
+        })
+
+        query, update = load_manager.mongo.services.update_one.call_args[0]
+        assert query == {'name': 'producer'}
+        # the other fields (next_recheck_at, latest_ruleset...) are left as is
+        assert set(update) == {'$set'}
+        assert set(update['$set']) == {'mode', 'scaling'}
+        assert update['$set']['scaling']['pending'] is None
+        assert update['$set']['mode']['replicas'] == 3
+
+    def test_recheck_batched(self, load_manager):
+        old = datetime.datetime.now() - datetime.timedelta(seconds=60)
+        services = []
+        for name, rule in [('producer', {'__scale_up__': True, '__scale_down__': False}),
+                           ('consumer', {'__scale_up__': True, '__scale_down__': False}),
+                           ('stable', {'__scale_up__': False, '__scale_down__': False})]:
+            s = service()
+            s['name'] = name
+            s['latest_ruleset'] = {'date': old, 'rule': rule}
+            services.append(s)
+        load_manager.mongo.services.find.return_value = services
+        load_manager.overseer.scale_many.return_value = {}
+
+        load_manager.recheck_rules()
+
+        load_manager.overseer.scale_many.assert_called_once_with({'producer': 3, 'consumer': 3})
+        load_manager.overseer.scale.assert_not_called()
+        load_manager.mongo.services.update_many.assert_not_called()
+
+    def test_recheck_failed_scale_not_pending(self, load_manager):
+        s = service()
+        s['latest_ruleset'] = {'date': datetime.datetime.now() - datetime.timedelta(seconds=60),
+                               'rule': {'__scale_up__': True, '__scale_down__': False}}
+        load_manager.mongo.services.find.return_value = [s]
+        load_manager.overseer.scale_many.return_value = {'producer': "service not monitored by overseer"}
+
+        load_manager.recheck_rules()
+
+        load_manager.mongo.services.update_many.assert_called_once_with(
+            {'name': {'$in': ['producer']}}, {'$set': {'scaling.pending': None}})
+
+    def test_recheck_query_due(self, load_manager):
+        load_manager.mongo.services.find.return_value = []
+
+        load_manager.recheck_rules()
+
+        query = load_manager.mongo.services.find.call_args[0][0]
+        assert set(query) == {'next_recheck_at'}
+        assert set(query['next_recheck_at']) == {'$lte'}
+        load_manager.overseer.scale_many.assert_not_called()
+
+    @pytest.mark.parametrize('rule,due', [
+        ({'__scale_up__': True, '__scale_down__': False}, True),
+        ({'__scale_up__': False, '__scale_down__': False}, False),
+    ])
+    def test_execute_set_due_time(self, load_manager, rule, due):
+        load_manager._execute_ruleset(rule, service())
+
+        query, update = load_manager.mongo.services.update_one.call_args[0]
+        assert query == {'name': 'producer'}
+        assert set(update['$set']) - {'next_recheck_at'} == {'latest_ruleset', 'latest_metrics', 'scaling'}
+        if due:
+            assert update['$set']['next_recheck_at'] > update['$set']['latest_ruleset']['date']
+        else:
+            assert update['$unset'] == {'next_recheck_at': ''}
+
+
+class TestDecisions(object):
+
+    def test_decision_recorded(self, load_manager):
+        trace = {'id': 'abc', 'hops': [['monitorer_rabbitmq', 1.0], ['trigger', 2.0]]}
+        load_manager.mongo.services.find_one.return_value = service()
+        load_manager.overseer.scale.side_effect = lambda name, scale, trace: dict(
+            trace, hops=trace['hops'] + [['overseer', 4.0]])
+
+        load_manager.on_ruleset_triggered({
+            'ruleset': {'owner': 'overseer_load_manager', 'name': 'producer'},
+            'rules_stats': {'__scale_up__': True, '__scale_down__': False},
+            'trace': trace,
+        })
+
+        decision = load_manager.mongo.decisions.insert_one.call_args[0][0]
+        assert decision['trace'] == 'abc'
+        assert (decision['service'], decision['from'], decision['to']) == ('producer', 2, 3)
+        assert [h for h, _ in decision['hops']] == ['monitorer_rabbitmq', 'trigger', 'overseer_load_manager',
+                                                    'overseer']
+
+    def test_decision_converged(self, load_manager):
+        s = service()
+        s['scaling'] = {'pending': {'to': 3, 'date': datetime.datetime.now(), 'trace': 'abc'}}
+        load_manager.mongo.services.find_one.return_value = s
+
+        load_manager.on_service_updated({
+            'service': {'name': 'producer', 'mode': {'name': 'replicated', 'replicas': 3}},
+            'diff': {'scale': {'from': 2, 'to': 3}},
+        })
+
+        query, update = load_manager.mongo.decisions.update_one.call_args[0]
+        assert query == {'trace': 'abc'}
+        assert update['$push']['hops'][0] == 'converged'
+
+    def test_list_decisions(self, load_manager):
+        cursor = load_manager.mongo.decisions.find.return_value.sort.return_value.limit
+        cursor.return_value = [{'_id': 1, 'trace': 'abc', 'service': 'producer',
+                                'hops': [['monitorer_rabbitmq', 1.0], ['trigger', 1.5], ['converged', 6.0]]}]
+
+        decisions = load_manager.list_decisions('producer', limit=10)
+
+        load_manager.mongo.decisions.find.assert_called_once_with({'service': 'producer'})
+        cursor.assert_called_once_with(10)
+        assert decisions[0]['latencies'] == [['trigger', 0.5], ['converged', 4.5]]
+        assert decisions[0]['total'] == 5.0
+        assert '_id' not in decisions[0]
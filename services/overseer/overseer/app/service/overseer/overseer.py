@@ -8,15 +8,20 @@ from nameko.events import SERVICE_POOL, EventDispatcher, event_handler
 from nameko.exceptions import RemoteError, UnknownService
 from nameko.rpc import RpcProxy, rpc
 from nameko.timer import timer
-from promise.promise import Promise
 
 from common.base import BaseWorkerService
 from common.db.mongo import Mongo
 from common.entrypoint import once
-from common.utils import ImageVersion, filter_dict, log_all, make_promise
+from common.trace import add_hop
+from common.utils import ImageVersion, filter_dict, gather, log_all
 
 logger = logging.getLogger(__name__)
 
+# max number of rpc waiting for their reply while fetching the config of the services
+FETCH_CONCURRENCY = 10
+# max number of seconds to wait for the scalers to apply a scale_many
+SCALE_MANY_TIMEOUT = 30
+
 
 class NotMonitoredServiceException(Exception):
     pass
@@ -334,15 +339,16 @@ class Overseer(BaseWorkerService):
         if not self.mongo.services.find_one():
             for scaler in self._get_scalers():
                 result = scaler.list_services()
-                for service in result:
-                    try:
-                        # we check if the service contains required config
-                        scale_config = self.scaler_docker.fetch_image_config(service['full_image_id'])
-                    except RemoteError:
-                        pass
-                    else:
-                        if scale_config:
-                            self.monitor(scaler.type, service['name'])
+                # we check if the services contains required config, all at once
+                scale_configs, errors = gather(
+                    ((scaler.fetch_image_config, (service['full_image_id'],)) for service in result),
+                    concurrency=FETCH_CONCURRENCY,
+                )
+                for service, scale_config, error in zip(result, scale_configs, errors):
+                    if error is not None and not isinstance(error, RemoteError):
+                        logger.error("error while fetching the config of %s: %r", service['name'], error)
+                    elif scale_config:
+                        self.monitor(scaler.type, service['name'])
             logger.debug("services: %s", pprint.pformat(list(self.mongo.services.find()), indent=2, width=119))
 
     # ####################################################
@@ -440,19 +446,56 @@ class Overseer(BaseWorkerService):
 
     @rpc
     @log_all(NotMonitoredServiceException)
-    def scale(self, service_name, scale):
+    def scale(self, service_name, scale, trace=None):
         """
         scale the given service by his name to the given amount of instances.
         :param str service_name:  the name of the service
         :param int scale:  the number of instance required (don't check anything)
-        :return:
+        :param dict trace: the trace of the decision (see common.trace), given to the scaler with our hop
+        :return: the trace with our hop
         """
         logger.debug("scaling service %s to %s", service_name, scale)
         service = self.get_service(service_name)
         logger.debug("scaling service: %s", service)
         if service is None:
             raise NotMonitoredServiceException("service %s is not monitored by overseer" % service_name)
-        self._update_service(service, scale=scale)
+        trace = add_hop(trace, self.name)
+        self._update_service(service, scale=scale, trace=trace)
+        return trace
+
+    @rpc
+    @log_all
+    def scale_many(self, scales):
+        """
+        scale many services at once. each scaler is called once for all his services.
+        :param dict[str, int] scales: the number of instance required by service name
+        :return: the errors by service name, for the services not monitored by overseer and the ones
+            the scaler failed to scale. the services not in it are scaled
+        :rtype: dict[str, str]
+        """
+        logger.debug("scaling services %s", scales)
+        services = list(self.mongo.services.find({'name': {'$in': list(scales)}}))
+        not_monitored = sorted(set(scales) - {s['name'] for s in services})
+        if not_monitored:
+            logger.warning("can't scale services not monitored by overseer: %s", not_monitored)
+        by_scaler = {}
+        for service in services:
+            scaler = self._get_scaler(service)
+            by_scaler.setdefault(scaler.type, (scaler, {}))[1][service['name']] = scales[service['name']]
+        errors = {name: "service not monitored by overseer" for name in not_monitored}
+        calls = list(by_scaler.values())
+        results, call_errors = gather(
+            ((scaler.scale_many, (scaler_scales,)) for scaler, scaler_scales in calls),
+            timeout=SCALE_MANY_TIMEOUT,
+        )
+        for (scaler, scaler_scales), scaler_errors, error in zip(calls, results, call_errors):
+            if error is not None:
+                logger.error("error while scaling %s with %s: %r", scaler_scales, scaler.type, error)
+                errors.update((name, repr(error)) for name in scaler_scales)
+            elif scaler_errors:
+                logger.error("%s failed to scale %s", scaler.type, scaler_errors)
+                errors.update(scaler_errors)
+        return errors
 
     @rpc
     @log_all
@@ -506,7 +549,6 @@ class Overseer(BaseWorkerService):
         - mode
         - image
         :param kwargs:
-        :rtype: Promise
         """
         self._get_scaler(service).update.call_async(
             service_name=service['name'],
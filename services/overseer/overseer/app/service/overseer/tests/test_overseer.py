@@ -6,6 +6,7 @@ from unittest.case import TestCase, skip
 
 import pytest
 from bson import ObjectId
+from nameko.exceptions import RemoteError
 from nameko.testing.services import worker_factory
 
 from common.utils import filter_dict
@@ -374,3 +375,67 @@ class TestRecheck:
             'species': 'producer',
             'version': '1.0.2',
             'digest': None})
+
+
+class TestOverseerScale(object):
+
+    def test_scale_many(self, overseer: Overseer, service):
+        overseer.mongo.services.find.return_value = [service]
+        overseer.scaler_docker.scale_many.call_async.return_value.result.return_value = {}
+
+        errors = overseer.scale_many({service['name']: 3, 'unknown': 2})
+
+        assert list(errors) == ['unknown']
+        overseer.mongo.services.find.assert_called_once_with({'name': {'$in': [service['name'], 'unknown']}})
+        overseer.scaler_docker.scale_many.call_async.assert_called_once_with({service['name']: 3})
+
+    def test_scale_many_scaler_errors(self, overseer: Overseer, service):
+        overseer.mongo.services.find.return_value = [service]
+        overseer.scaler_docker.scale_many.call_async.return_value.result.return_value = {
+            service['name']: "service not found"}
+
+        assert overseer.scale_many({service['name']: 3}) == {service['name']: "service not found"}
+
+    def test_scale_many_scaler_down(self, overseer: Overseer, service):
+        overseer.mongo.services.find.return_value = [service]
+        overseer.scaler_docker.scale_many.call_async.return_value.result.side_effect = Exception("scaler down")
+
+        errors = overseer.scale_many({service['name']: 3})
+
+        assert list(errors) == [service['name']]
+        assert 'scaler down' in errors[service['name']]
+
+    def test_scale_trace(self, overseer: Overseer, service):
+        overseer.mongo.services.find_one.return_value = service
+
+        trace = overseer.scale(service['name'], 3, trace={'id': 'abc', 'hops': [['trigger', 1.0]]})
+
+        assert trace['id'] == 'abc'
+        assert [h for h, _ in trace['hops']] == ['trigger', 'overseer']
+        overseer.scaler_docker.update.call_async.assert_called_once_with(service_name=service['name'], scale=3,
+                                                                         trace=trace)
+
+
+class TestFetchServices(object):
+
+    def test_monitor_services_with_config(self, overseer: Overseer):
+        overseer.mongo.services.find_one.return_value = None
+        overseer.mongo.services.find.return_value = []
+        overseer.monitor = mock.Mock()
+        overseer.scaler_docker.list_services.return_value = [
+            {'name': 'producer', 'full_image_id': 'maiev:producer'},
+            {'name': 'nginx', 'full_image_id': 'nginx'},
+            {'name': 'broken', 'full_image_id': 'maiev:broken'},
+        ]
+        replies = {
+            'maiev:producer': mock.Mock(**{'result.return_value': {'max': 3}}),
+            'nginx': mock.Mock(**{'result.return_value': {}}),
+            'maiev:broken': mock.Mock(**{'result.side_effect': RemoteError('ValueError')}),
+        }
+        overseer.scaler_docker.fetch_image_config.call_async.side_effect = lambda image_id: replies[image_id]
+
+        with mock.patch('service.overseer.overseer.time.sleep'):
+            overseer.fetch_services()
+
+        assert overseer.scaler_docker.fetch_image_config.call_async.call_count == 3
+        overseer.monitor.assert_called_once_with('docker', 'producer')
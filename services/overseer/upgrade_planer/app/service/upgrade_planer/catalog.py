@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+import logging
+from collections import namedtuple
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from nameko.extensions import DependencyProvider
+from pymongo import ReturnDocument
+
+from common.utils import ImageVersion
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_ID = 'catalog'
+
+VersionIndex = namedtuple('VersionIndex', ['sorted', 'ranks'])
+"""
+the versions of a service, precomputed once per catalog change.
+
+- sorted: the version numbers from the highest to the lowest
+- ranks: the version number => position in `sorted` (0 is the newest)
+"""
+
+
+def freeze(obj):
+    """
+    build a read-only copy of the given data: the dicts become MappingProxyType and the lists become tuples,
+    at any depth.
+
+    >>> frozen = freeze({'versions': {'1.0.1': {'require': ['a']}}})
+    >>> frozen['versions']['1.0.1']['require']
+    ('a',)
+
+    :param obj: the data loaded from mongodb
+    :return: the frozen data
+    """
+    if isinstance(obj, Mapping):
+        return MappingProxyType({key: freeze(value) for key, value in obj.items()})
+    elif isinstance(obj, (list, tuple)):
+        return tuple(freeze(value) for value in obj)
+    return obj
+
+
+def thaw(obj):
+    """
+    build a mutable copy of data given by :func:`freeze`, to be updated or sent to other services
+    :param obj: the frozen data
+    :return: the data with dict and list
+    """
+    if isinstance(obj, Mapping):
+        return {key: thaw(value) for key, value in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [thaw(value) for value in obj]
+    return obj
+
+
+def sort_versions(versions):
+    """
+    short the given version from the hiest version to the lowest
+    :param versions: the list of version (as in service['versions']
+    :return: a list of version numbers ordered
+    """
+    sorted_version_metadata = list(sorted(
+        versions, reverse=True, key=lambda vinfo: ImageVersion.deserialize(vinfo['image_info'])))
+    return [v['version'] for v in sorted_version_metadata]
+
+
+def index_versions(service):
+    """
+    build the :class:`VersionIndex` of the given service
+    :param dict service: the service from the catalog
+    :rtype: VersionIndex
+    """
+    sorted_numbers = sort_versions(service['versions'].values())
+    return VersionIndex(sorted_numbers, {number: rank for rank, number in enumerate(sorted_numbers)})
+
+
+class CatalogCache(object):
+    """
+    the catalog of services kept in memory and shared by all the workers of a container.
+
+    the catalog in mongodb has a version number, increased by each write. the cache is reloaded
+    only if this version changed since it was loaded, and is updated in place by the writes of this process.
+    the services returned by :meth:`get` are shared, and are frozen at any depth (see :func:`freeze`): use
+    :func:`thaw` to get a copy to update.
+
+    each service come with its :class:`VersionIndex`, computed at the first use after the service was loaded
+    or updated.
+    """
+
+    def __init__(self):
+        self.entries = None
+        self.indexes = None
+        self.version = None
+
+    def remote_version(self, db):
+        """
+        :return: the current version of the catalog in the database
+        """
+        stored = db.catalog_version.find_one({'_id': CATALOG_VERSION_ID})
+        return stored['version'] if stored else 0
+
+    def get(self, db, unserialize):
+        """
+        return all services of the catalog by name
+        :param db: the database
+        :param unserialize: the function to convert the raw services from mongodb
+        :rtype: MappingProxyType[str, MappingProxyType]
+        """
+        self.refresh(db, unserialize)
+        return MappingProxyType(self.entries)
+
+    def get_indexes(self, db, unserialize):
+        """
+        return the :class:`VersionIndex` of all services of the catalog by name
+        :param db: the database
+        :param unserialize: the function to convert the raw services from mongodb
+        :rtype: MappingProxyType[str, VersionIndex]
+        """
+        self.refresh(db, unserialize)
+        indexes = self.indexes
+        for name, service in self.entries.items():
+            if name not in indexes:
+                indexes[name] = index_versions(service)
+        return MappingProxyType(indexes)
+
+    def refresh(self, db, unserialize):
+        """
+        reload the catalog if it changed since the last load
+        """
+        version = self.remote_version(db)
+        if self.entries is None or version != self.version:
+            logger.debug("loading the catalog version %s (cached version %s)", version, self.version)
+            entries = {
+                service['name']: freeze(service)
+                for service in (unserialize(raw) for raw in db.catalog.find())
+            }
+            self.entries, self.indexes, self.version = entries, {}, version
+
+    def update(self, db, service):
+        """
+        increase the version of the catalog after service was saved into it.
+        if the cache was up to date, the service is updated in it, otherwise the cache is invalidated.
+        :param db: the database
+        :param dict service: the saved service
+        """
+        version = db.catalog_version.find_one_and_update(
+            {'_id': CATALOG_VERSION_ID},
+            {'$inc': {'version': 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )['version']
+        if self.entries is not None and self.version == version - 1:
+            # copy on write: the workers iterating over the previous catalog are not affected
+            entries, indexes = dict(self.entries), dict(self.indexes)
+            entries[service['name']] = freeze(service)
+            indexes.pop(service['name'], None)
+            self.entries, self.indexes, self.version = entries, indexes, version
+        else:
+            self.entries = self.indexes = None
+
+
+class CatalogCacheProvider(DependencyProvider):
+    """
+    provide the :class:`CatalogCache` of the container
+    """
+
+    def __init__(self):
+        self.cache = None
+
+    def setup(self):
+        self.cache = CatalogCache()
+
+    def get_dependency(self, worker_ctx):
+        return self.cache
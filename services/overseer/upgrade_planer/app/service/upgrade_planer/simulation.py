@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+run the resolution of the upgrade planer on a catalog without any other service.
+
+the mongodb, overseer and dependency_solver of the planer are replaced by local stand-ins and
+each stage of the resolution is timed. used to measure the planer on real or synthetic catalogs.
+"""
+import logging
+import random
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from service.upgrade_planer.catalog import CatalogCache
+from service.upgrade_planer.upgrade_planer import UpgradePlaner
+
+logger = logging.getLogger(__name__)
+
+SIMULATION_CONFIG = {
+    'solve_dependencies': True,
+    'solver_timeout': 60,
+}
+
+STAGES = (
+    ('catalog', 'build_catalog'),
+    ('solve', 'solve_dependencies'),
+    ('best_phase', 'solve_best_phase'),
+    ('steps', 'build_steps'),
+    ('waves', 'build_waves'),
+)
+
+
+def generate_catalog(services=10, versions=5, density=0.3, seed=None):
+    """
+    generate a catalog of services as stored by the upgrade planer.
+
+    each version of a service provide a «rpc» api, increased every 2 versions. each service require the
+    api of the services before it with a probability of «density», the newest versions requiring the newest api.
+    all services are deployed at their first version.
+
+    :param int services: the number of services
+    :param int versions: the number of versions by service
+    :param float density: the probability for a service to require each of the previous services
+    :param seed: the seed of the random generator, to get the same catalog again
+    :return: the catalog as stored in mongodb
+    :rtype: list[dict]
+    """
+    rand = random.Random(seed)
+    max_api = (versions - 1) // 2 + 1
+    names = ['service%d' % i for i in range(services)]
+    catalog = []
+    for i, name in enumerate(names):
+        required = [other for other in names[:i] if rand.random() < density]
+        versions_list = []
+        for j in range(versions):
+            number = '1.%d.0' % j
+            versions_list.append({
+                "version": number,
+                "image_info": {
+                    "repository": "simulation",
+                    "image": "simulation",
+                    "tag": "%s-%s" % (name, number),
+                    "species": name,
+                    "version": number,
+                    "digest": None,
+                },
+                "dependencies": {
+                    "provide": {"%s:rpc" % name: j // 2 + 1},
+                    "require": [
+                        "%s:rpc > %d" % (other, max(1, max_api * (j + 1) // versions) - 1)
+                        for other in required
+                    ],
+                },
+                "available": True,
+            })
+        catalog.append({
+            "name": name,
+            "service": {
+                "name": name,
+                "image": {"type": "docker", "image_info": versions_list[0]['image_info']},
+                "scale_config": {"dependencies": versions_list[0]['dependencies']},
+                "mode": {"name": "replicated", "replicas": 1},
+            },
+            "version": versions_list[0]['version'],
+            "versions_list": versions_list,
+        })
+    return catalog
+
+
+class LocalCollection(object):
+    """
+    a read-only mongodb collection in memory. only the filters by equality are supported.
+    """
+
+    def __init__(self, documents=()):
+        self.documents = list(documents)
+
+    def find(self, filter_=None):
+        filter_ = filter_ or {}
+        return [d for d in self.documents if all(d.get(k) == v for k, v in filter_.items())]
+
+    def find_one(self, filter_=None, **kwargs):
+        found = self.find(filter_)
+        return found[0] if found else None
+
+
+class LocalDatabase(object):
+    """
+    a mongodb database with the given collections, all other are empty.
+    """
+
+    def __init__(self, **collections):
+        for name, documents in collections.items():
+            setattr(self, name, LocalCollection(documents))
+
+    def __getattr__(self, item):
+        collection = LocalCollection()
+        setattr(self, item, collection)
+        return collection
+
+
+class LocalOverseer(object):
+    """
+    stand-in for the overseer. the services are taken from the catalog and the upgrades are only recorded.
+    """
+
+    def __init__(self, catalog):
+        self.services = {s['name']: s.get('service') for s in catalog}
+        self.upgrades = []
+
+    def get_service(self, service_name):
+        return self.services[service_name]
+
+    def upgrade_service(self, service_name, image_id, **kwargs):
+        self.upgrades.append((service_name, image_id))
+
+
+class LocalDependencySolver(object):
+    """
+    stand-in for the dependency_solver: solve the catalog in this process.
+    the dependency_solver must be in the python path.
+    """
+
+    def __init__(self, backend='backtrack'):
+        self.backend = backend
+
+    def solve_dependencies(self, catalog, extra_constraints=tuple(), debug=False, timeout=None, max_nodes=None,
+                           page_size=None):
+        # imported here: the dependency_solver is not shiped with the upgrade_planer
+        from service.dependency_solver.dependency_solver import solve_catalog
+
+        deadline = time.time() + timeout if timeout else None
+        return solve_catalog(catalog, extra_constraints, debug, deadline, max_nodes, self.backend)
+
+
+class Simulation(object):
+    """
+    a upgrade planer running on a catalog with local stand-ins.
+    """
+
+    def __init__(self, catalog, config=None, dependency_solver=None):
+        """
+        :param list[dict] catalog: the catalog as stored in mongodb
+        :param dict config: the config of the planer, updating :data:`SIMULATION_CONFIG`
+        :param dependency_solver: the stand-in for the dependency_solver. default to :class:`LocalDependencySolver`
+        """
+        self.timings = OrderedDict((stage, {'calls': 0, 'time': 0.}) for stage, _ in STAGES)
+        self._running_stage = None
+
+        planer = UpgradePlaner()
+        planer.config = dict(SIMULATION_CONFIG, **(config or {}))
+        planer.mongo = LocalDatabase(catalog=catalog)
+        planer.catalog_cache = CatalogCache()
+        planer.overseer = LocalOverseer(catalog)
+        planer.dependency_solver = dependency_solver or LocalDependencySolver()
+        planer.dispatch = lambda *args, **kwargs: None
+
+        for stage, method in STAGES:
+            owner = planer.dependency_solver if stage == 'solve' else planer
+            setattr(owner, method, self._timed(stage, getattr(owner, method)))
+        self.planer = planer
+
+    def _timed(self, stage, func):
+        """
+        wrap the function to add its time to the stage. the calls made from another stage are not counted.
+        """
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if self._running_stage is not None:
+                return func(*args, **kwargs)
+            self._running_stage = stage
+            start = time.time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.timings[stage]['calls'] += 1
+                self.timings[stage]['time'] += time.time() - start
+                self._running_stage = None
+        return wrapper
+
+    def run(self):
+        """
+        run resolve_upgrade_and_steps and return the report
+        :return: the timings of each stages and the result::
+
+            timings:
+                $stage:
+                    calls: 1
+                    time: 0.012
+            total: 0.5
+            best_phase: {$servicename: $version}
+            steps: [[$servicename, $from, $to]]
+            waves: [[[$servicename, $from, $to]]]
+            errors: []
+        """
+        start = time.time()
+        resolved = self.planer.resolve_upgrade_and_steps()
+        total = time.time() - start
+        result = resolved['result'] or {}
+        goal = result.get('best_phase')
+        return {
+            'timings': self.timings,
+            'total': total,
+            'best_phase': {pin.service['name']: pin.version for pin in goal} if goal else None,
+            'steps': [list(step) for step in result.get('steps', [])],
+            'waves': [[list(step) for step in wave] for wave in result.get('waves', [])],
+            'errors': resolved.get('errors', []),
+        }
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import mock
+import pytest
+
+from service.upgrade_planer.catalog import CatalogCache, freeze, index_versions, thaw
+
+logger = logging.getLogger(__name__)
+
+
+@pytest.fixture
+def db():
+    db = mock.Mock()
+    db.catalog_version.find_one.return_value = {'_id': 'catalog', 'version': 3}
+    db.catalog.find.return_value = [{'name': 'producer', 'version': '1'}, {'name': 'consumer', 'version': '1'}]
+    return db
+
+
+def unserialize(raw):
+    return dict(raw)
+
+
+class TestCatalogCache(object):
+
+    def test_loaded_once(self, db):
+        cache = CatalogCache()
+        first = cache.get(db, unserialize)
+        second = cache.get(db, unserialize)
+        assert set(first) == {'producer', 'consumer'}
+        assert first['producer'] is second['producer']
+        assert db.catalog.find.call_count == 1
+
+    def test_read_only(self, db):
+        catalog = CatalogCache().get(db, unserialize)
+        with pytest.raises(TypeError):
+            catalog['producer'] = {}
+
+    def test_nested_read_only(self, db):
+        db.catalog.find.return_value = [{'name': 'producer', 'versions': {'1': {'dependencies': {'require': ['a']}}}}]
+        producer = CatalogCache().get(db, unserialize)['producer']
+        with pytest.raises(TypeError):
+            producer['version'] = '2'
+        with pytest.raises(TypeError):
+            producer['versions']['1']['dependencies']['provide'] = {}
+        with pytest.raises(AttributeError):
+            producer['versions']['1']['dependencies']['require'].append('b')
+
+    def test_updated_read_only(self, db):
+        cache = CatalogCache()
+        cache.get(db, unserialize)
+        db.catalog_version.find_one_and_update.return_value = {'_id': 'catalog', 'version': 4}
+        db.catalog_version.find_one.return_value = {'_id': 'catalog', 'version': 4}
+        cache.update(db, {'name': 'producer', 'versions': {'2': {}}})
+        with pytest.raises(TypeError):
+            cache.get(db, unserialize)['producer']['versions']['3'] = {}
+
+    def test_reload_on_new_version(self, db):
+        cache = CatalogCache()
+        cache.get(db, unserialize)
+        db.catalog_version.find_one.return_value = {'_id': 'catalog', 'version': 4}
+        db.catalog.find.return_value = [{'name': 'producer', 'version': '2'}]
+        assert set(cache.get(db, unserialize)) == {'producer'}
+        assert db.catalog.find.call_count == 2
+
+    def test_update_in_place(self, db):
+        cache = CatalogCache()
+        before = cache.get(db, unserialize)
+        db.catalog_version.find_one_and_update.return_value = {'_id': 'catalog', 'version': 4}
+        cache.update(db, {'name': 'producer', 'version': '2'})
+        db.catalog_version.find_one.return_value = {'_id': 'catalog', 'version': 4}
+
+        after = cache.get(db, unserialize)
+        assert after['producer']['version'] == '2'
+        assert before['producer']['version'] == '1'
+        assert db.catalog.find.call_count == 1
+
+    def test_update_invalidate_if_outdated(self, db):
+        cache = CatalogCache()
+        cache.get(db, unserialize)
+        # another process updated the catalog in between
+        db.catalog_version.find_one_and_update.return_value = {'_id': 'catalog', 'version': 5}
+        cache.update(db, {'name': 'producer', 'version': '2'})
+        db.catalog_version.find_one.return_value = {'_id': 'catalog', 'version': 5}
+
+        cache.get(db, unserialize)
+        assert db.catalog.find.call_count == 2
+
+
+def versions(*numbers):
+    return {
+        number: {'version': number, 'image_info': {
+            'repository': 'docker.io', 'image': 'producer', 'species': None,
+            'version': number, 'tag': number, 'digest': None
+        }}
+        for number in numbers
+    }
+
+
+class TestVersionIndex(object):
+
+    def test_index_versions(self):
+        index = index_versions({'name': 'producer', 'versions': versions('1.0.5', '1.0.17', '1.0.16b')})
+        assert index.sorted == ['1.0.17', '1.0.16b', '1.0.5']
+        assert index.ranks == {'1.0.17': 0, '1.0.16b': 1, '1.0.5': 2}
+
+    def test_index_updated(self, db):
+        db.catalog.find.return_value = [{'name': 'producer', 'versions': versions('1.0.5')}]
+        cache = CatalogCache()
+        assert cache.get_indexes(db, unserialize)['producer'].sorted == ['1.0.5']
+
+        db.catalog_version.find_one_and_update.return_value = {'_id': 'catalog', 'version': 4}
+        cache.update(db, {'name': 'producer', 'versions': versions('1.0.5', '1.0.6')})
+        db.catalog_version.find_one.return_value = {'_id': 'catalog', 'version': 4}
+
+        assert cache.get_indexes(db, unserialize)['producer'].ranks == {'1.0.6': 0, '1.0.5': 1}
+        assert db.catalog.find.call_count == 1
+
+
+class TestFreeze(object):
+
+    def test_thaw(self):
+        data = {'name': 'producer', 'versions': {'1': {'require': ['a'], 'provide': {'a:args': ['x']}}}}
+        thawed = thaw(freeze(data))
+        assert thawed == data
+        thawed['versions']['1']['require'].append('b')
+        assert data['versions']['1']['require'] == ['a']
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import logging
+
+import pytest
+
+from service.upgrade_planer.simulation import Simulation, generate_catalog
+
+logger = logging.getLogger(__name__)
+
+
+class LatestPhaseSolver(object):
+    """
+    give the latest version of each services as the only compatible phase
+    """
+
+    def solve_dependencies(self, catalog, **kwargs):
+        return {
+            "results": [{s['name']: max(s['versions'], key=lambda v: int(v.split('.')[1])) for s in catalog}],
+            "errors": [],
+            "anomalies": [],
+        }
+
+
+class TestGenerateCatalog(object):
+
+    def test_size(self):
+        catalog = generate_catalog(services=4, versions=3, density=1, seed=1)
+        assert [s['name'] for s in catalog] == ['service0', 'service1', 'service2', 'service3']
+        assert all(len(s['versions_list']) == 3 and s['version'] == '1.0.0' for s in catalog)
+        # with a density of 1, each service require all previous ones
+        assert catalog[3]['versions_list'][2]['dependencies']['require'] == [
+            'service0:rpc > 1', 'service1:rpc > 1', 'service2:rpc > 1']
+
+    def test_seed(self):
+        assert generate_catalog(8, 3, 0.5, seed=3) == generate_catalog(8, 3, 0.5, seed=3)
+
+    @pytest.mark.parametrize('density', [0, 0.5, 1])
+    def test_density(self, density):
+        catalog = generate_catalog(10, 2, density, seed=1)
+        requires = [len(s['versions_list'][0]['dependencies']['require']) for s in catalog]
+        if density == 0:
+            assert sum(requires) == 0
+        elif density == 1:
+            assert requires == list(range(10))
+
+
+class TestSimulation(object):
+
+    def test_run(self):
+        simulation = Simulation(generate_catalog(3, 3, 0, seed=1), dependency_solver=LatestPhaseSolver())
+
+        report = simulation.run()
+
+        assert report['errors'] == []
+        assert report['best_phase'] == {'service0': '1.2.0', 'service1': '1.2.0', 'service2': '1.2.0'}
+        assert report['steps'] == [['service%d' % i, '1.0.0', '1.2.0'] for i in range(3)]
+        assert len(report['waves']) == 1
+        assert list(report['timings']) == ['catalog', 'solve', 'best_phase', 'steps', 'waves']
+        # the catalog built by build_steps is counted in the «steps» stage
+        assert all(t['calls'] == 1 for t in report['timings'].values())
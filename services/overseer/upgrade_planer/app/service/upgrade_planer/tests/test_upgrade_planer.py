@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
+import copy
+import datetime
 import json
 import logging
 import os
 from functools import reduce
 
+import eventlet
 import mock
 # other MS
 import pytest
 
-from service.upgrade_planer.upgrade_planer import ACCEPT_ALL, NO_DOWNGRADE, Phase, PhasePin, UpgradePlaner
+from common.utils import dependencies_signature
+from service.upgrade_planer.catalog import CatalogCache, freeze
+from service.upgrade_planer.upgrade_planer import ACCEPT_ALL, NO_DOWNGRADE, Phase, PhasePin, Step, UpgradePlaner
 
 logger = logging.getLogger(__name__)
 
@@ -130,6 +135,9 @@ def upgrade_planer():
     service = UpgradePlaner()
     service.config = {}
     service.mongo = mock.Mock()
+    service.mongo.catalog_version.find_one.return_value = None
+    service.mongo.catalog_version.find_one_and_update.return_value = {'version': 1}
+    service.catalog_cache = CatalogCache()
     service.dispatch = mock.Mock()
     service.dependency_solver = mock.Mock()
     return service
@@ -444,10 +452,11 @@ class TestUpgradePlaner(object):
                     PhasePin(catalog[0], "1.0.16")])
         upgrade_planer.solve_best_phase = mock.Mock(return_value=(None, 0))
         upgrade_planer.build_steps = mock.Mock()
+        upgrade_planer.build_waves = mock.Mock()
 
         res = upgrade_planer.resolve_upgrade_and_steps()
 
-        upgrade_planer.solve_best_phase.assert_called_with([bp])
+        assert list(upgrade_planer.solve_best_phase.call_args[0][0]) == [bp]
         assert not upgrade_planer.build_steps.called
         assert res['result']['best_phase'] is None
 
@@ -462,10 +471,11 @@ class TestUpgradePlaner(object):
                     PhasePin(catalog[0], "1.0.16")])
         upgrade_planer.solve_best_phase = mock.Mock(return_value=(bp, 1))
         upgrade_planer.build_steps = mock.Mock()
+        upgrade_planer.build_waves = mock.Mock()
 
         res = upgrade_planer.resolve_upgrade_and_steps()
 
-        upgrade_planer.solve_best_phase.assert_called_with([bp])
+        assert list(upgrade_planer.solve_best_phase.call_args[0][0]) == [bp]
         upgrade_planer.build_steps.assert_called_with(bp)
 
         assert res['result']['best_phase'] == bp
@@ -484,15 +494,41 @@ class TestUpgradePlaner(object):
                                                                   catalog[0]['name']: "1.0.16"})
         upgrade_planer.solve_best_phase = mock.Mock(return_value=(bp, 1))
         upgrade_planer.build_steps = mock.Mock()
+        upgrade_planer.build_waves = mock.Mock()
 
         res = upgrade_planer.resolve_upgrade_and_steps()
 
-        upgrade_planer.solve_best_phase.assert_called_with([bp])
+        assert list(upgrade_planer.solve_best_phase.call_args[0][0]) == [bp]
         upgrade_planer.build_steps.assert_called_with(bp)
         upgrade_planer.dependency_solver.solve_dependencies.assert_not_called()
 
         assert res['result']['best_phase'] == bp
 
+    def test_resolve_upgrade_and_steps_paged(self, upgrade_planer: UpgradePlaner, catalog):
+        upgrade_planer.build_catalog = mock.Mock(return_value=catalog)
+        upgrade_planer.dependency_solver.solve_dependencies = mock.Mock(return_value={
+            "results": [{"producer": "1.0.16", "consumer": "1.0.16"}],
+            "errors": [],
+            "anomalies": [],
+            "handle": "abc",
+            "total": 3,
+            "pages": 3,
+        })
+        upgrade_planer.dependency_solver.fetch_results = mock.Mock(side_effect=[
+            [{"producer": "1.0.15", "consumer": "1.0.16"}],
+            [{"producer": "1.0.15", "consumer": "1.0.15"}],
+        ])
+        upgrade_planer.solve_best_phase = mock.Mock(side_effect=lambda phases: (list(phases)[-1], 2))
+        upgrade_planer.build_steps = mock.Mock()
+        upgrade_planer.build_waves = mock.Mock()
+
+        res = upgrade_planer.resolve_upgrade_and_steps()
+
+        assert res['result']['best_phase'] == Phase([PhasePin(catalog[1], "1.0.15"),
+                                                     PhasePin(catalog[0], "1.0.15")])
+        upgrade_planer.dependency_solver.fetch_results.assert_has_calls([mock.call("abc", 1), mock.call("abc", 2)])
+        upgrade_planer.dependency_solver.drop_results.call_async.assert_called_with("abc")
+
     def test_resolve_upgrade_and_steps_with_error(self, upgrade_planer: UpgradePlaner, catalog):
         upgrade_planer.build_catalog = mock.Mock(return_value=catalog)
         upgrade_planer.dependency_solver.solve_dependencies = mock.Mock(return_value={
@@ -519,7 +555,7 @@ class TestStepComputing(object):
             {"name": "consumer", "version": "1.0.1"}
         ]
 
-        upgrade_planer.explain_phase = mock.Mock(return_value={'results': 0})
+        upgrade_planer._build_phase_checker = mock.Mock(return_value=mock.Mock(is_valid=lambda phase: True))
         s = upgrade_planer.build_steps(goal)
         assert 2 == len(s)
         assert [('producer', '1.0.16', '1.0.17'), ('consumer', '1.0.1', '1.0.17')] == s
@@ -576,16 +612,514 @@ class TestStepComputing(object):
             for k, v in current_state.items()
         ]
 
-        def explain_phase(phase):
-            if phase in compatible_phase or phase == goal_param:
-                return {'results': 0}
-            else:
-                return {'results': 1}
+        def is_valid(phase):
+            return phase in compatible_phase or phase == goal_param
 
-        upgrade_planer.explain_phase = explain_phase
+        upgrade_planer._build_phase_checker = mock.Mock(return_value=mock.Mock(is_valid=is_valid))
         s = upgrade_planer.build_steps(goal)
         assert expected == s
 
+    def test_build_steps_in_process(self, upgrade_planer: UpgradePlaner):
+        def version(number, provide, require):
+            return {'version': number, 'dependencies': {'provide': provide, 'require': require}}
+
+        upgrade_planer.mongo.catalog.find.return_value = [
+            {
+                "name": "producer", "version": "1",
+                "versions_list": [
+                    version("1", {"producer:rpc:echo": 1}, []),
+                    version("2", {"producer:rpc:echo": 2}, []),
+                ]
+            },
+            {
+                "name": "consumer", "version": "1",
+                "versions_list": [
+                    version("1", {}, ["producer:rpc:echo"]),
+                    version("2", {}, ["producer:rpc:echo == 2"]),
+                ]
+            },
+        ]
+        goal = Phase([PhasePin({"name": "consumer"}, "2"), PhasePin({"name": "producer"}, "2")])
+
+        s = upgrade_planer.build_steps(goal)
+
+        assert [('producer', '1', '2'), ('consumer', '1', '2')] == s
+        upgrade_planer.dependency_solver.explain.assert_not_called()
+
+
+class TestWaves(object):
+
+    @pytest.mark.parametrize(
+        ('current_state', 'steps', 'compatible_phase', 'parallelism', 'expected'),
+        [
+            (  # independent services
+                {'a': '1', 'b': '1', 'c': '1'},
+                [('a', '1', '2'), ('b', '1', '2'), ('c', '1', '2')],
+                None,
+                4,
+                [[('a', '1', '2'), ('b', '1', '2'), ('c', '1', '2')]],
+            ),
+            (  # limited parallelism
+                {'a': '1', 'b': '1', 'c': '1'},
+                [('a', '1', '2'), ('b', '1', '2'), ('c', '1', '2')],
+                None,
+                2,
+                [[('a', '1', '2'), ('b', '1', '2')], [('c', '1', '2')]],
+            ),
+            (  # b must wait for a: b2 is not compatible with a1
+                {'a': '1', 'b': '1', 'c': '1'},
+                [('a', '1', '2'), ('b', '1', '2'), ('c', '1', '2')],
+                [{'a': '1', 'b': '1', 'c': '1'}, {'a': '2', 'b': '1', 'c': '1'}, {'a': '2', 'b': '2', 'c': '1'},
+                 {'a': '2', 'b': '1', 'c': '2'}, {'a': '2', 'b': '2', 'c': '2'}],
+                4,
+                [[('a', '1', '2')], [('b', '1', '2'), ('c', '1', '2')]],
+            ),
+            (  # no steps
+                {'a': '1'},
+                [],
+                None,
+                4,
+                [],
+            ),
+        ])
+    def test_build_waves(self, current_state, steps, compatible_phase, parallelism, expected, upgrade_planer):
+        upgrade_planer.config['upgrade_parallelism'] = parallelism
+        upgrade_planer.mongo.catalog.find.return_value = [
+            {"name": k, "version": v}
+            for k, v in current_state.items()
+        ]
+
+        def is_valid(phase):
+            return compatible_phase is None or phase in compatible_phase
+
+        upgrade_planer._build_phase_checker = mock.Mock(return_value=mock.Mock(is_valid=is_valid))
+        waves = upgrade_planer.build_waves([Step(*step) for step in steps])
+        assert expected == [[tuple(step) for step in wave] for wave in waves]
+
+
+class SchedulingCollection(object):
+    """
+    a scheduling collection in memory, which apply each update atomically.
+    it support only the filters and updates used on the scheduled plans. each call give back the control to the
+    hub first, so the concurrent handlers are interleaved.
+    """
+
+    def __init__(self, *docs):
+        self.docs = list(docs)
+
+    def match(self, doc, filter_):
+        position = None
+        for key, cond in filter_.items():
+            if key == 'steps':
+                elem = cond['$elemMatch']
+                found = [i for i, step in enumerate(doc['steps']) if all(step[k] == v for k, v in elem.items())]
+                if not found:
+                    return False, None
+                position = found[0]
+            elif key == 'wave':
+                if doc.get('wave') is not None and doc['wave'] >= cond['$not']['$gte']:
+                    return False, None
+            elif doc.get(key) != cond:
+                return False, None
+        return True, position
+
+    def update(self, filter_, update):
+        eventlet.sleep(0)
+        for doc in self.docs:
+            matched, position = self.match(doc, filter_)
+            if matched:
+                for key, value in update['$set'].items():
+                    path = key.replace('$', str(position)).split('.')
+                    target = doc
+                    for part in path[:-1]:
+                        target = target[int(part)] if isinstance(target, list) else target[part]
+                    target[path[-1]] = value
+                return doc
+        return None
+
+    def find_one(self, filter_):
+        eventlet.sleep(0)
+        return next((copy.deepcopy(doc) for doc in self.docs if self.match(doc, filter_)[0]), None)
+
+    def find_one_and_update(self, filter_, update, return_document):
+        doc = self.update(filter_, update)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    def update_one(self, filter_, update):
+        return mock.Mock(modified_count=int(self.update(filter_, update) is not None))
+
+
+class TestScheduling(object):
+
+    def sched(self, *steps):
+        return {
+            "_id": 1,
+            "state": "running",
+            "wave": 0,
+            "steps": [
+                {"service": service, "from": "1", "to": "2", "state": state, "wave": wave}
+                for service, state, wave in steps
+            ]
+        }
+
+    def run_step(self, step, sched):
+        step['state'] = 'running'
+
+    def test_run_first_wave(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.resolve_upgrade_and_steps = mock.Mock(return_value={
+            "result": {
+                "steps": [Step('a', '1', '2'), Step('b', '1', '2'), Step('c', '1', '2')],
+                "waves": [[Step('a', '1', '2'), Step('b', '1', '2')], [Step('c', '1', '2')]],
+            }
+        })
+        upgrade_planer._run_step = mock.Mock(side_effect=self.run_step)
+
+        sched = upgrade_planer.run_available_upgrade()
+
+        assert [(s['service'], s['state'], s['wave']) for s in sched['steps']] == [
+            ('a', 'running', 0), ('b', 'running', 0), ('c', 'waiting', 1)]
+        assert sched['wave'] == 0
+
+    def test_wait_end_of_wave(self, upgrade_planer: UpgradePlaner):
+        sched = self.sched(('a', 'running', 0), ('b', 'running', 0), ('c', 'waiting', 1))
+        upgrade_planer.mongo.scheduling = SchedulingCollection(sched)
+        upgrade_planer._run_step = mock.Mock()
+
+        upgrade_planer.continue_scheduled_plan({'name': 'b'}, '1', '2')
+
+        upgrade_planer._run_step.assert_not_called()
+        assert [s['state'] for s in sched['steps']] == ['running', 'done', 'waiting']
+        assert sched['state'] == 'running'
+
+    def test_start_next_wave(self, upgrade_planer: UpgradePlaner):
+        sched = self.sched(('a', 'done', 0), ('b', 'running', 0), ('c', 'waiting', 1), ('d', 'waiting', 1))
+        upgrade_planer.mongo.scheduling = SchedulingCollection(sched)
+        upgrade_planer._run_step = mock.Mock(side_effect=self.run_step)
+
+        upgrade_planer.continue_scheduled_plan({'name': 'b'}, '1', '2')
+
+        assert [c[0][0]['service'] for c in upgrade_planer._run_step.call_args_list] == ['c', 'd']
+        assert [s['state'] for s in sched['steps']] == ['done', 'done', 'running', 'running']
+        assert sched['wave'] == 1
+
+    def test_wave_already_started(self, upgrade_planer: UpgradePlaner):
+        sched = self.sched(('a', 'done', 0), ('b', 'done', 0), ('c', 'waiting', 1))
+        sched['wave'] = 1
+        upgrade_planer.mongo.scheduling = SchedulingCollection(sched)
+        upgrade_planer._run_step = mock.Mock()
+
+        upgrade_planer._start_wave(copy.deepcopy(sched), 1)
+
+        upgrade_planer._run_step.assert_not_called()
+
+    def test_concurrent_end_of_wave(self, upgrade_planer: UpgradePlaner):
+        sched = self.sched(('a', 'running', 0), ('b', 'running', 0), ('c', 'waiting', 1), ('d', 'waiting', 1))
+        upgrade_planer.mongo.scheduling = SchedulingCollection(sched)
+        upgrade_planer._run_step = mock.Mock(side_effect=self.run_step)
+
+        pool = eventlet.GreenPool()
+        pool.spawn(upgrade_planer.continue_scheduled_plan, {'name': 'a'}, '1', '2')
+        pool.spawn(upgrade_planer.continue_scheduled_plan, {'name': 'b'}, '1', '2')
+        pool.waitall()
+
+        # no completion lost, and the next wave started once
+        assert [s['state'] for s in sched['steps']] == ['done', 'done', 'running', 'running']
+        assert [c[0][0]['service'] for c in upgrade_planer._run_step.call_args_list] == ['c', 'd']
+        assert sched['wave'] == 1
+
+    def test_finished(self, upgrade_planer: UpgradePlaner):
+        sched = self.sched(('a', 'done', 0), ('b', 'running', 1))
+        upgrade_planer.mongo.scheduling = SchedulingCollection(sched)
+
+        upgrade_planer.continue_scheduled_plan({'name': 'b'}, '1', '2')
+
+        assert sched['state'] == 'done'
+
+    def test_unknown_service_abord(self, upgrade_planer: UpgradePlaner):
+        sched = self.sched(('a', 'running', 0), ('b', 'waiting', 1))
+        upgrade_planer.mongo.scheduling = SchedulingCollection(sched)
+
+        upgrade_planer.continue_scheduled_plan({'name': 'z'}, '1', '2')
+
+        assert sched['state'] == 'aborded'
+        assert [s['state'] for s in sched['steps']] == ['running', 'aborded']
+
+    def test_abord_while_starting_wave(self, upgrade_planer: UpgradePlaner):
+        sched = self.sched(('a', 'running', 0), ('b', 'waiting', 1), ('c', 'waiting', 1))
+        upgrade_planer.mongo.scheduling = SchedulingCollection(sched)
+        upgrade_planer._get_service = mock.Mock(return_value=None)
+
+        upgrade_planer.continue_scheduled_plan({'name': 'a'}, '1', '2')
+
+        assert sched['state'] == 'aborded'
+        assert [s['state'] for s in sched['steps']] == ['done', 'aborded', 'aborded']
+
+
+class Cursor(list):
+    def sort(self, key, direction):
+        return Cursor(sorted(self, key=lambda d: d[key], reverse=direction < 0))
+
+
+def match_date(filter_):
+    cond = filter_.get('date', {})
+    return lambda d: (
+        ('$lte' not in cond or d['date'] <= cond['$lte'])
+        and ('$lt' not in cond or d['date'] < cond['$lt'])
+        and ('$gt' not in cond or d['date'] > cond['$gt'])
+    )
+
+
+class DateCollection(object):
+    """
+    a collection in memory, which support only the filters on the date
+    """
+
+    def __init__(self):
+        self.docs = []
+
+    def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    def find(self, filter_=None):
+        return Cursor(filter(match_date(filter_ or {}), self.docs))
+
+    def find_one(self, filter_=None, sort=None):
+        found = self.find(filter_)
+        if sort:
+            found = found.sort(*sort[0])
+        return found[0] if found else None
+
+    def delete_many(self, filter_):
+        self.docs = [d for d in self.docs if not match_date(filter_)(d)]
+
+
+class TestPhaseHistory(object):
+
+    def day(self, n):
+        return datetime.datetime(2018, 1, n)
+
+    def test_record_delta(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.mongo.counters.find_one_and_update.return_value = {'_id': 'phases', 'since_snapshot': 3}
+
+        upgrade_planer._record_phase('producer', '1.0.0', '1.0.1')
+
+        inserted = upgrade_planer.mongo.phases.insert_one.call_args[0][0]
+        assert {k: v for k, v in inserted.items() if k != 'date'} == {
+            'updated': 'producer', 'from': '1.0.0', 'to': '1.0.1'}
+        upgrade_planer.mongo.phase_snapshots.insert_one.assert_not_called()
+        upgrade_planer.mongo.catalog.find.assert_not_called()
+        upgrade_planer.mongo.phases.count_documents.assert_not_called()
+        upgrade_planer.mongo.counters.update_one.assert_not_called()
+
+    def test_record_snapshot(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.config['phase_snapshot_interval'] = 10
+        upgrade_planer.mongo.phase_snapshots.find_one.return_value = None
+        upgrade_planer.mongo.counters.find_one_and_update.return_value = {'_id': 'phases', 'since_snapshot': 10}
+        upgrade_planer.mongo.catalog.find.return_value = [
+            {'name': 'producer', 'version': '1.0.1'}, {'name': 'consumer', 'version': '1.0.0'}]
+
+        upgrade_planer._record_phase('producer', '1.0.0', '1.0.1')
+
+        snapshot = upgrade_planer.mongo.phase_snapshots.insert_one.call_args[0][0]
+        assert snapshot['services'] == {'producer': '1.0.1', 'consumer': '1.0.0'}
+        upgrade_planer.mongo.counters.update_one.assert_called_once_with(
+            {'_id': 'phases'}, {'$set': {'since_snapshot': 0}})
+        upgrade_planer.mongo.phase_snapshots.delete_many.assert_not_called()
+        upgrade_planer.mongo.phases.delete_many.assert_not_called()
+
+    def test_expired_history(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.config.update(phase_snapshot_interval=3, phase_history_ttl=4 * 24 * 3600)
+        upgrade_planer.mongo.phases = DateCollection()
+        upgrade_planer.mongo.phase_snapshots = DateCollection()
+        counter = {'_id': 'phases', 'since_snapshot': 0}
+
+        def inc(*args, **kwargs):
+            counter['since_snapshot'] += 1
+            return dict(counter)
+
+        upgrade_planer.mongo.counters.find_one_and_update.side_effect = inc
+        upgrade_planer.mongo.counters.update_one.side_effect = lambda *args: counter.update(since_snapshot=0)
+        current = {}
+        upgrade_planer._get_catalog = lambda: {name: {'version': version} for name, version in current.items()}
+
+        expected = {}
+        for n in range(1, 21):
+            name = 'producer' if n % 2 else 'consumer'
+            from_, current[name] = current.get(name), str(n)
+            upgrade_planer._record_phase(name, from_, str(n), date=self.day(n))
+            expected[self.day(n)] = dict(current)
+
+        # the last snapshot is at day 18: the history expired at day 14 is removed up to the snapshot of day 12
+        assert [d['date'] for d in upgrade_planer.mongo.phase_snapshots.docs] == [
+            self.day(12), self.day(15), self.day(18)]
+        phases = upgrade_planer.list_phases()
+        assert [p['date'] for p in phases] == [self.day(n) for n in range(12, 21)]
+        assert [p['services'] for p in phases] == [expected[p['date']] for p in phases]
+        assert [p['services'] for p in upgrade_planer.list_phases({'date': {'$gt': self.day(16)}})] == [
+            expected[self.day(n)] for n in range(17, 21)
+        ]
+
+    def test_list_phases(self, upgrade_planer: UpgradePlaner):
+        deltas = [
+            # old format, with the full phase
+            {'updated': 'producer', 'from': None, 'to': '1', 'date': self.day(1), 'services': {'producer': '1'}},
+            {'updated': 'consumer', 'from': None, 'to': '1', 'date': self.day(2)},
+            {'updated': 'producer', 'from': '1', 'to': '2', 'date': self.day(3)},
+            {'updated': 'consumer', 'from': '1', 'to': '2', 'date': self.day(4)},
+            {'updated': 'producer', 'from': '2', 'to': '3', 'date': self.day(5)},
+        ]
+        snapshots = [{'services': {'producer': '2', 'consumer': '2'}, 'date': self.day(4)}]
+
+        def find_deltas(filter_):
+            if 'updated' in filter_:
+                return Cursor(d for d in deltas if d['updated'] == filter_['updated'])
+            return Cursor(filter(match_date(filter_), deltas))
+
+        def find_snapshot(filter_, sort):
+            found = Cursor(filter(match_date(filter_), snapshots)).sort(*sort[0])
+            return found[0] if found else None
+
+        upgrade_planer.mongo.phases.find.side_effect = find_deltas
+        upgrade_planer.mongo.phase_snapshots.find_one.side_effect = find_snapshot
+
+        assert [p['services'] for p in upgrade_planer.list_phases()] == [
+            {'producer': '1'},
+            {'producer': '1', 'consumer': '1'},
+            {'producer': '2', 'consumer': '1'},
+            {'producer': '2', 'consumer': '2'},
+            {'producer': '3', 'consumer': '2'},
+        ]
+        upgrade_planer.mongo.phases.find.reset_mock()
+        upgrade_planer.mongo.phase_snapshots.find_one.reset_mock()
+        assert [p['services'] for p in upgrade_planer.list_phases({'updated': 'producer'})] == [
+            {'producer': '1'},
+            {'producer': '2', 'consumer': '1'},
+            {'producer': '3', 'consumer': '2'},
+        ]
+        # the entries, one snapshot, then all the deltas up to the last entry
+        assert upgrade_planer.mongo.phases.find.call_count == 2
+        upgrade_planer.mongo.phase_snapshots.find_one.assert_called_once_with(
+            {'date': {'$lte': self.day(1)}}, sort=[('date', -1)])
+
+    def test_list_no_phases(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.mongo.phases.find.return_value = Cursor()
+
+        assert upgrade_planer.list_phases({'updated': 'unknown'}) == []
+        upgrade_planer.mongo.phase_snapshots.find_one.assert_not_called()
+
+
+class TestDebounce(object):
+
+    def test_new_version_request_resolution(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.run_available_upgrade = mock.Mock()
+
+        upgrade_planer.on_new_version_check_upgrade({'service': {'name': 'producer'}, 'new': {'version': '1.0.1'}})
+
+        upgrade_planer.run_available_upgrade.assert_not_called()
+        query, update = upgrade_planer.mongo.resolution.update_one.call_args[0]
+        assert update['$set']['pending'] is True
+        # a delayed retry is not brought forward, the oldest request is kept
+        assert update['$max']['last_request'] == update['$min']['first_request']
+
+    def test_nothing_to_claim(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.mongo.resolution.find_one_and_update.return_value = None
+        upgrade_planer.run_available_upgrade = mock.Mock()
+
+        upgrade_planer.run_pending_resolution()
+
+        upgrade_planer.run_available_upgrade.assert_not_called()
+
+    def test_claimed(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.config['upgrade_debounce'] = 60
+        upgrade_planer.config['upgrade_max_delay'] = 600
+        upgrade_planer.mongo.resolution.find_one_and_update.return_value = {
+            '_id': 'upgrade', 'last_request': datetime.datetime(2018, 1, 1)}
+        upgrade_planer.run_available_upgrade = mock.Mock(side_effect=Exception("boom"))
+
+        with pytest.raises(Exception):
+            upgrade_planer.run_pending_resolution()
+
+        query, update = upgrade_planer.mongo.resolution.find_one_and_update.call_args[0]
+        now = update['$set']['started']
+        # quiet for the debounce, or requested for too long
+        assert query['$and'][0] == {'$or': [
+            {'last_request': {'$lte': now - datetime.timedelta(seconds=60)}},
+            {'first_request': {'$lte': now - datetime.timedelta(seconds=600)}},
+        ]}
+        assert update['$set']['pending'] is False
+        assert update['$unset'] == {'first_request': ''}
+        upgrade_planer.run_available_upgrade.assert_called_once_with()
+        # released even on error, only if still owned, and requested again after a delay
+        upgrade_planer.mongo.resolution.update_one.assert_called_once_with(
+            {'_id': 'upgrade', 'owner': update['$set']['owner']},
+            {
+                '$set': {'running': False, 'pending': True},
+                '$max': {'last_request': now + datetime.timedelta(seconds=60)},
+                '$min': {'first_request': now},
+                '$inc': {'failures': 1},
+            })
+
+    @pytest.mark.parametrize('failures,delay', [(1, 120), (3, 480), (10, 600)])
+    def test_retry_backoff(self, failures, delay, upgrade_planer: UpgradePlaner):
+        upgrade_planer.config['upgrade_debounce'] = 60
+        upgrade_planer.config['upgrade_max_delay'] = 600
+        upgrade_planer.mongo.resolution.find_one_and_update.return_value = {
+            '_id': 'upgrade', 'last_request': datetime.datetime(2018, 1, 1), 'failures': failures}
+        upgrade_planer.run_available_upgrade = mock.Mock(side_effect=Exception("boom"))
+
+        with pytest.raises(Exception):
+            upgrade_planer.run_pending_resolution()
+
+        now = upgrade_planer.mongo.resolution.find_one_and_update.call_args[0][1]['$set']['started']
+        query, update = upgrade_planer.mongo.resolution.update_one.call_args[0]
+        assert update['$max'] == {'last_request': now + datetime.timedelta(seconds=delay)}
+
+    def test_released_by_owner(self, upgrade_planer: UpgradePlaner):
+        upgrade_planer.mongo.resolution.find_one_and_update.return_value = {
+            '_id': 'upgrade', 'last_request': datetime.datetime(2018, 1, 1)}
+        upgrade_planer.run_available_upgrade = mock.Mock()
+
+        upgrade_planer.run_pending_resolution()
+
+        query, update = upgrade_planer.mongo.resolution.find_one_and_update.call_args[0]
+        assert update['$set']['owner']
+        upgrade_planer.mongo.resolution.update_one.assert_called_once_with(
+            {'_id': 'upgrade', 'owner': update['$set']['owner']}, {'$set': {'running': False, 'failures': 0}})
+
+
+class TestSanityCheck(object):
+
+    def reply(self, result=None, error=None):
+        reply = mock.Mock()
+        reply.result.return_value = result
+        reply.result.side_effect = error
+        return reply
+
+    def test_fix_versions_from_overseer(self, upgrade_planer: UpgradePlaner, service):
+        upgrade_planer._get_catalog = mock.Mock(return_value=freeze({
+            'ok': {'name': 'ok', 'version': '1.0.0', 'versions': {'1.0.0': {}}},
+            'consumer': {'name': 'consumer', 'version': '1.0.0', 'versions': {'1.0.1': {}}},
+            'producer': {'name': 'producer', 'version': '1.0.0', 'versions': {'1.0.1': {}}},
+        }))
+        upgrade_planer._save_service = mock.Mock()
+        replies = {
+            'consumer': self.reply(error=Exception("overseer down")),
+            'producer': self.reply(dict(service['producer'], scale_config={'dependencies': {'require': ['a']}})),
+        }
+        upgrade_planer.overseer = mock.Mock()
+        upgrade_planer.overseer.get_service.call_async.side_effect = lambda name: replies[name]
+
+        upgrade_planer.sanity_check()
+
+        # all the calls are sent before waiting the replies
+        assert sorted(c[0][0] for c in upgrade_planer.overseer.get_service.call_async.call_args_list) == [
+            'consumer', 'producer']
+        saved, = [c[0][0] for c in upgrade_planer._save_service.call_args_list]
+        assert saved['name'] == 'producer'
+        assert saved['version'] == '1.0.16'
+        assert saved['versions']['1.0.16']['dependencies'] == {'require': ['a']}
+        assert '1.0.16' not in upgrade_planer._get_catalog()['producer']['versions']
+
 
 class TestSolveBestPhase(object):
 
@@ -766,6 +1300,9 @@ class TestPerfRealData(object):
 
         total = reduce(lambda a, b: a * b, (len(service['versions']) for service in catalog), 1)
         assert total == 8640
-        reduced = upgrade_planer.reduce_catalog(catalog)
-        total_reduced = reduce(lambda a, b: a * b, (len(service['versions']) for service in reduced), 1)
+        # the dependency_solver solve only one version for each distinct provide/require
+        total_reduced = reduce(lambda a, b: a * b, (
+            len({dependencies_signature(version) for version in service['versions'].values()})
+            for service in catalog
+        ), 1)
         assert total_reduced == 32
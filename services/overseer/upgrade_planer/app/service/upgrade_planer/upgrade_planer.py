@@ -1,21 +1,25 @@
 # -*- coding: utf-8 -*-
 import copy
 import datetime
+import itertools
 import logging
-from collections import namedtuple
+import uuid
+from collections import deque, namedtuple
 from copy import deepcopy
+from functools import partial
 from pprint import pprint
 
 import pymongo
-from nameko import timer
 from nameko.events import SERVICE_POOL, EventDispatcher, event_handler
 from nameko.rpc import RpcProxy, rpc
-from semantic_version import Version
+from nameko.timer import timer
 
 from common.base import BaseWorkerService
-from common.db.mongo import Mongo
+from common.constraints import PhaseChecker
+from common.db.mongo import Mongo, ensure_ttl_index
 from common.entrypoint import once
-from common.utils import ImageVersion, filter_dict, log_all
+from common.utils import coerce_version, filter_dict, gather, log_all
+from service.upgrade_planer.catalog import CatalogCacheProvider, sort_versions, thaw
 
 logger = logging.getLogger(__name__)
 
@@ -32,8 +36,8 @@ def no_downgrade(version, service):
         return version.get('available', True)
     if service['version'] == 'latest':
         return False
-    new_v = Version.coerce(version['version'])
-    current_version = Version.coerce(service['version'])
+    new_v = coerce_version(version['version'])
+    current_version = coerce_version(service['version'])
 
     # always provide current version
     # or new version is an upgrade and is availble
@@ -57,6 +61,41 @@ def static_version(phase):
     return filter_
 
 
+def phases_versions(*phases):
+    """
+    build a filter for build_catalog that will yield the versions used in any of the given phases
+    :param phases: the phases as dict service.name => version
+    :return:
+    """
+
+    def filter_(version, service):
+        return any(phase.get(service['name']) == version['version'] for phase in phases)
+
+    return filter_
+
+
+def replay_phases(services, deltas):
+    """
+    apply the given deltas of the history to a phase.
+    the deltas which contains a full phase (old history format) replace it.
+
+    >>> replay_phases({'producer': '1.0.0'}, [{'updated': 'consumer', 'from': None, 'to': '1.0.2'},
+    ...                                       {'updated': 'producer', 'from': '1.0.0', 'to': '1.0.1'}])
+    {'producer': '1.0.1', 'consumer': '1.0.2'}
+
+    :param dict[str, str] services: the phase as service.name => version. it is updated
+    :param deltas: the deltas sorted by date
+    :return: the updated phase
+    """
+    for delta in deltas:
+        if 'services' in delta:
+            services.clear()
+            services.update(delta['services'])
+        else:
+            services[delta['updated']] = delta['to']
+    return services
+
+
 # list of all filter for catalog
 NO_DOWNGRADE = "no_downgrade"
 ACCEPT_ALL = "accept_all"
@@ -73,6 +112,25 @@ CATALOG_FILTERS = {
     ACCEPT_ALL: accept_all
 }
 
+# max number of services upgraded at the same time
+DEFAULT_UPGRADE_PARALLELISM = 4
+# max number of rpc to overseer waiting for their reply in the sanity check
+SANITY_CHECK_CONCURRENCY = 10
+
+# the resolution of upgrades wait for this delay (in seconds) without new version before running
+DEFAULT_UPGRADE_DEBOUNCE = 30
+# a requested resolution is run after this delay (in seconds) even if new versions keep coming
+DEFAULT_UPGRADE_MAX_DELAY = 10 * 60
+# a running resolution older than this is considered dead and can be claimed again
+RESOLUTION_LOCK_TIMEOUT = 30 * 60
+RESOLUTION_ID = 'upgrade'
+
+# a full snapshot of the phase is stored every N entries of the history
+DEFAULT_PHASE_SNAPSHOT_INTERVAL = 50
+# the history of phases is removed after this delay (in seconds), up to the last snapshot before it
+DEFAULT_PHASE_HISTORY_TTL = 90 * 24 * 3600
+PHASE_COUNTER_ID = 'phases'
+
 PhasePin = namedtuple('PhasePin', 'service,version')
 PhasePin.__repr__ = lambda self: "PhasePin(service={},version={}".format(
     self.service.get('name', self.service), self.version)
@@ -98,6 +156,13 @@ class Phase(list):
         )
 
 
+def _step_wave(step, index):
+    """
+    return the wave of a scheduled step. the plans scheduled before the waves run one step per wave
+    """
+    return step.get('wave', index)
+
+
 def _abord_scheduled(sched):
     """
     update the scheduler to abord it
@@ -105,7 +170,7 @@ def _abord_scheduled(sched):
     :return:
     """
     sched['state'] = ABORDED
-    for step in sched:
+    for step in sched['steps']:
         if step['state'] == WAITING:
             step['state'] = ABORDED
 
@@ -173,11 +238,31 @@ class UpgradePlaner(BaseWorkerService):
     history
     #######
 
-    list all history of phases of services.
+    list all history of phases of services, stored as the change of one service.
+
+    updated: $servicename
+    from: $version_from
+    to: $version_to
+    date: $now
+
+    phase_snapshots
+    ###############
+
+    the full phase every «phase_snapshot_interval» history entries, to rebuild the phase at any
+    point of the history. when a snapshot is stored, the history older than «phase_history_ttl» is
+    removed, but the last snapshot older than this delay and the entries after it.
 
     services:
         $name: version
-    date: $now
+    date: $date_of_the_last_history_entry
+
+    counters
+    ########
+
+    the number of history entries since the last snapshot.
+
+    _id: phases
+    since_snapshot: int
 
 
     scheduling
@@ -191,9 +276,32 @@ class UpgradePlaner(BaseWorkerService):
         from: $version_from
         to: $version_to
         state: (running, aborded, done, waiting)
+        wave: int  # all steps of a wave run at the same time
+    wave: int  # the last wave started. claimed atomically so only one handler start the next wave
+
+    resolution
+    ##########
+
+    the single document which debounce the resolutions of upgrades.
 
+    _id: upgrade
+    pending: bool  # a resolution was requested since the last one started
+    last_request: $date_of_the_last_request  # pushed forward after a failure to delay the retry
+    first_request: $date_of_the_first_request_since_the_last_run  # force the run after upgrade_max_delay
+    failures: int  # consecutive failed resolutions, the retry wait upgrade_debounce * 2 ** failures
+    running: bool  # a resolution is in flight
+    started: $date_of_the_running_resolution
+    owner: $token  # the token of the run which hold the lock
+
+
+
+    """
 
+    catalog_cache = CatalogCacheProvider()
+    """
+    the catalog collection kept in memory. see :meth:`_get_catalog`
 
+    :type: service.upgrade_planer.catalog.CatalogCache
     """
 
     dispatch = EventDispatcher()
@@ -219,7 +327,8 @@ class UpgradePlaner(BaseWorkerService):
         do some check about the database to prevent problemes for resolution
         :return:
         """
-        for service in (self._unserialize_service(s) for s in self.mongo.catalog.find()):
+        broken = []
+        for service in self._get_catalog().values():
             try:
                 versions = service['versions']
                 if not service['version'] in service['versions']:
@@ -227,21 +336,21 @@ class UpgradePlaner(BaseWorkerService):
                         "the service is fixed to a version which is not listed in available versions\n%s not in %s",
                         service['version'], versions
                     )
-                    # call back overseer to get info about current version.
-                    overseer_service = self.overseer.get_service(service['name'])
-                    o_version_number = overseer_service['image']['image_info']['version']
-                    scale_config_ = overseer_service['scale_config'] or {}
-                    service['versions'][o_version_number] = {
-                        "version": o_version_number,
-                        "image_info": overseer_service['image']['image_info'],
-                        "dependencies": scale_config_.get('dependencies', {}),
-                        "available": True,
-                    }
-                    service['version'] = o_version_number
-                    self._save_service(service)
+                    broken.append(service)
+            except Exception:
+                logger.exception("error while scaning sanity of %s", service.get('name', '<noname>'))
 
-                    logger.error("resolved previous error with call back to overseer: got version %s data",
-                                 o_version_number)
+        # call back overseer to get info about current versions, all at once.
+        overseer_services, errors = gather(
+            ((self.overseer.get_service, (service['name'],)) for service in broken),
+            concurrency=SANITY_CHECK_CONCURRENCY,
+        )
+        for service, overseer_service, error in zip(broken, overseer_services, errors):
+            if error is not None:
+                logger.error("error while fetching %s from overseer: %r", service['name'], error)
+                continue
+            try:
+                self._fix_service_version(service, overseer_service)
             except Exception:
                 logger.exception("error while scaning sanity of %s", service.get('name', '<noname>'))
 
@@ -254,6 +363,9 @@ class UpgradePlaner(BaseWorkerService):
             unique=True,
             background=True
         )
+        # no ttl: the history is removed by _compact_phase_history along with the snapshots
+        ensure_ttl_index(self.mongo.phases, 'date', None, background=True)
+        self.mongo.phase_snapshots.create_index('date', background=True)
 
     # ####################################################
     # Event handling
@@ -301,17 +413,7 @@ class UpgradePlaner(BaseWorkerService):
             upsert = True
         if upsert:
             self._save_service(service)
-
-            self.mongo.phases.insert_one({
-                "updated": service['name'],
-                "from": from_version,
-                "to": version_,
-                "services": {
-                    s['name']: s['version']
-                    for s in self.mongo.catalog.find()
-                },
-                "date": datetime.datetime.now()
-            })
+            self._record_phase(service['name'], from_version, version_)
 
         # we just handle finished changes: complited event or update of 0 replicas service
         completed_ = payload['diff'].get('state', {}).get('to') == 'completed'
@@ -404,7 +506,62 @@ class UpgradePlaner(BaseWorkerService):
         :return:
         """
         logger.debug("new version for %s: %s", payload['service']['name'], payload['new']['version'])
-        self.run_available_upgrade()
+        self._request_resolution()
+
+    @timer(interval=5)
+    @log_all
+    def run_pending_resolution(self):
+        """
+        run the resolution of upgrades if one was requested and no new version was released during the
+        quiet window, or if the first request is older than ``upgrade_max_delay``. only one resolution run
+        at a time, the requests received meanwhile are folded into one run after it.
+        a failed resolution is retried after a delay which double with each consecutive failure.
+        """
+        now = datetime.datetime.now()
+        owner = uuid.uuid4().hex
+        debounce = self.config.get('upgrade_debounce', DEFAULT_UPGRADE_DEBOUNCE)
+        max_delay = self.config.get('upgrade_max_delay', DEFAULT_UPGRADE_MAX_DELAY)
+        claimed = self.mongo.resolution.find_one_and_update(
+            {
+                '_id': RESOLUTION_ID,
+                'pending': True,
+                '$and': [
+                    {'$or': [
+                        {'last_request': {'$lte': now - datetime.timedelta(seconds=debounce)}},
+                        {'first_request': {'$lte': now - datetime.timedelta(seconds=max_delay)}},
+                    ]},
+                    {'$or': [
+                        {'running': False},
+                        {'started': {'$lt': now - datetime.timedelta(seconds=RESOLUTION_LOCK_TIMEOUT)}},
+                    ]},
+                ]
+            },
+            {
+                '$set': {'pending': False, 'running': True, 'started': now, 'owner': owner},
+                '$unset': {'first_request': ''},
+            }
+        )
+        if claimed is None:
+            return
+        logger.debug("running the resolution requested at %s", claimed['last_request'])
+        # the lock is released only if it was not claimed by another run after RESOLUTION_LOCK_TIMEOUT
+        try:
+            self.run_available_upgrade()
+        except Exception:
+            # the request is kept, and retried later: the quiet window is pushed back
+            retry_delay = min(debounce * 2 ** claimed.get('failures', 0), max_delay)
+            self.mongo.resolution.update_one(
+                {'_id': RESOLUTION_ID, 'owner': owner},
+                {
+                    '$set': {'running': False, 'pending': True},
+                    '$max': {'last_request': now + datetime.timedelta(seconds=retry_delay)},
+                    '$min': {'first_request': now},
+                    '$inc': {'failures': 1},
+                }
+            )
+            raise
+        self.mongo.resolution.update_one({'_id': RESOLUTION_ID, 'owner': owner},
+                                         {'$set': {'running': False, 'failures': 0}})
 
     # ############################################
     #  RPC
@@ -426,9 +583,38 @@ class UpgradePlaner(BaseWorkerService):
     @rpc
     @log_all
     def list_phases(self, filter_=None):
-        filter_ = filter_ or {}
+        """
+        list the history of phases matching the given filter, along with the full phase («services»)
+        after each change.
+        the phase is rebuilt from the last snapshot before the first entry, by replaying all the history up
+        to the last entry in one pass.
+        :param filter_: the mongodb filter on the history entries (updated, from, to, date)
+        """
+        entries = deque(self.mongo.phases.find(filter_ or {}).sort('date', pymongo.ASCENDING))
+        if not entries:
+            return []
+        services = {}
+        deltas_filter = {'$lte': entries[-1]['date']}
+        snapshot = self.mongo.phase_snapshots.find_one({'date': {'$lte': entries[0]['date']}},
+                                                       sort=[('date', pymongo.DESCENDING)])
+        if snapshot:
+            services = dict(snapshot['services'])
+            deltas_filter['$gt'] = snapshot['date']
 
-        return [filter_dict(s) for s in self.mongo.phases.find(filter_)]
+        res = []
+
+        def emit_until(date):
+            # the entries are emitted once all the changes at their date are replayed
+            while entries and (date is None or entries[0]['date'] < date):
+                entry = filter_dict(entries.popleft())
+                entry['services'] = dict(services)
+                res.append(entry)
+
+        for delta in self.mongo.phases.find({'date': deltas_filter}).sort('date', pymongo.ASCENDING):
+            emit_until(delta['date'])
+            replay_phases(services, [delta])
+        emit_until(None)
+        return res
 
     @rpc
     @log_all
@@ -461,11 +647,10 @@ class UpgradePlaner(BaseWorkerService):
         :return: all service with their latest versions
         :rtype: dict[str, str]
         """
-        res = {}
-        for service in (self._unserialize_service(serv) for serv in self.mongo.catalog.find()):
-            sorted_versions = self.sort_versions(service['versions'].values())
-            res[service['name']] = str(sorted_versions[0])
-        return res
+        return {
+            name: str(index.sorted[0])
+            for name, index in self._get_version_indexes().items()
+        }
 
     @rpc
     @log_all
@@ -486,18 +671,20 @@ class UpgradePlaner(BaseWorkerService):
         if result_ and result_['steps']:
             sched = {
                 "state": RUNNING,
+                "wave": 0,
                 "steps": [
                     {
                         "service": step.service,
                         "from": step.from_,
                         "to": step.to,
-                        "state": WAITING
-
+                        "state": WAITING,
+                        "wave": wave_number,
                     }
-                    for step in result_['steps']
+                    for wave_number, wave in enumerate(result_['waves'])
+                    for step in wave
                 ]
             }
-            self._run_step(sched['steps'][0], sched)
+            self._run_wave(sched, 0)
             # disable all scheduled
             self.mongo.scheduling.update_many({"state": RUNNING}, {"$set": {"state": ABORDED}})
             self.mongo.scheduling.insert_one(sched)
@@ -514,46 +701,43 @@ class UpgradePlaner(BaseWorkerService):
         :param str to_version:
         :return:
         """
-        running_scheduled = self.mongo.scheduling.find_one({"state": RUNNING})
+        # the step is marked as done in place: the steps of a wave can complete at the same time
+        running_scheduled = self.mongo.scheduling.find_one_and_update(
+            {"state": RUNNING, "steps": {"$elemMatch": {"service": service['name'], "state": RUNNING}}},
+            {"$set": {"steps.$.state": DONE}},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
         if running_scheduled is None:
-            # nothing to do since it was not a part of a running upgrade plan
-            logger.info("upgrade of service outside of a upgrade plan for %s %s=>%s",
-                        service['name'], from_version, to_version)
-            return
-
-        updated_step = None
-        next_step = None
-        for step in running_scheduled['steps']:
-
-            if step['service'] == service['name']:
-                # this was our service.
-                updated_step = step
-            elif step['state'] == DONE:
-                continue
-            elif step['state'] == WAITING:
-                next_step = step
-                break
-
-        logger.debug("scheduling: updated_step=%s, next_step=%s", updated_step, next_step)
-        if updated_step is None:
+            running_scheduled = self.mongo.scheduling.find_one({"state": RUNNING})
+            if running_scheduled is None:
+                # nothing to do since it was not a part of a running upgrade plan
+                logger.info("upgrade of service outside of a upgrade plan for %s %s=>%s",
+                            service['name'], from_version, to_version)
+                return
             # we did not find the current service in the scheduled plan...
             # this mean our upgrade plan is over and aborded since it's out of sync with upgrade process
             logger.info("abording old scheduling %s", running_scheduled)
             _abord_scheduled(running_scheduled)
+            self._save_aborded(running_scheduled)
+            return
 
-        elif next_step is None:
+        logger.debug("scheduling: %s is done", service['name'])
+        running = [step for step in running_scheduled['steps'] if step['state'] == RUNNING]
+        waiting = [_step_wave(step, i) for i, step in enumerate(running_scheduled['steps'])
+                   if step['state'] == WAITING]
+        if running:
+            # the other services of this wave are still upgrading
+            logger.info("scheduling wait for %s", [step['service'] for step in running])
+        elif not waiting:
             # the last service was the current one.
             # this upgrade is done
-            updated_step['state'] = DONE
             running_scheduled['state'] = DONE
+            self.mongo.scheduling.update_one({'_id': running_scheduled['_id'], 'state': RUNNING},
+                                             {'$set': {'state': DONE}})
             logger.info("scheduling is finished %s", running_scheduled)
         else:
             # we are still in a upgrade plan
-            updated_step['state'] = DONE
-            logger.info("scheduling continue with step %s", next_step)
-            self._run_step(next_step, running_scheduled)
-
-        self.mongo.scheduling.replace_one({'_id': running_scheduled['_id']}, running_scheduled)
+            self._start_wave(running_scheduled, min(waiting))
 
     @rpc
     @log_all
@@ -567,6 +751,8 @@ class UpgradePlaner(BaseWorkerService):
                 best_phase: Phase
                 steps:
                  - ($servicename, $from, $to)
+                waves:  # the same steps, grouped to be run at the same time
+                 - - ($servicename, $from, $to)
             errors:
              step:
              error: $remoteerror
@@ -575,7 +761,12 @@ class UpgradePlaner(BaseWorkerService):
         catalog = self.build_catalog()
         if self.config.get('solve_dependencies', True):
             # feature realy cpu heavy and algo is O(n**n) :(
-            solved_phases = self.dependency_solver.solve_dependencies(catalog)
+            # the solver return the best phases found in this budget if it can't explore all of them
+            solved_phases = self.dependency_solver.solve_dependencies(
+                catalog, timeout=self.config.get('solver_timeout'), page_size=self.config.get('solver_page_size', 500))
+            if not solved_phases.get('exhaustive', True):
+                logger.warning("dependency solving was not exhaustive, best phase choosen from %d partial results: %s",
+                               len(solved_phases['results']), solved_phases.get('stats'))
         else:
             # workaround for hanging resolution
             solved_phases = {
@@ -601,11 +792,12 @@ class UpgradePlaner(BaseWorkerService):
             for service in catalog
         }
 
-        phases = [
+        # the phases are fetched page by page while they are ranked
+        phases = (
             Phase.deserialize([(services_by_names[k], v) for k, v in phase.items()])
-            for phase in solved_phases['results']
-        ]
-        logger.debug("resolved phases : %s", phases)
+            for phase in self._iter_solved_phases(solved_phases)
+        )
+        logger.debug("resolved %s phases", solved_phases.get('total', len(solved_phases['results'])))
         goal, rank = self.solve_best_phase(phases)  # type: Phase[PhasePin], int
         """
         goal is the best noted phase given by all compatible phases.
@@ -624,10 +816,12 @@ class UpgradePlaner(BaseWorkerService):
                 }
             }
         steps = self.build_steps(goal)
+        waves = self.build_waves(steps)
         return {
             "result": {
                 "best_phase": goal,
-                "steps": steps
+                "steps": steps,
+                "waves": waves,
             },
             "debug": {
                 "catalog": catalog,
@@ -647,9 +841,126 @@ class UpgradePlaner(BaseWorkerService):
         :param versions: the list of version (as in service['versions']
         :return: a list of version numbers ordered
         """
-        sorted_version_metadata = list(sorted(
-            versions, reverse=True, key=lambda vinfo: ImageVersion.deserialize(vinfo['image_info'])))
-        return [v['version'] for v in sorted_version_metadata]
+        return sort_versions(versions)
+
+    def _record_phase(self, service_name, from_version, to_version, date=None):
+        """
+        store the change of version of a service in the history of phases. a snapshot of the current
+        phase is stored if enough changes was recorded since the last one.
+        """
+        date = date or datetime.datetime.now()
+        self.mongo.phases.insert_one({
+            "updated": service_name,
+            "from": from_version,
+            "to": to_version,
+            "date": date
+        })
+        counter = self.mongo.counters.find_one_and_update(
+            {'_id': PHASE_COUNTER_ID},
+            {'$inc': {'since_snapshot': 1}},
+            upsert=True,
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+        if counter['since_snapshot'] >= self.config.get('phase_snapshot_interval', DEFAULT_PHASE_SNAPSHOT_INTERVAL):
+            self.mongo.phase_snapshots.insert_one({
+                "services": {
+                    name: s['version']
+                    for name, s in self._get_catalog().items()
+                },
+                "date": date
+            })
+            self.mongo.counters.update_one({'_id': PHASE_COUNTER_ID}, {'$set': {'since_snapshot': 0}})
+            self._compact_phase_history(date)
+
+    def _compact_phase_history(self, now):
+        """
+        remove the history which is older than the ttl. the last snapshot before the ttl is kept
+        along with all the entries after it, so the oldest phases listed are still rebuilt from it.
+        :param now: the date of the last history entry
+        """
+        ttl = self.config.get('phase_history_ttl', DEFAULT_PHASE_HISTORY_TTL)
+        expired = now - datetime.timedelta(seconds=ttl)
+        oldest_needed = self.mongo.phase_snapshots.find_one(
+            {'date': {'$lte': expired}}, sort=[('date', pymongo.DESCENDING)]
+        )
+        if oldest_needed:
+            self.mongo.phase_snapshots.delete_many({'date': {'$lt': oldest_needed['date']}})
+            self.mongo.phases.delete_many({'date': {'$lt': oldest_needed['date']}})
+
+    def _request_resolution(self):
+        """
+        ask for a resolution of upgrades. it will be run by :meth:`run_pending_resolution`
+        """
+        now = datetime.datetime.now()
+        self.mongo.resolution.update_one(
+            {'_id': RESOLUTION_ID},
+            {
+                '$set': {'pending': True},
+                # a retry delayed after a failure is not brought forward
+                '$max': {'last_request': now},
+                '$min': {'first_request': now},
+                '$setOnInsert': {'running': False},
+            },
+            upsert=True
+        )
+
+    def _iter_solved_phases(self, solved_phases):
+        """
+        iterate over all the phases returned by dependency_solver.solve_dependencies.
+        if the results are paged, the next pages are fetched when the previous is consumed,
+        and dropped from the solver at the end.
+        """
+        yield from solved_phases['results']
+        handle = solved_phases.get('handle')
+        if handle is not None:
+            for page in range(1, solved_phases['pages']):
+                yield from self.dependency_solver.fetch_results(handle, page)
+            self.dependency_solver.drop_results.call_async(handle)
+
+    def _start_wave(self, running_scheduled, wave_number):
+        """
+        claim the given wave of a stored plan and run it. the claim mark the steps of the wave as running
+        before asking overseer, so only one handler start the wave and the completion of its steps find them.
+        """
+        started = {
+            'steps.%d.state' % i: RUNNING
+            for i, step in enumerate(running_scheduled['steps'])
+            if _step_wave(step, i) == wave_number and step['state'] == WAITING
+        }
+        claimed = self.mongo.scheduling.update_one(
+            {'_id': running_scheduled['_id'], 'state': RUNNING, 'wave': {'$not': {'$gte': wave_number}}},
+            {'$set': dict(started, wave=wave_number)}
+        )
+        if claimed.modified_count == 0:
+            logger.info("scheduling wave %s already started", wave_number)
+            return
+        logger.info("scheduling continue with wave %s", wave_number)
+        running_scheduled['wave'] = wave_number
+        self._run_wave(running_scheduled, wave_number)
+        if running_scheduled['state'] == ABORDED:
+            self._save_aborded(running_scheduled)
+
+    def _save_aborded(self, running_scheduled):
+        """
+        store the abord of a plan. only the aborded steps are updated, the others may be updated concurrently.
+        """
+        aborded = {
+            'steps.%d.state' % i: ABORDED
+            for i, step in enumerate(running_scheduled['steps'])
+            if step['state'] == ABORDED
+        }
+        self.mongo.scheduling.update_one({'_id': running_scheduled['_id']},
+                                         {'$set': dict(aborded, state=ABORDED)})
+
+    def _run_wave(self, running_scheduled, wave_number):
+        """
+        run all the steps of the given wave
+        """
+        for i, step in enumerate(running_scheduled['steps']):
+            if _step_wave(step, i) == wave_number and step['state'] == WAITING:
+                self._run_step(step, running_scheduled)
+                if running_scheduled['state'] == ABORDED:
+                    return
 
     def _run_step(self, next_step, running_scheduled):
         # doing the upgrade from to
@@ -691,7 +1002,7 @@ class UpgradePlaner(BaseWorkerService):
         else:
             filter_func = CATALOG_FILTERS[filter_name]
         res = []
-        for service in (self._unserialize_service(s) for s in self.mongo.catalog.find()):
+        for service in self._get_catalog().values():
             versions = {}
             res.append({
                 "name": service['name'],
@@ -700,26 +1011,14 @@ class UpgradePlaner(BaseWorkerService):
             for version in service['versions'].values():
                 if filter_func(version, service):
                     versions[version['version']] = {
-                        "provide": version['dependencies'].get('provide', {}),
-                        "require": version['dependencies'].get('require', []),
+                        "provide": thaw(version['dependencies'].get('provide', {})),
+                        "require": thaw(version['dependencies'].get('require', [])),
                     }
             if len(versions) == 0:
                 logger.warning("all %d versions was filtered out by filter %s for service %s",
                                len(service['versions']), filter_name, service['name'])
         return res
 
-    def reduce_catalog(self, catalog):
-        for service in catalog:
-            versions = []
-            known_req = []
-            for version_number, version_metadata in sorted(service['versions'].items(), key=lambda v: v[0]):
-                if version_metadata not in known_req:
-                    versions.append((version_number, version_metadata))
-                    known_req.append(version_metadata)
-
-            service['versions'] = dict(versions)
-        return catalog
-
     def solve_best_phase(self, phases):
         """
         solve the best phase
@@ -729,28 +1028,19 @@ class UpgradePlaner(BaseWorkerService):
 
         the score is a integer between 0 and +inf. the lower the better since 0 mean all newest versions available.
         """
-        services = {
-            s['name']: [
-                iv
-                for iv in self.sort_versions(s['versions'].values())
-            ]
-            for s in (self._unserialize_service(serv) for serv in self.mongo.catalog.find())
-        }
+        ranks = {name: index.ranks for name, index in self._get_version_indexes().items()}
         best_phase = None
         best_score = None
 
         for phase in phases:
             score = 0
             for service, version in phase:
-                sorted_version = services[service['name']]
-
+                service_ranks = ranks[service['name']]
                 try:
-                    score += sorted_version.index(
-                        version
-                    )
-                except ValueError as ve:
-                    logger.exception("%s not in service versions %s %s", version, service['name'], sorted_version)
-                    raise
+                    score += service_ranks[version]
+                except KeyError:
+                    logger.exception("%s not in service versions %s %s", version, service['name'], list(service_ranks))
+                    raise ValueError("%s is not a version of %s" % (version, service['name']))
             if best_score is None or best_score > score:
                 best_score, best_phase = score, phase
 
@@ -765,8 +1055,8 @@ class UpgradePlaner(BaseWorkerService):
         :return:
         """
         current_phase = {
-            s['name']: s['version']
-            for s in self.mongo.catalog.find()
+            name: s['version']
+            for name, s in self._get_catalog().items()
         }
         goal_phase = {p.service['name']: p.version for p in goal}
         if current_phase == goal_phase:
@@ -779,25 +1069,83 @@ class UpgradePlaner(BaseWorkerService):
             if current_phase[service] != version:
                 changed_service.append((service, current_phase[service], version))  # service => (from, to)
 
+        checker = self._build_phase_checker(current_phase, goal_phase)
+        dead_ends = set()  # the phases from which the goal can't be reached
+
         def backtrack(steps, fixed_version, rest):
             if not rest:
                 return steps
+            if frozenset(fixed_version.items()) in dead_ends:
+                return None
 
             for service, from_, to_ in rest:
                 tested_step = copy.copy(fixed_version)
                 tested_step[service] = to_
                 logger.debug("try if it's possible : %s" % (tested_step))
-                explain_phase = self.explain_phase(tested_step)
-                if explain_phase['results'] == 0:  # mean 0 error for this phase
+                if checker.is_valid(tested_step):
                     solution = backtrack(steps + [Step(service, from_, to_)], tested_step,
                                          [r for r in rest if r[0] != service])
                     if solution is not None:
                         return solution
                 else:
-                    logger.debug("cant go to %s\n%s", tested_step, explain_phase)
+                    logger.debug("cant go to %s", tested_step)
+            dead_ends.add(frozenset(fixed_version.items()))
 
         return backtrack([], current_phase, changed_service)
 
+    def build_waves(self, steps):
+        """
+        group the consecutive steps into waves which can be run at the same time.
+        the steps of a wave can finish in any order, so all phases between the start of the wave and
+        its end must be valid. a wave contains at most ``upgrade_parallelism`` steps.
+
+        :param list[Step] steps: the valid sequence of steps given by build_steps
+        :return: the list of waves
+        :rtype: list[list[Step]]
+        """
+        if not steps:
+            return []
+        max_parallelism = self.config.get('upgrade_parallelism', DEFAULT_UPGRADE_PARALLELISM)
+        current_phase = {
+            name: s['version']
+            for name, s in self._get_catalog().items()
+        }
+        goal_phase = dict(current_phase, **{step.service: step.to for step in steps})
+        checker = self._build_phase_checker(current_phase, goal_phase)
+
+        waves = []
+        wave = []
+        for step in steps:
+            if wave and (len(wave) >= max_parallelism or not self._can_join_wave(checker, current_phase, wave, step)):
+                # the wave is over, the next start from the end of this one
+                current_phase = dict(current_phase, **{s.service: s.to for s in wave})
+                waves.append(wave)
+                wave = []
+            wave.append(step)
+        waves.append(wave)
+        return waves
+
+    def _can_join_wave(self, checker, start_phase, wave, step):
+        """
+        check if all phases obtained by applying step along with any subset of the wave are valid.
+        the subsets without step was checked when the previous steps joined the wave.
+        """
+        for size in range(len(wave) + 1):
+            for subset in itertools.combinations(wave, size):
+                phase = dict(start_phase, **{s.service: s.to for s in subset})
+                phase[step.service] = step.to
+                if not checker.is_valid(phase):
+                    return False
+        return True
+
+    def _build_phase_checker(self, current_phase, goal_phase):
+        """
+        compile the catalog with the current and the goal versions of each services, to check all
+        intermediate phases in-process.
+        :rtype: PhaseChecker
+        """
+        return PhaseChecker(self.build_catalog(phases_versions(current_phase, goal_phase)))
+
     def _serialize_service(self, service):
         """
         change data in service to make it compatible for mongodb
@@ -809,15 +1157,16 @@ class UpgradePlaner(BaseWorkerService):
         del s['versions']
         return s
 
-    def _unserialize_service(self, service_raw):
+    def _unserialize_service(self, service_raw, copy=True):
         """
         load the data from mongodb and return a python structured service
         :param service_raw:
+        :param bool copy: if False, the raw service is reused to build the service
         :return:
         """
         if service_raw is None:
             return None
-        s = deepcopy(service_raw)
+        s = deepcopy(service_raw) if copy else dict(service_raw)
         try:
             s['versions'] = {v['version']: v for v in s['versions_list']}
             del s['versions_list']
@@ -825,6 +1174,22 @@ class UpgradePlaner(BaseWorkerService):
             pass
         return s
 
+    def _get_catalog(self):
+        """
+        return all services of the catalog by name without reading mongodb if it did not changed.
+        the services are shared between all workers and are read-only: use
+        :meth:`_get_service` or :func:`service.upgrade_planer.catalog.thaw` to update a service.
+        :rtype: MappingProxyType[str, MappingProxyType]
+        """
+        return self.catalog_cache.get(self.mongo, partial(self._unserialize_service, copy=False))
+
+    def _get_version_indexes(self):
+        """
+        return the precomputed ordering of the versions of each services of the catalog.
+        :rtype: MappingProxyType[str, service.upgrade_planer.catalog.VersionIndex]
+        """
+        return self.catalog_cache.get_indexes(self.mongo, partial(self._unserialize_service, copy=False))
+
     def _get_service(self, service_name):
         """
         load from the database the given service
@@ -833,14 +1198,35 @@ class UpgradePlaner(BaseWorkerService):
         """
         return self._unserialize_service(self.mongo.catalog.find_one({'name': service_name}))
 
+    def _fix_service_version(self, service, overseer_service):
+        """
+        set the version of the service to the one deployed, as given by overseer
+        """
+        service = thaw(service)
+        o_version_number = overseer_service['image']['image_info']['version']
+        scale_config_ = overseer_service['scale_config'] or {}
+        service['versions'][o_version_number] = {
+            "version": o_version_number,
+            "image_info": overseer_service['image']['image_info'],
+            "dependencies": scale_config_.get('dependencies', {}),
+            "available": True,
+        }
+        service['version'] = o_version_number
+        self._save_service(service)
+
+        logger.error("resolved previous error with call back to overseer: got version %s data",
+                     o_version_number)
+
     def _save_service(self, service):
         """
         save in the database the given service. replace existing entry if name match.
         :param service: the Service
         :return:
         """
+        serialized = self._serialize_service(service)
         self.mongo.catalog.replace_one(
             {'name': service['name']},
-            self._serialize_service(service),
+            serialized,
             upsert=True
         )
+        self.catalog_cache.update(self.mongo, self._unserialize_service(serialized))
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""
+run a dry-run of the upgrade planer and print the timing of each stages.
+
+the catalog is read from stdin (a list of services as stored in mongodb, or a dict with a «catalog» key
+like the tests samples), from a mongodb or generated::
+
+    python simulate.py < service/upgrade_planer/tests/samples/sample1.json
+    python simulate.py --mongo mongodb://maiev_mongodb
+    python simulate.py --generate 10 5 0.3 --seed 1
+
+the dependency_solver app must be in the PYTHONPATH.
+"""
+import argparse
+import json
+import logging
+import sys
+
+from pymongo import MongoClient
+
+from service.upgrade_planer.simulation import LocalDependencySolver, Simulation, generate_catalog
+
+logger = logging.getLogger(__name__)
+
+
+def get_catalog(args):
+    if args.generate:
+        services, versions, density = args.generate
+        return generate_catalog(int(services), int(versions), float(density), seed=args.seed)
+    elif args.mongo:
+        return list(MongoClient(args.mongo)[args.db].catalog.find({}, {'_id': False}))
+    input_ = json.load(sys.stdin)
+    if isinstance(input_, dict):
+        input_ = input_['catalog']
+    elif not isinstance(input_, list):
+        raise Exception("input_ should be a list of services")
+    return input_
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--generate', nargs=3, metavar=('SERVICES', 'VERSIONS', 'DENSITY'),
+                        help="generate a synthetic catalog")
+    parser.add_argument('--seed', type=int, default=None, help="the seed of the generated catalog")
+    parser.add_argument('--mongo', help="the uri of the mongodb to read the catalog from")
+    parser.add_argument('--db', default='upgrade_planer', help="the database of the upgrade_planer")
+    parser.add_argument('--timeout', type=float, default=60, help="the solver timeout")
+    parser.add_argument('--backend', default='backtrack', help="the solver backend")
+    args = parser.parse_args()
+
+    simulation = Simulation(
+        get_catalog(args),
+        config={'solver_timeout': args.timeout},
+        dependency_solver=LocalDependencySolver(args.backend),
+    )
+    report = simulation.run()
+    print(json.dumps(report))
+    return 0 if not report['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
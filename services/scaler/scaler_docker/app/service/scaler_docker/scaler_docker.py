@@ -13,9 +13,10 @@ from nameko.events import EventDispatcher
 from nameko.rpc import rpc
 from nameko.web.handlers import http
 
-from common.base import BaseWorkerService
+from common.base import BaseWorkerService, PrometheusMetrics
 from common.dependency import PoolProvider
 from common.entrypoint import once
+from common.trace import add_hop, hop_latencies
 from common.utils import log_all
 from service.dependency.docker import DockerClientProvider
 from service.scaler_docker.registry import Registry
@@ -137,7 +138,7 @@ def escape_env_var(obj):
         return obj
 
 
-class ScalerDocker(BaseWorkerService):
+class ScalerDocker(BaseWorkerService, PrometheusMetrics):
     """
     the docker swarm adapter
 
@@ -229,10 +230,11 @@ class ScalerDocker(BaseWorkerService):
 
     @rpc
     @log_all
-    def update(self, service_name, image_id=None, scale=None):
+    def update(self, service_name, image_id=None, scale=None, trace=None):
         """
         update the given service with the given image
         :param image_id:
+        :param trace: the trace of the decision (see common.trace). our hop is logged with the latencies
         :return:
         """
         logger.info("upgrading %s to %s scale=%s", service_name, image_id, scale)
@@ -246,6 +248,35 @@ class ScalerDocker(BaseWorkerService):
             else:
                 attrs['mode'] = ServiceMode('replicated', scale)
         service.update(fetch_current_spec=True, **attrs)
+        if trace:
+            trace = add_hop(trace, self.name)
+            logger.info("updated %s for trace %s: %s", service_name, trace['id'], hop_latencies(trace),
+                        extra={'trace': trace})
+
+    @rpc
+    @log_all
+    def scale_many(self, scales):
+        """
+        scale many services at once. the services are fetched with one call to docker.
+        :param dict[str, int] scales: the number of replicas by service name (-1 for global)
+        :return: the errors by service name. the services not in it are scaled
+        :rtype: dict[str, str]
+        """
+        logger.info("scaling %s", scales)
+        services = {s.name: s for s in self.docker.services.list() if s.name in scales}
+        errors = {}
+        for service_name, scale in scales.items():
+            service = services.get(service_name)
+            if service is None:
+                errors[service_name] = "service not found"
+                continue
+            mode = ServiceMode('global', 1) if scale == -1 else ServiceMode('replicated', scale)
+            try:
+                service.update(fetch_current_spec=True, mode=mode)
+            except docker.errors.APIError as e:
+                logger.exception("error while scaling %s to %s", service_name, scale)
+                errors[service_name] = str(e)
+        return errors
 
     @rpc
     @log_all(ValueError)
@@ -3,8 +3,10 @@ import logging
 import unittest
 from unittest import mock
 
+import docker.errors
 import eventlet.greenpool
 from docker.client import DockerClient
+from docker.types.services import ServiceMode
 from nameko.testing.services import worker_factory
 
 from service.scaler_docker.scaler_docker import ScalerDocker
@@ -125,3 +127,21 @@ class ScalerDockerTestCase(unittest.TestCase):
         with self.assertLogs(None, 'ERROR'):
             res = service.fetch_image_config('nginx')
         self.assertIsNone(res)
+
+    def test_scale_many(self):
+        fake_provider = mock.MagicMock(DockerClient)
+        services = {name: mock.Mock() for name in ('producer', 'consumer', 'other')}
+        for name, s in services.items():
+            s.name = name
+        services['consumer'].update.side_effect = docker.errors.APIError('boom')
+        fake_provider.services.list.return_value = list(services.values())
+
+        service = worker_factory(ScalerDocker, docker=fake_provider)  # type: ScalerDocker
+        with self.assertLogs(None, 'ERROR'):
+            errors = service.scale_many({'producer': 3, 'consumer': 2, 'unknown': 1})
+
+        self.assertEqual(set(errors), {'consumer', 'unknown'})
+        fake_provider.services.list.assert_called_once_with()
+        services['producer'].update.assert_called_once_with(
+            fetch_current_spec=True, mode=ServiceMode('replicated', 3))
+        services['other'].update.assert_not_called()